@@ -0,0 +1,176 @@
+import base64
+import binascii
+
+from flask import Blueprint, jsonify, request, abort
+from sqlalchemy import select, tuple_
+
+from cache import cache_policy
+from models import db, Venue, Artist, Show, venue_genre, artist_genre
+from queries import genres_column, encode_show_cursor, decode_show_cursor
+from ratelimit import rate_limit
+
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Shared caches keep responses a little while; clients revalidate each
+# time, with the ETag.
+cache_policy(api, max_age=0, s_maxage=30, stale_while_revalidate=60)
+rate_limit(api, 600, per=60)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+# ----------------------------------------------------------------------------#
+# Resources.
+# ----------------------------------------------------------------------------#
+
+
+def _columns(model):
+    return {column.key: getattr(model, column.key)
+            for column in model.__table__.columns}
+
+
+def _fields(kind):
+    """Return the selectable fields of a resource as {name: column}."""
+    if kind == 'venues':
+        fields = _columns(Venue)
+        fields['genres'] = genres_column(Venue, venue_genre)
+    elif kind == 'artists':
+        fields = _columns(Artist)
+        fields['genres'] = genres_column(Artist, artist_genre)
+    else:
+        fields = _columns(Show)
+        fields['artist_name'] = Artist.name.label('artist_name')
+        fields['venue_name'] = Venue.name.label('venue_name')
+    return fields
+
+
+MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+
+
+def _select(kind):
+    """Build a select of the fields requested with ?fields=.
+
+    Only the requested columns are selected; ``id`` is always included.
+    """
+    fields = _fields(kind)
+    requested = request.args.get('fields')
+    if requested:
+        names = ['id'] + [name.strip() for name in requested.split(',')
+                          if name.strip() and name.strip() != 'id']
+        unknown = [name for name in names if name not in fields]
+        if unknown:
+            abort(400, f"Unknown fields: {', '.join(unknown)}")
+    else:
+        names = list(fields)
+
+    statement = select(*(fields[name] for name in dict.fromkeys(names)))
+    if kind != 'shows':
+        statement = statement.where(MODELS[kind].deleted_at.is_(None))
+    else:
+        # the shows of deleted venues and artists, until purged
+        statement = (statement.select_from(Show)
+                     .join(Artist, Artist.id == Show.artist_id)
+                     .join(Venue, Venue.id == Show.venue_id)
+                     .where(Artist.deleted_at.is_(None),
+                            Venue.deleted_at.is_(None)))
+    return statement
+
+
+def _serialize(row):
+    data = {}
+    for key, value in row.items():
+        if key == 'genres':
+            value = value.split(',') if value else []
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        data[key] = value
+    return data
+
+
+def _conditional(payload):
+    """Return payload as JSON with a strong ETag, or 304 if the client
+    already holds that representation (If-None-Match)."""
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def _encode_id_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def _decode_id_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ValueError(f'invalid cursor {cursor!r}')
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints.
+# ----------------------------------------------------------------------------#
+
+
+@api.route('/<any(venues, artists, shows):kind>')
+def list_resources(kind):
+    """List a resource in keyset pages: venues and artists by id, shows
+    by (start_time, id).  The next page is requested with ?cursor=."""
+    model = MODELS[kind]
+    limit = min(max(1, request.args.get('limit', DEFAULT_LIMIT, type=int)),
+                MAX_LIMIT)
+    statement = _select(kind)
+    cursor = request.args.get('cursor')
+    try:
+        if kind == 'shows':
+            statement = statement.order_by(Show.start_time, Show.id)
+            if cursor:
+                statement = statement.where(
+                    tuple_(Show.start_time, Show.id)
+                    > tuple_(*decode_show_cursor(cursor)))
+        else:
+            statement = statement.order_by(model.id)
+            if cursor:
+                statement = statement.where(
+                    model.id > _decode_id_cursor(cursor))
+    except ValueError:
+        abort(400, 'Invalid cursor')
+    if kind == 'shows':
+        # the cursor needs start_time even when it was not requested
+        statement = statement.add_columns(
+            Show.start_time.label('_cursor_start_time'))
+
+    rows = db.session.execute(statement.limit(limit + 1)).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = (encode_show_cursor(last['_cursor_start_time'],
+                                          last['id'])
+                       if kind == 'shows' else _encode_id_cursor(last['id']))
+    data = [_serialize({key: value for key, value in row.items()
+                        if key != '_cursor_start_time'})
+            for row in rows[:limit]]
+    return _conditional({'data': data, 'next_cursor': next_cursor})
+
+
+@api.route('/<any(venues, artists, shows):kind>/<int:resource_id>')
+def get_resource(kind, resource_id):
+    model = MODELS[kind]
+    row = db.session.execute(
+        _select(kind).where(model.id == resource_id)).mappings().first()
+    if row is None:
+        abort(404)
+    return _conditional({'data': _serialize(row)})
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return jsonify({'error': error.description}), error.code
+
+
+@api.errorhandler(429)
+def api_rate_limited(error):
+    return jsonify({'error': error.description}), error.code, \
+        {'Retry-After': error.retry_after}
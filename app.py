@@ -2,497 +2,197 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
-import sys
+import os
 from datetime import datetime
-import dateutil.parser
-import babel
-from flask import (Flask, render_template, request, abort,
-                   flash, redirect, url_for, jsonify)
+import click
+from flask import (Flask, Response, render_template, request, abort,
+                   jsonify, stream_with_context, current_app)
 from flask_moment import Moment
 import logging
 from logging import Formatter, FileHandler
-from forms import *
 
-from models import db, db_setup, Venue, Artist, Show
+from models import db, db_setup, migrate_setup
+from filters import filters_setup
+from assets import assets_setup, build_assets_command
+from cache import cache_setup
+from ratelimit import ratelimit_setup
+from jobs import jobs_setup, worker_command
+from images import images_setup
+from instrumentation import instrumentation_setup, pool_stats
+from importer import import_command, import_stream
+from exporter import FORMATS as EXPORT_FORMATS, export, export_command
+from api import api
+from views.venues import venues
+from views.artists import artists
+from views.shows import shows
+from views.search import search
+from counters import recount_command
+from purge import purge_command
+from startup import startup_profile_command
 
 # ----------------------------------------------------------------------------#
-# App Config.
-# ----------------------------------------------------------------------------#
-
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = db_setup(app)
-
-# ----------------------------------------------------------------------------#
-# Filters.
+# Controllers.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+# (rule, view, options) of the views, added to the app by create_app.
+VIEWS = []
 
 
-app.jinja_env.filters['datetime'] = format_datetime
-
-# ----------------------------------------------------------------------------#
-# Controllers.
-# ----------------------------------------------------------------------------#
+def route(rule, **options):
+    """Collect a view like Flask.route does, for create_app to add."""
+    def decorator(view):
+        VIEWS.append((rule, view, options))
+        return view
+    return decorator
 
 
-@app.route('/')
+@route('/')
 def index():
     return render_template('pages/home.html')
 
 
-#  Venues
-#  ----------------------------------------------------------------
-
-@app.route('/venues')
-def venues():
-
-    venues = Venue.query.all()
-    data = {}
-    buffer_locations = set()
-
-    for venue in venues:
-        location_dict = {}
-        upcoming_shows_number = Show.query.filter(Show.venue_id == venue.id,
-                                           Show.start_time > datetime.now()).count()
-        if venue.city not in buffer_locations:
-            location_dict = {
-                "city": venue.city,
-                "state":  venue.state,
-                "venues": [{
-                    "id": venue.id,
-                    "name": venue.name,
-                    "num_upcoming_shows": upcoming_shows_number,
-                }]
-            }
-            buffer_locations.add(venue.city)
-            data[venue.city] = location_dict
-        else:
-            data[venue.city]["venues"].append(
-                {
-                    "id": venue.id,
-                    "name": venue.name,
-                    "num_upcoming_shows": upcoming_shows_number,
-                }
-            )
-    return render_template('pages/venues.html', areas=data.values())
-
-
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-    search_term = request.form['search_term']
-    venues = Venue.query.filter(Venue.name.ilike(f"%{search_term}%")).all()
-    current_time = datetime.now()
-    data = []
-
-    for venue in venues:
-        num_upcoming_shows = Show.query.filter(
-          Show.artist_id == venue.id, Show.start_time > current_time
-          ).count()
-        data.append({
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": num_upcoming_shows,
-        })
-    response = {
-        "count": len(venues),
-        "data": data
-    }
-    return render_template(
-        'pages/search_venues.html',
-        results=response,
-        search_term=request.form.get(
-            'search_term',
-            ''))
-
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-    if not venue:
-        abort(404)
-    data = {}
-    data.update(vars(venue))
-    data["genres"] = data['genres'].split("-")
-    data["past_shows" ] = []
-    data["upcoming_shows"] = []
-    data["past_shows_count"] = 0
-    data["upcoming_shows_count"] = 0
-
-    for show in venue.shows:
-        artist = Artist.query.get(show.artist_id)
-        serialized_show = {
-            "artist_id": show.artist_id,
-            "artist_name": artist.name,
-            "artist_image_link": artist.image_link,
-            "start_time": str(show.start_time)
-        }
-        if show.start_time < datetime.now():
-            data["past_shows" ].append(serialized_show)
-            data["past_shows_count"] += 1
-        else:
-            data["upcoming_shows" ].append(serialized_show)
-            data["upcoming_shows_count"] += 1
-
-    return render_template('pages/show_venue.html', venue=data)
-
-#  Create Venue
+#  Import
 #  ----------------------------------------------------------------
 
+IMPORT_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonlines': 'ndjson',
+}
 
-@app.route('/venues/create', methods=['GET'])
-def create_venue_form():
-    form = VenueForm()
-    return render_template('forms/new_venue.html', form=form)
-
-
-@app.route('/venues/create', methods=['POST'])
-def create_venue_submission():
-    form = VenueForm(request.form)
-    error = False
-    if form.validate():
-        if form.genres.data:
-            genres = "-".join([genre.value for genre in form.genres.data])
-        try:
-            venue = Venue(
-              address=form.address.data, phone=form.phone.data, state=form.state.data,
-              website_link=form.website_link.data, facebook_link=form.facebook_link.data,
-              seeking_talent=form.seeking_talent.data, image_link=form.image_link.data,
-              seeking_description=form.seeking_description.data, city=form.city.data,
-              genres=genres, name=form.name.data,
-            )
-            db.session.add(venue)
-            db.session.commit()
-        except Exception as e:
-            error = True
-            db.session.rollback()
-            print(sys.exc_info())
-        finally:
-            db.session.close()
-        if not error:
-            flash('Venue ' + request.form['name'] + ' was successfully listed!')
-            return render_template('pages/home.html')
-        else:
-            flash(f'An error occurred. Venue {form.name.data} could not be listed.')
-    else:
-        message = [f'{field} ' + '|'.join(err) for field, err in form.errors.items()]
-        flash(f'Errors {message}')
-    return render_template('forms/new_venue.html', form=form)
-
-
-@app.route('/venues/<int:venue_id>', methods=['DELETE'])
-def delete_venue(venue_id):
-    error = False
-    try:
-        venue_to_be_deleted =  Venue.query.get(venue_id)
-        db.session.delete(venue_to_be_deleted)
-        db.session.commit()
-    except Exception:
-        error = True
-        db.session.rollback()
-    finally:
-        db.session.close()
-    if error:
-        abort(500)
-    else:
-        return jsonify({'success': True})
-
-
-#  Artists
-#  ----------------------------------------------------------------
 
-
-@app.route('/artists')
-def artists():
-    data = Artist.query.all()
-    return render_template('pages/artists.html', artists=data)
-
-
-@app.route('/artists/search', methods=['POST'])
-def search_artists():
-
-    search_term = request.form['search_term']
-    artists = Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).all()
-    current_time = datetime.now()
-    data = []
-
-    for artist in artists:
-        num_upcoming_shows = Show.query.filter(
-          Show.artist_id == artist.id, Show.start_time > current_time
-          ).count()
-        data.append({
-            "id": artist.id,
-            "name": artist.name,
-            "num_upcoming_shows": num_upcoming_shows,
-        })
-    response = {
-        "count": len(artists),
-        "data": data
-    }
-    return render_template(
-        'pages/search_artists.html',
-        results=response,
-        search_term=request.form.get(
-            'search_term',
-            ''))
-
-
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-    artist = Artist.query.get(artist_id)
-    if not artist:
-        abort(404)
-    data = {}
-    data.update(vars(artist))
-    data["genres"] = data['genres'].split("-")
-    data["past_shows" ] = []
-    data["upcoming_shows"] = []
-    data["past_shows_count"] = 0
-    data["upcoming_shows_count"] = 0
-
-    for show in artist.shows:
-        venue = Venue.query.get(show.venue_id)
-        serialized_show = {
-            "venue_id": show.venue_id,
-            "venue_name": venue.name,
-            "venue_image_link": venue.image_link,
-            "start_time": str(show.start_time)
-        }
-        if show.start_time < datetime.now():
-            data["past_shows" ].append(serialized_show)
-            data["past_shows_count"] += 1
-        else:
-            data["upcoming_shows" ].append(serialized_show)
-            data["upcoming_shows_count"] += 1
-
-    return render_template('pages/show_artist.html', artist=data)
-
-#  Update
-#  ----------------------------------------------------------------
+@route('/import/<any(venues, artists, shows):kind>', methods=['POST'])
+def import_upload(kind):
+    format = IMPORT_FORMATS.get(request.mimetype)
+    if format is None:
+        abort(415)
+    report = import_stream(kind, request.stream, format,
+                           batch_size=current_app.config['IMPORT_BATCH_SIZE'])
+    return jsonify(report.to_dict())
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
-def edit_artist(artist_id):
-    artist = Artist.query.get(artist_id)
-    form = ArtistForm(obj=artist)
-    return render_template('forms/edit_artist.html', form=form, artist=artist)
-
-
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
-def edit_artist_submission(artist_id):
-    artist = Artist.query.get(artist_id)
-    if not artist:
-        abort(404)
-    form = ArtistForm(request.form)
-    if form.genres.data:
-        genres = "-".join([genre.value for genre in form.genres.data])
-    error = False
-    if form.validate():
-        try:
-            form.populate_obj(artist)
-            artist.genres = genres
-            db.session.commit()
-        except Exception as e:
-            error = True
-            db.session.rollback()
-            print(sys.exc_info())
-        finally:
-            db.session.close()
-        if not error:
-            flash('Artist ' + request.form['name'] + ' was successfully updated!')
-            return redirect(url_for('show_artist', artist_id=artist_id))
-        else:
-            flash(f'An error occurred. Artist {form.name.data} could not be updated.')
-    else:
-        flash('An error occurred. Form is not  valid', 'error')
-    return render_template('forms/edit_artist.html', form=form, artist=artist)
-
-
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
-def edit_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-    form = VenueForm(obj=venue)
-    return render_template('forms/edit_venue.html', form=form, venue=venue)
-
-
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
-def edit_venue_submission(venue_id):
-    venue = Venue.query.get(venue_id)
-    if not venue:
-        abort(404)
-    form = ArtistForm(request.form)
-    if form.genres.data:
-        genres = "-".join([genre.value for genre in form.genres.data])
-    error = False
-    if form.validate():
-        try:
-            form.populate_obj(venue)
-            venue.genres = genres
-            db.session.commit()
-        except Exception as e:
-            error = True
-            db.session.rollback()
-            print(sys.exc_info())
-        finally:
-            db.session.close()
-        if not error:
-            flash('venue ' + request.form['name'] + ' was successfully updated!')
-            return redirect(url_for('show_venue', venue_id=venue_id))
-        else:
-            flash(f'An error occurred. Venue {form.name.data} could not be updated.')
-    else:
-        flash('An error occurred. Form is not  valid', 'error')
-    return render_template('forms/edit_venue.html', form=form, venue=venue)
-
-#  Create Artist
+#  Export
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET'])
-def create_artist_form():
-    form = ArtistForm()
-    return render_template('forms/new_artist.html', form=form)
-
-
-@app.route('/artists/create', methods=['POST'])
-def create_artist_submission():
-    form = ArtistForm(request.form)
-    error = False
-    if form.validate():
-        if form.genres.data:
-            genres = "-".join([genre.value for genre in form.genres.data])
-        try:
-            artist = Artist(
-                name=form.name.data, phone=form.phone.data, state=form.state.data,
-                website_link=form.website_link.data, facebook_link=form.facebook_link.data,
-                seeking_venue=form.seeking_venue.data, image_link=form.image_link.data,
-                seeking_description=form.seeking_description.data, city=form.city.data,
-                genres=genres,
-            )
-            db.session.add(artist)
-            db.session.commit()
-        except Exception as e:
-            error = True
-            db.session.rollback()
-            print(sys.exc_info())
-        finally:
-            db.session.close()
-        if not error:
-            flash('Artist ' + request.form['name'] + ' was successfully listed!')
-            return render_template('pages/home.html')
-        else:
-            flash(f'An error occurred. Venue {form.name.data} could not be listed.')
-    else:
-        message = [f'{field} ' + '|'.join(err) for field, err in form.errors.items()]
-        flash(f'Errors {message}')
-    return render_template('forms/new_artist.html', form=form)
-
-#  Shows
+@route('/export/<any(venues, artists, shows):kind>')
+def export_download(kind):
+    format = request.args.get('format', 'csv')
+    if format not in EXPORT_FORMATS:
+        abort(400)
+    try:
+        changed_since = request.args.get('changed_since')
+        if changed_since is not None:
+            changed_since = datetime.fromisoformat(changed_since)
+    except ValueError:
+        abort(400)
+    try:
+        chunks = export(kind, format,
+                        after_id=request.args.get('after_id', type=int),
+                        chunk_size=current_app.config['EXPORT_CHUNK_SIZE'],
+                        changed_since=changed_since)
+    except ImportError:
+        # Parquet and Arrow need pyarrow, which is optional
+        abort(501)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[format],
+        headers={'Content-Disposition':
+                 f'attachment; filename={kind}.{format}'})
+
+
+#  Metrics
 #  ----------------------------------------------------------------
 
 
-@app.route('/shows')
-def shows():
-
-    shows = Show.query.all()
-    data = []
-
-    for show in shows:
-        venue = Venue.query.get(show.venue_id)
-        artist = Artist.query.get(show.artist_id)
-        data.append(
-            {
-                "venue_id": venue.id,
-                "venue_name": venue.name,
-                "artist_id": artist.id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": str(show.start_time),
-            }
-        )
-
-    return render_template('pages/shows.html', shows=data)
-
-
-@app.route('/shows/create')
-def create_shows():
-    # renders form. do not touch.
-    form = ShowForm()
-    return render_template('forms/new_show.html', form=form)
-
+@route('/cache/stats')
+def cache_stats():
+    cache = current_app.extensions.get('response_cache')
+    return jsonify(cache.stats if cache else {})
 
-@app.route('/shows/create', methods=['POST'])
-def create_show_submission():
 
-    form = ShowForm(request.form)
-    error = False
+@route('/db/pool')
+def db_pool_stats():
+    return jsonify(pool_stats(current_app))
 
-    if form.validate():
-        try:
-            show = Show(
-              start_time=form.start_time.data,
-              artist_id=form.artist_id.data,
-              venue_id=form.venue_id.data,
-            )
-            db.session.add(show)
-            db.session.commit()
-        except Exception as e:
-            error = True
-            db.session.rollback()
-            print(sys.exc_info())
-        finally:
-            db.session.close()
-        if not error:
-            flash('Show was successfully listed!')
 
-            return render_template('pages/home.html')
+@route('/db/replicas')
+def db_replica_stats():
+    replicas = current_app.extensions.get('replicas')
+    return jsonify(replicas.snapshot() if replicas else {})
 
-        else:
-            flash('An error occurred. Show could not be listed.')
-    else:
-        flash('An error occurred. Form is not  valid', 'error')
 
-    return render_template('forms/new_show.html', form=form)
-
-
-@app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+# ----------------------------------------------------------------------------#
+# App Config.
+# ----------------------------------------------------------------------------#
+
+moment = Moment()
+
+
+def create_app(config=None):
+    """Create the application, with the settings of config.py updated
+    from the config mapping."""
+    app = Flask(__name__)
+    app.config.from_object('config')
+    if config:
+        app.config.update(config)
+    moment.init_app(app)
+    db_setup(app)
+    cache_setup(app)
+    ratelimit_setup(app)
+    instrumentation_setup(app, db)
+    filters_setup(app)
+    assets_setup(app)
+    jobs_setup(app)
+    images_setup(app)
+    # Flask-Migrate only for the flask commands, see migrate_setup
+    if click.get_current_context(silent=True) is not None:
+        migrate_setup(app)
+    app.cli.add_command(import_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(recount_command)
+    app.cli.add_command(purge_command)
+    app.cli.add_command(startup_profile_command)
+    for blueprint in (venues, artists, shows, search, api):
+        app.register_blueprint(blueprint)
+    for rule, view, options in VIEWS:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.register_error_handler(404, not_found_error)
+    app.register_error_handler(500, server_error)
+
+    if not app.debug:
+        app.logger.setLevel(logging.INFO)
+    log_file = app.config.get('LOG_FILE')
+    if not app.debug and not app.testing and log_file:
+        # app.logger is shared by the apps of the process: one handler
+        # per file, however many apps are created
+        path = os.path.abspath(log_file)
+        if not any(getattr(handler, 'baseFilename', None) == path
+                   for handler in app.logger.handlers):
+            file_handler = FileHandler(path)
+            file_handler.setFormatter(Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+            file_handler.setLevel(logging.INFO)
+            app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+    return app
 
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
 
-# Default port:
-if __name__ == '__main__':
-    app.run()
-
-# Or specify port manually:
-'''
+# Development server only; in production run gunicorn, see
+# gunicorn.conf.py and wsgi.py.
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
-'''
+    create_app().run(port=port)
@@ -0,0 +1,258 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+
+# Bundles built by ``flask build-assets``, in load order.  Sources are
+# relative to the static folder.
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    'app.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+# Build output, inside the static folder.
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.eot',
+                '.ttf', '.otf'}
+
+
+# ----------------------------------------------------------------------------#
+# Minification.
+# ----------------------------------------------------------------------------#
+
+
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_SPACE = re.compile(r'\s+')
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(source):
+    """Minify a stylesheet with rcssmin if installed, else by removing
+    comments and redundant whitespace."""
+    try:
+        from rcssmin import cssmin
+    except ImportError:
+        source = CSS_COMMENT.sub('', source)
+        source = CSS_SPACE.sub(' ', source)
+        return CSS_PUNCTUATION.sub(r'\1', source).replace(';}', '}').strip()
+    return cssmin(source)
+
+
+def minify_js(source):
+    """Minify a script with rjsmin if installed.
+
+    There is no fallback: stripping JavaScript safely needs a tokenizer,
+    so without rjsmin sources are bundled as they are.
+    """
+    try:
+        from rjsmin import jsmin
+    except ImportError:
+        return source
+    return jsmin(source)
+
+
+# ----------------------------------------------------------------------------#
+# Build.
+# ----------------------------------------------------------------------------#
+
+
+def _hashed_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+
+def _write(static_folder, path, content, compress):
+    target = os.path.join(static_folder, DIST, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as stream:
+        stream.write(content)
+    if not compress or posixpath.splitext(path)[1] not in COMPRESSIBLE:
+        return
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants['.br'] = brotli.compress(content)
+    for suffix, data in variants.items():
+        # not worth a second file when it saves less than 5%
+        if len(data) < len(content) * 0.95:
+            with open(target + suffix, 'wb') as stream:
+                stream.write(data)
+
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def _rewrite_css_urls(source, source_path, target_path, manifest):
+    """Point the relative url()s of a stylesheet at hashed files.
+
+    References which are not in the manifest are left alone; bundles are
+    written at the root of DIST so that they still resolve as from css/.
+    """
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', '/', 'http:', 'https:', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        path = posixpath.normpath(
+            posixpath.join(posixpath.dirname(source_path), path))
+        if path not in manifest:
+            return match.group(0)
+        hashed = posixpath.relpath(manifest[path],
+                                   posixpath.dirname(target_path))
+        return f'url({quote}{hashed}{suffix}{quote})'
+    return CSS_URL.sub(replace, source)
+
+
+def build(static_folder, compress=True):
+    """Write fingerprinted copies of the static files and bundles to
+    DIST, with gzip (and brotli, if installed) variants, and return the
+    manifest mapping logical names to hashed paths."""
+    output = os.path.join(static_folder, DIST)
+    shutil.rmtree(output, ignore_errors=True)
+    manifest = {}
+
+    paths = []
+    for directory, subdirectories, files in os.walk(static_folder):
+        subdirectories[:] = [name for name in subdirectories
+                             if os.path.join(directory, name) != output]
+        paths.extend(os.path.relpath(os.path.join(directory, name),
+                                     static_folder).replace(os.sep, '/')
+                     for name in files if not name.startswith('.'))
+
+    # stylesheets last, their url()s need the hashed names of the rest
+    for path in sorted(paths, key=lambda path: path.endswith('.css')):
+        with open(os.path.join(static_folder, path), 'rb') as stream:
+            content = stream.read()
+        if path.endswith('.css'):
+            content = _rewrite_css_urls(content.decode('utf-8'), path,
+                                        f'{DIST}/{path}', manifest).encode()
+        hashed = _hashed_name(path, content)
+        _write(static_folder, hashed, content, compress)
+        manifest[path] = f'{DIST}/{hashed}'
+
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source),
+                      encoding='utf-8') as stream:
+                text = stream.read()
+            if bundle.endswith('.css'):
+                parts.append(minify_css(_rewrite_css_urls(
+                    text, source, f'{DIST}/{bundle}', manifest)))
+            else:
+                parts.append(text if source.endswith('.min.js')
+                             else minify_js(text))
+        separator = '\n' if bundle.endswith('.css') else ';\n'
+        content = separator.join(parts).encode()
+        hashed = _hashed_name(bundle, content)
+        _write(static_folder, hashed, content, compress)
+        manifest[bundle] = f'{DIST}/{hashed}'
+
+    with open(os.path.join(output, MANIFEST), 'w') as stream:
+        json.dump(manifest, stream, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as stream:
+            return json.load(stream)
+    except FileNotFoundError:
+        return {}
+
+
+# ----------------------------------------------------------------------------#
+# Serving.
+# ----------------------------------------------------------------------------#
+
+
+def asset_urls(bundle):
+    """Return the URLs to include for a bundle: the built file when the
+    assets were built, its separate sources otherwise."""
+    if bundle in current_app.extensions['assets']:
+        return [url_for('static', filename=bundle)]
+    return [url_for('static', filename=source) for source in BUNDLES[bundle]]
+
+
+def serve_built_asset(filename):
+    """Serve a fingerprinted file, precompressed when the client accepts
+    it.  The content of a hashed name never changes, so it is cached
+    for good."""
+    directory = os.path.join(current_app.static_folder, DIST)
+    mimetype = mimetypes.guess_type(filename)[0]
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in request.accept_encodings and \
+                os.path.isfile(os.path.join(directory, filename + suffix)):
+            response = send_from_directory(directory, filename + suffix,
+                                           mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get(
+        'ASSETS_MAX_AGE', 31536000)
+    response.cache_control.immutable = True
+    return response
+
+
+def assets_setup(app):
+    """Serve the files written by ``flask build-assets``.
+
+    Once built, url_for('static', filename=...) returns the hashed name
+    of a file, and asset_urls() the bundle instead of its sources.
+    Without a build, static files are served as they are.
+    """
+    manifest = load_manifest(app.static_folder)
+    app.extensions['assets'] = manifest
+    app.jinja_env.globals['asset_urls'] = asset_urls
+    app.add_url_rule(f'{app.static_url_path}/{DIST}/<path:filename>',
+                     'built_asset', serve_built_asset)
+
+    @app.url_defaults
+    def hashed_static_filename(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+
+@click.command('build-assets')
+@click.option('--no-compress', is_flag=True,
+              help='Do not write gzip and brotli variants.')
+@with_appcontext
+def build_assets_command(no_compress):
+    """Bundle, minify and fingerprint the static files."""
+    manifest = build(current_app.static_folder, compress=not no_compress)
+    click.echo(f'Built {len(manifest)} assets into '
+               f'{os.path.join(current_app.static_folder, DIST)}.')
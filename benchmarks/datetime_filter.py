@@ -0,0 +1,63 @@
+"""Micro-benchmark of the datetime template filter.
+
+Compares the filter against the former implementation, which re-parsed
+the string the views produced with dateutil and called babel each time.
+Run from the project root:
+
+    python benchmarks/datetime_filter.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filters import format_datetime, _format  # noqa: E402
+
+
+def former_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main(tiles=24, distinct=24, number=200):
+    start = datetime(2026, 1, 1, 20)
+    times = [start + timedelta(days=i % distinct) for i in range(tiles)]
+    strings = [str(value) for value in times]
+
+    app = Flask(__name__)
+    app.config.update(DATETIME_LOCALE='en', DATETIME_TIMEZONE=None)
+    with app.app_context():
+        assert [format_datetime(value, 'full') for value in times] == \
+            [former_format_datetime(value, 'full') for value in strings]
+
+        def cold():
+            _format.cache_clear()
+            for value in times:
+                format_datetime(value, 'full')
+
+        cases = {
+            'former (str, dateutil + babel)':
+                lambda: [former_format_datetime(v, 'full') for v in strings],
+            'filter, memo cache cold':
+                cold,
+            'filter, memo cache warm':
+                lambda: [format_datetime(v, 'full') for v in times],
+        }
+        print(f'{tiles} tiles per page, {number} pages')
+        for name, case in cases.items():
+            seconds = min(timeit.repeat(case, number=number, repeat=3))
+            print(f'{name:32} {seconds / number * 1e6:10.1f} us/page')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Benchmark of the connection pool under 200 concurrent requests.
+
+Seeds a database (see seed.py), serves the application from a threaded
+server and sends ``--concurrency`` clients at it at once, each making
+``--requests`` requests to pages which query the database.  Reports the
+latency of the requests and, from PoolStats, the checkouts of the
+pool, how many of them waited for a connection and for how long, and
+its peak use.  Run from the project root, against a database of its
+own:
+
+    DB_URI=postgresql:///bench python benchmarks/pool.py
+    DB_URI=sqlite:///bench.db python benchmarks/pool.py --pool-size 5
+
+SQLite engines get a QueuePool of --pool-size and --max-overflow, as
+they otherwise open a connection per checkout; other databases take
+them as DB_POOL_SIZE and DB_MAX_OVERFLOW.  The run fails, with status
+1, when a checkout timed out, a request failed with a 5xx, or more than
+``--max-waits`` of the checkouts had to wait: the pool is too small for
+the concurrency, or the connections are held for too long.
+"""
+import argparse
+import http.client
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes import _spread, percentile, serve  # noqa: E402
+
+
+def _paths(counts, i):
+    """The i-th request of a client, round-robin over pages querying the
+    database."""
+    return [
+        f"/venues/{_spread(counts['venues'], i)}",
+        f"/artists/{_spread(counts['artists'], i)}",
+        '/shows',
+        f"/api/v1/venues/{_spread(counts['venues'], i)}",
+        '/api/v1/shows?fields=start_time',
+    ][i % 5]
+
+
+def _client(url, counts, number, requests, start, samples):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port,
+                                            timeout=120)
+    start.wait()
+    for i in range(number * requests, (number + 1) * requests):
+        started = time.perf_counter()
+        try:
+            connection.request('GET', _paths(counts, i))
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            status = 599
+        samples.append((time.perf_counter() - started, status))
+    connection.close()
+
+
+def load(url, counts, concurrency, requests):
+    """Send concurrency clients at url at once; return their (latency,
+    status) samples and the time they took."""
+    samples = []
+    start = threading.Barrier(concurrency + 1)
+    clients = [threading.Thread(target=_client,
+                                args=(url, counts, number, requests, start,
+                                      samples))
+               for number in range(concurrency)]
+    for client in clients:
+        client.start()
+    start.wait()
+    started = time.perf_counter()
+    for client in clients:
+        client.join()
+    return samples, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=100)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='Reuse the database of a previous run.')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5,
+                        help='Requests of each client.')
+    parser.add_argument('--pool-size', type=int, default=5)
+    parser.add_argument('--max-overflow', type=int, default=10)
+    parser.add_argument('--pool-timeout', type=float, default=30)
+    parser.add_argument('--max-waits', type=float, default=0.5,
+                        help='Share of the checkouts allowed to wait.')
+    args = parser.parse_args(argv)
+
+    import logging
+    import warnings
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.pool import QueuePool
+    from app import create_app
+    from instrumentation import QueryBudgetWarning, pool_stats, query_logger
+    from seed import reset_database, seed
+
+    warnings.simplefilter('ignore', QueryBudgetWarning)
+    config = {'CACHE_TYPE': 'null', 'JOBS_BACKEND': 'sync',
+              'RATELIMIT_ENABLED': False,
+              'DB_POOL_SIZE': args.pool_size,
+              'DB_MAX_OVERFLOW': args.max_overflow,
+              'DB_POOL_TIMEOUT': args.pool_timeout}
+    if make_url(os.environ.get('DB_URI', '')).get_backend_name() == 'sqlite':
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'poolclass': QueuePool, 'pool_size': args.pool_size,
+            'max_overflow': args.max_overflow,
+            'pool_timeout': args.pool_timeout,
+            'connect_args': {'check_same_thread': False}}
+    app = create_app(config)
+    app.logger.disabled = True
+    query_logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    counts = {'venues': args.venues, 'artists': args.artists,
+              'shows': args.shows}
+    if not args.no_seed:
+        reset_database(app)
+        seed(app, **counts, seed=args.seed)
+
+    server, url = serve(app)
+    try:
+        before = pool_stats(app)['default']
+        samples, elapsed = load(url, counts, args.concurrency, args.requests)
+        after = pool_stats(app)['default']
+    finally:
+        server.shutdown()
+
+    latencies = [latency for latency, _ in samples]
+    errors = sum(1 for _, status in samples if status >= 500)
+    checkouts = after['checkouts'] - before['checkouts']
+    waits = after['waits'] - before['waits']
+    timeouts = after['timeouts'] - before['timeouts']
+    wait_ms = after['wait_ms'] - before['wait_ms']
+    print(f'\n{args.concurrency} clients x {args.requests} requests against '
+          f'{url} in {elapsed:.1f}s: {len(samples) / elapsed:.1f} req/s')
+    print(f'latency p50 {percentile(latencies, 50) * 1000:.1f} ms, '
+          f'p95 {percentile(latencies, 95) * 1000:.1f} ms, '
+          f'p99 {percentile(latencies, 99) * 1000:.1f} ms; {errors} 5xx')
+    print(f"pool {after['pool']} of {after.get('size')} + "
+          f"{after.get('max_overflow')} overflow: {checkouts} checkouts, "
+          f"{waits} waited ({wait_ms:.0f} ms in all, "
+          f"{wait_ms / max(waits, 1):.1f} ms each), {timeouts} timed out, "
+          f"peak {after['peak_in_use']} in use")
+
+    problems = []
+    if timeouts:
+        problems.append(f'{timeouts} checkouts timed out')
+    if errors:
+        problems.append(f'{errors} requests failed with a 5xx')
+    if checkouts and waits / checkouts > args.max_waits:
+        problems.append(f'{waits / checkouts:.0%} of the checkouts waited, '
+                        f'over {args.max_waits:.0%}')
+    for problem in problems:
+        print(f'SATURATED {problem}')
+    if problems:
+        sys.exit(1)
+    print('The pool kept up.')
+
+
+if __name__ == '__main__':
+    main()
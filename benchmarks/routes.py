@@ -0,0 +1,469 @@
+"""Benchmark of every route, through the test client and over HTTP.
+
+Seeds a database (see seed.py), requests each route ``--requests``
+times through the Flask test client, then loads a threaded server (or
+``--url``) from ``--workers`` processes for ``--duration`` seconds.
+Reports p50/p95/p99 latency, throughput and database queries per
+request of each route.  Run from the project root, against a database
+of its own:
+
+    DB_URI=sqlite:///bench.db python benchmarks/routes.py --save-baseline
+    DB_URI=sqlite:///bench.db python benchmarks/routes.py
+
+The second run compares with the saved baseline and exits with status
+1 when a route regressed: a p95 latency or a throughput worse by more
+than ``--tolerance``, or more queries per request, or any 5xx response.
+Every rule of the application must have a scenario, or be listed in
+EXCLUDED with a reason.
+"""
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+# Rules that are not benchmarked, with the reason.
+EXCLUDED = {
+    ('images.thumbnail', 'GET'): 'fetches external images',
+    ('built_asset', 'GET'): 'only exists after flask build-assets',
+}
+
+# Latency differences below this many milliseconds are noise.
+NOISE_MS = 1.0
+
+
+class Scenario:
+    """A request to benchmark, numbered by ``i`` on each repetition.
+
+    ``path`` and ``data`` may be functions of ``i``; ``setup(i)``, if
+    given, runs untimed before the request and returns values formatted
+    into the path.  Scenarios which write are not run over HTTP.
+    """
+
+    def __init__(self, name, method, path, data=None, content_type=None,
+                 setup=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.content_type = content_type
+        self.setup = setup
+
+    @property
+    def safe(self):
+        return self.method == 'GET' or self.name.startswith('search')
+
+    def request(self, i):
+        path = self.path(i) if callable(self.path) else self.path
+        if self.setup is not None:
+            path = path.format(**self.setup(i))
+        data = self.data(i) if callable(self.data) else self.data
+        return self.method, path, data, self.content_type
+
+
+def _spread(count, i, step=7919):
+    """The i-th of count ids, visited in a scattered order."""
+    return i * step % max(count, 1) + 1
+
+
+def _venue_form(i, name):
+    return {
+        'name': name, 'city': 'Austin', 'state': 'TX',
+        'address': f'{i} Bench St', 'phone': '512-555-0100',
+        'genres': ['Jazz', 'Blues'], 'facebook_link': '',
+        'image_link': '', 'website_link': 'https://example.com/bench',
+        'seeking_talent': 'y', 'seeking_description': 'Benchmarking',
+    }
+
+
+def _artist_form(i, name):
+    return {
+        'name': name, 'city': 'Austin', 'state': 'TX',
+        'phone': '512-555-0100', 'genres': ['Rock n Roll'],
+        'facebook_link': '', 'image_link': '',
+        'website_link': 'https://example.com/bench',
+        'seeking_venue': 'y', 'seeking_description': 'Benchmarking',
+    }
+
+
+def scenarios(app, counts):
+    """Return the scenarios of a database seeded with counts."""
+    from models import db, Venue, Artist, Show
+
+    venues, artists, shows = counts['venues'], counts['artists'], \
+        counts['shows']
+    # after every show, so bookings do not conflict, even with the ones
+    # of a previous run against the same database
+    with app.app_context():
+        booking_base = db.session.query(db.func.max(Show.end_time)).scalar()
+    booking_base = (booking_base or datetime.now()) + timedelta(days=1)
+
+    def disposable_venue(i):
+        with app.app_context():
+            venue = Venue(name=f'Disposable {i}')
+            db.session.add(venue)
+            db.session.commit()
+            return {'id': venue.id}
+
+    def disposable_artist(i):
+        with app.app_context():
+            artist = Artist(name=f'Disposable {i}')
+            db.session.add(artist)
+            db.session.commit()
+            return {'id': artist.id}
+
+    def csv_rows(i):
+        lines = ['name,city,state,address,phone,genres,website_link']
+        lines.extend(f'Imported {i}-{n},Austin,TX,{n} Import St,'
+                     f'512-555-0100,Jazz,https://example.com/{n}'
+                     for n in range(10))
+        return '\n'.join(lines) + '\n'
+
+    return [
+        Scenario('index', 'GET', '/'),
+        Scenario('venues', 'GET', '/venues'),
+        Scenario('venues by genre', 'GET', '/venues?genre=Jazz'),
+        Scenario('venue', 'GET', lambda i: f'/venues/{_spread(venues, i)}'),
+        Scenario('search venues', 'POST', '/venues/search',
+                 data={'search_term': 'velvet'}),
+        Scenario('venue form', 'GET', '/venues/create'),
+        Scenario('create venue', 'POST', '/venues/create',
+                 data=lambda i: _venue_form(i, f'Bench Venue {i}')),
+        Scenario('edit venue form', 'GET',
+                 lambda i: f'/venues/{_spread(venues, i)}/edit'),
+        Scenario('edit venue', 'POST',
+                 lambda i: f'/venues/{_spread(venues, i)}/edit',
+                 data=lambda i: _venue_form(i, f'Edited Venue {i}')),
+        Scenario('delete venue', 'DELETE', '/venues/{id}',
+                 setup=disposable_venue),
+        Scenario('artists', 'GET', '/artists'),
+        Scenario('artist', 'GET', lambda i: f'/artists/{_spread(artists, i)}'),
+        Scenario('search artists', 'POST', '/artists/search',
+                 data={'search_term': 'band'}),
+        Scenario('artist form', 'GET', '/artists/create'),
+        Scenario('create artist', 'POST', '/artists/create',
+                 data=lambda i: _artist_form(i, f'Bench Artist {i}')),
+        Scenario('edit artist form', 'GET',
+                 lambda i: f'/artists/{_spread(artists, i)}/edit'),
+        Scenario('edit artist', 'POST',
+                 lambda i: f'/artists/{_spread(artists, i)}/edit',
+                 data=lambda i: _artist_form(i, f'Edited Artist {i}')),
+        Scenario('delete artist', 'DELETE', '/artists/{id}',
+                 setup=disposable_artist),
+        Scenario('shows', 'GET', '/shows'),
+        Scenario('upcoming shows', 'GET', '/shows?upcoming=1'),
+        Scenario('show form', 'GET', '/shows/create'),
+        Scenario('create show', 'POST', '/shows/create', data=lambda i: {
+            'venue_id': _spread(venues, i), 'artist_id': _spread(artists, i),
+            'start_time': f'{booking_base + timedelta(hours=4 * i):%Y-%m-%d %H:%M:%S}',
+            'duration': 120}),
+        Scenario('import venues', 'POST', '/import/venues', data=csv_rows,
+                 content_type='text/csv'),
+        Scenario('export venues', 'GET',
+                 f'/export/venues?after_id={max(venues - 1000, 0)}'),
+        Scenario('export shows', 'GET',
+                 f'/export/shows?after_id={max(shows - 1000, 0)}'),
+        Scenario('api venues', 'GET', '/api/v1/venues'),
+        Scenario('api venue', 'GET',
+                 lambda i: f'/api/v1/venues/{_spread(venues, i)}'),
+        Scenario('api shows', 'GET', '/api/v1/shows?fields=start_time'),
+        Scenario('cache stats', 'GET', '/cache/stats'),
+        Scenario('pool stats', 'GET', '/db/pool'),
+        Scenario('replica stats', 'GET', '/db/replicas'),
+        Scenario('static file', 'GET', '/static/css/main.css'),
+    ]
+
+
+def uncovered(app, cases):
+    """Return the (endpoint, method) pairs of the application's rules
+    which neither a scenario nor EXCLUDED cover."""
+    adapter = app.url_map.bind('localhost')
+    covered = set(EXCLUDED)
+    for case in cases:
+        method, path, _, _ = case.request(0) if case.setup is None \
+            else (case.method, case.path.format(id=1), None, None)
+        endpoint, _ = adapter.match(urlsplit(path).path, method=method)
+        covered.add((endpoint, method))
+    rules = {(rule.endpoint, method) for rule in app.url_map.iter_rules()
+             for method in rule.methods - {'HEAD', 'OPTIONS'}}
+    return sorted(rules - covered)
+
+
+# ----------------------------------------------------------------------------#
+# Statistics.
+# ----------------------------------------------------------------------------#
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Summarize (latency in seconds, status, query count) samples."""
+    latencies = [latency for latency, _, _ in samples]
+    queries = [count for _, _, count in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'throughput': round(len(samples) / elapsed, 1) if elapsed else None,
+        'queries': round(sum(queries) / len(queries), 2) if queries else None,
+        'errors': sum(1 for _, status, _ in samples if status >= 500),
+    }
+
+
+def _query_count(headers):
+    value = headers.get('X-DB-Query-Count')
+    return int(value) if value is not None else None
+
+
+# ----------------------------------------------------------------------------#
+# Test client.
+# ----------------------------------------------------------------------------#
+
+
+def run_client(app, cases, requests, warmup):
+    """Request each scenario through the test client, one at a time."""
+    client = app.test_client()
+    results = {}
+    for case in cases:
+        samples = []
+        elapsed = 0.0
+        for i in range(warmup + requests):
+            method, path, data, content_type = case.request(i)
+            started = time.perf_counter()
+            response = client.open(path, method=method, data=data,
+                                   content_type=content_type)
+            response.get_data()
+            latency = time.perf_counter() - started
+            response.close()
+            if i >= warmup:
+                elapsed += latency
+                samples.append((latency, response.status_code,
+                                _query_count(response.headers)))
+        results[case.name] = summarize(samples, elapsed)
+    return results
+
+
+# ----------------------------------------------------------------------------#
+# HTTP load.
+# ----------------------------------------------------------------------------#
+
+
+def _load(url, requests, duration, worker):
+    """Send requests round-robin over one keep-alive connection until
+    duration elapses; return (name, latency, status, queries) samples."""
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port,
+                                            timeout=30)
+    samples = []
+    deadline = time.monotonic() + duration
+    i = worker
+    while time.monotonic() < deadline:
+        name, method, path, body, headers = requests[i % len(requests)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            connection.request(method, parts.path.rstrip('/') + path,
+                               body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            samples.append((name, time.perf_counter() - started, 599, None))
+            continue
+        samples.append((name, time.perf_counter() - started, response.status,
+                        _query_count(response.headers)))
+    connection.close()
+    return samples
+
+
+def _encode(case, i):
+    from urllib.parse import urlencode
+
+    method, path, data, content_type = case.request(i)
+    headers = {}
+    if isinstance(data, dict):
+        data = urlencode(data, doseq=True)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    elif data is not None:
+        headers['Content-Type'] = content_type
+    return case.name, method, path, data, headers
+
+
+def run_http(url, cases, workers, duration, variants=50):
+    """Load url from workers processes with the read-only scenarios."""
+    requests = [_encode(case, i) for i in range(variants)
+                for case in cases if case.safe]
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        batches = pool.starmap(_load, [(url, requests, duration, worker)
+                                       for worker in range(workers)])
+    elapsed = time.perf_counter() - started
+    by_name = {}
+    for batch in batches:
+        for name, latency, status, queries in batch:
+            by_name.setdefault(name, []).append((latency, status, queries))
+    results = {name: summarize(samples, elapsed)
+               for name, samples in by_name.items()}
+    results['all'] = summarize([sample for samples in by_name.values()
+                                for sample in samples], elapsed)
+    return results
+
+
+def serve(app):
+    """Serve app on a free local port from a background thread."""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+# ----------------------------------------------------------------------------#
+# Report.
+# ----------------------------------------------------------------------------#
+
+
+def print_table(title, results):
+    print(f'\n{title}')
+    print(f"{'route':24} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'req/s':>9} {'queries':>8} {'5xx':>4}")
+    for name, stats in results.items():
+        print(f"{name:24} {stats['requests']:6} {stats['p50_ms']:9.2f} "
+              f"{stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f} "
+              f"{stats['throughput'] or 0:9.1f} "
+              f"{'-' if stats['queries'] is None else stats['queries']:>8} "
+              f"{stats['errors']:4}")
+
+
+def regressions(current, baseline, tolerance):
+    """Return a message for each route that got worse than baseline."""
+    problems = []
+    for phase in ('client', 'http'):
+        for name, stats in current.get(phase, {}).items():
+            label = f'{phase} {name}'
+            if stats['errors']:
+                problems.append(f"{label}: {stats['errors']} 5xx responses")
+            before = baseline.get(phase, {}).get(name)
+            if before is None:
+                continue
+            if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance) and \
+                    stats['p95_ms'] - before['p95_ms'] > NOISE_MS:
+                problems.append(f"{label}: p95 {stats['p95_ms']:.2f} ms, "
+                                f"baseline {before['p95_ms']:.2f} ms")
+            if stats['queries'] is not None and before['queries'] is not None \
+                    and stats['queries'] > before['queries']:
+                problems.append(f"{label}: {stats['queries']} queries per "
+                                f"request, baseline {before['queries']}")
+            if phase == 'http' and before['throughput'] and \
+                    stats['throughput'] < before['throughput'] * (1 - tolerance):
+                problems.append(f"{label}: {stats['throughput']} req/s, "
+                                f"baseline {before['throughput']}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=100)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='Reuse the database of a previous run.')
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Timed requests per route through the client.')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--url', help='Load this server instead of a local '
+                                      'threaded one.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Load generator processes, 0 to skip HTTP.')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--cache', choices=['lru', 'null'], default='null',
+                        help='Response cache; null measures the views.')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    import warnings
+    from app import create_app
+    from instrumentation import QueryBudgetWarning, query_logger
+    from seed import reset_database, seed
+
+    warnings.simplefilter('ignore', QueryBudgetWarning)
+    app = create_app({'CACHE_TYPE': args.cache, 'JOBS_BACKEND': 'sync',
+                      'WTF_CSRF_ENABLED': False,
+                      # a single client, far past the limits
+                      'RATELIMIT_ENABLED': False})
+    app.logger.disabled = True
+    query_logger.disabled = True
+    volumes = {'venues': args.venues, 'artists': args.artists,
+               'shows': args.shows}
+    if not args.no_seed:
+        reset_database(app)
+        seed(app, **volumes, seed=args.seed)
+
+    cases = scenarios(app, volumes)
+    missing = uncovered(app, cases)
+    if missing:
+        sys.exit(f'Routes without a scenario: {missing}')
+
+    results = {'config': {**volumes, 'seed': args.seed, 'cache': args.cache,
+                          'workers': args.workers,
+                          'database': app.config['SQLALCHEMY_DATABASE_URI']
+                          .split(':', 1)[0]}}
+    results['client'] = run_client(app, cases, args.requests, args.warmup)
+    print_table('Test client', results['client'])
+    if args.workers:
+        server = None
+        url = args.url
+        if url is None:
+            server, url = serve(app)
+        try:
+            results['http'] = run_http(url, cases, args.workers,
+                                       args.duration)
+        finally:
+            if server is not None:
+                server.shutdown()
+        print_table(f'HTTP, {args.workers} workers against {url}',
+                    results['http'])
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+        print(f'\nSaved the baseline to {args.baseline}.')
+        return
+    if not os.path.exists(args.baseline):
+        print(f'\nNo baseline at {args.baseline}; run with --save-baseline.')
+        return
+    with open(args.baseline) as stream:
+        baseline = json.load(stream)
+    if baseline.get('config') != results['config']:
+        print(f"\nWarning: the baseline was taken with {baseline.get('config')}.")
+    problems = regressions(results, baseline, args.tolerance)
+    for problem in problems:
+        print(f'REGRESSION {problem}')
+    if problems:
+        sys.exit(1)
+    print('\nNo regression against the baseline.')
+
+
+if __name__ == '__main__':
+    main()
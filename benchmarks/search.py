@@ -0,0 +1,142 @@
+"""Benchmark of the venue and artist search at a million rows.
+
+Seeds a database (see seed.py) with ``--artists`` artists, a million by
+default, then times searches of a few kinds of terms through each
+search path the database offers: on Postgres the ``search_vector`` GIN
+index and the ``name`` trigram index, and everywhere the in-process
+inverted index other databases fall back to.  Reports p50/p95/p99
+latency and the matches of each term, and the time the inverted index
+takes to build.  On Postgres, the EXPLAIN plan of the genre search is
+printed too, and a term whose plan scans the whole table is reported
+as a SEQ SCAN.  Run from the project root, against a database of its
+own:
+
+    DB_URI=postgresql:///bench python benchmarks/search.py
+    DB_URI=sqlite:///bench.db python benchmarks/search.py --no-seed
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes import percentile  # noqa: E402
+
+# (label, term) of the searches timed, from the words seed.py names
+# venues and artists with.
+TERMS = [
+    ('prefix', 'vel'),
+    ('word', 'velvet'),
+    ('two words', 'velvet austin'),
+    ('genre', 'jazz'),
+    ('city', 'austin'),
+    ('number', '12345'),
+    ('no match', 'zzyzx'),
+]
+
+
+def _time(search, model, term, requests, limit):
+    samples = []
+    total = None
+    for _ in range(requests):
+        started = time.perf_counter()
+        total, _ = search(model, term, limit)
+        samples.append(time.perf_counter() - started)
+    return {
+        'matches': total,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def paths(app):
+    """Return {name: search(model, term, limit)} of the search paths of
+    the application's database."""
+    from search import _inverted_index, _postgres_search
+    from models import db
+
+    def inverted(model, term, limit):
+        ids = _inverted_index(model).search(term)
+        return len(ids), ids[:limit]
+
+    found = {}
+    with app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            found['postgres'] = lambda model, term, limit: \
+                _postgres_search(model, term, limit, 0)
+    found['inverted index'] = inverted
+    return found
+
+
+def plan(app, model, term):
+    """Return the lines of the EXPLAIN plan of the Postgres search of
+    term."""
+    from search import _postgres_query
+    from models import db
+
+    with app.app_context():
+        statement = _postgres_query(model, term).statement.compile(db.engine)
+        rows = db.session.connection().exec_driver_sql(
+            f'EXPLAIN {statement}', statement.params)
+        return [row[0] for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='Reuse the database of a previous run.')
+    parser.add_argument('--requests', type=int, default=20,
+                        help='Timed searches per term and path.')
+    parser.add_argument('--limit', type=int, default=20,
+                        help='Results per page, SEARCH_RESULTS_PER_PAGE.')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    from models import Artist, Venue
+    from search import _inverted_index, reset_index
+    from seed import reset_database, seed
+
+    app = create_app({'JOBS_BACKEND': 'sync'})
+    app.logger.disabled = True
+    if not args.no_seed:
+        reset_database(app)
+        seed(app, venues=args.venues, artists=args.artists, shows=0,
+             seed=args.seed)
+
+    for model in (Artist, Venue):
+        with app.app_context():
+            reset_index(model)
+            started = time.perf_counter()
+            index = _inverted_index(model)
+            print(f'\n{model.__tablename__}: inverted index of '
+                  f'{len(index.documents)} rows built in '
+                  f'{time.perf_counter() - started:.1f}s')
+        print(f"{'path':16} {'term':12} {'matches':>9} {'p50 ms':>9} "
+              f"{'p95 ms':>9} {'p99 ms':>9}")
+        for name, search in paths(app).items():
+            for label, term in TERMS:
+                with app.app_context():
+                    stats = _time(search, model, term, args.requests,
+                                  args.limit)
+                print(f"{name:16} {label:12} {stats['matches']:9} "
+                      f"{stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} "
+                      f"{stats['p99_ms']:9.2f}")
+            if name != 'postgres':
+                continue
+            for label, term in TERMS:
+                lines = plan(app, model, term)
+                if label == 'genre':
+                    print('\n'.join(lines))
+                if any(f'Seq Scan on {model.__tablename__}' in line
+                       for line in lines):
+                    print(f'SEQ SCAN {model.__tablename__} {label} {term!r}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Deterministic seeding of a benchmark database.
+
+The same seed and volumes always produce the same rows, relative to
+the same day: shows are spread evenly around midnight of the run day,
+half of them past and half upcoming.  Rows are written with bulk
+inserts, without going through the application; the stored show counts
+are computed once at the end.  Run from the project root, against a
+database of its own, as the tables are dropped first:
+
+    DB_URI=sqlite:///bench.db python benchmarks/seed.py \\
+        --venues 10000 --artists 100000 --shows 5000000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forms import Genres  # noqa: E402
+
+GENRES = [genre.value for genre in Genres]
+
+# Length of the slot each show is booked in; shows of one slot are at
+# distinct venues and with distinct artists, so none overlap.
+SLOT = timedelta(hours=4)
+
+WORDS = [
+    'Blue', 'Velvet', 'Golden', 'Electric', 'Silver', 'Midnight', 'Crimson',
+    'Wild', 'Hollow', 'Rusty', 'Neon', 'Lucky', 'Paper', 'Iron', 'Quiet',
+    'Broken', 'Northern', 'Little', 'Grand', 'Secret',
+]
+VENUE_KINDS = ['Lounge', 'Hall', 'Room', 'Club', 'Theatre', 'Tavern', 'Den',
+               'Garden', 'Arena', 'Cellar']
+ARTIST_KINDS = ['Band', 'Trio', 'Collective', 'Orchestra', 'Quartet',
+                'Project', 'Ensemble', 'Brothers', 'Sisters', 'Crew']
+CITIES = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+    ('Austin', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'),
+    ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Denver', 'CO'),
+    ('Portland', 'OR'), ('Boston', 'MA'), ('Atlanta', 'GA'),
+]
+
+
+def _name(rng, kinds, number):
+    return f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(kinds)} {number}'
+
+
+def _coprime_step(rng, modulus):
+    """Return a step visiting every residue modulo modulus."""
+    while True:
+        step = rng.randrange(1, max(modulus, 2) * 7) | 1
+        if math.gcd(step, modulus) == 1:
+            return step
+
+
+def generate_owners(rng, count, kinds, venue):
+    """Yield (row, genre names) of count venues or artists."""
+    for number in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        row = {
+            'id': number,
+            'name': _name(rng, kinds, number),
+            'city': city,
+            'state': state,
+            'phone': f'{rng.randrange(200, 999)}-{rng.randrange(100, 999)}-'
+                     f'{rng.randrange(1000, 9999)}',
+            'website_link': f'https://example.com/{number}',
+            'facebook_link': f'https://www.facebook.com/{number}',
+            # no external images: fetching them is not what is measured
+            'image_link': None,
+            'seeking_description': None,
+        }
+        if venue:
+            row['address'] = f'{rng.randrange(1, 2000)} {rng.choice(WORDS)} St'
+            row['seeking_talent'] = rng.random() < 0.3
+        else:
+            row['seeking_venue'] = rng.random() < 0.3
+        yield row, rng.sample(GENRES, rng.randint(1, 3))
+
+
+def generate_shows(rng, count, venues, artists, start):
+    """Yield count show rows, in slots of min(venues, artists) shows."""
+    per_slot = min(venues, artists)
+    venue_step = _coprime_step(rng, venues)
+    artist_step = _coprime_step(rng, artists)
+    for number in range(count):
+        slot_start = start + SLOT * (number // per_slot)
+        start_time = slot_start + timedelta(minutes=15 * rng.randrange(4))
+        yield {
+            'id': number + 1,
+            'venue_id': number * venue_step % venues + 1,
+            'artist_id': number * artist_step % artists + 1,
+            'start_time': start_time,
+            'end_time': start_time + timedelta(minutes=60 * rng.randint(1, 3)),
+        }
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _insert(table, rows, chunk_size):
+    from models import db
+
+    total = 0
+    for chunk in _chunks(rows, chunk_size):
+        db.session.execute(table.insert(), chunk)
+        db.session.commit()
+        total += len(chunk)
+    return total
+
+
+def _insert_owners(model, association, rows, genre_ids, chunk_size):
+    owner_key = f'{model.__tablename__}_id'
+    links = []
+
+    def owner_rows():
+        for row, genres in rows:
+            links.extend({'genre_id': genre_ids[name], owner_key: row['id']}
+                         for name in genres)
+            yield row
+
+    total = 0
+    for chunk in _chunks(owner_rows(), chunk_size):
+        total += _insert(model.__table__, chunk, chunk_size)
+        _insert(association, links, chunk_size)
+        links.clear()
+    return total
+
+
+def reset_database(app):
+    """Drop every table, then create the schema with the migrations.
+
+    The early migrations rely on Postgres telling "Artist" from
+    "artist", so on SQLite the tables are created from the models and
+    stamped with the latest revision instead.
+    """
+    from flask_migrate import stamp, upgrade
+    from models import db, migrate_setup
+
+    migrate_setup(app)
+    directory = os.path.join(app.root_path, 'migrations')
+    with app.app_context():
+        db.drop_all(bind_key=None)
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS alembic_version')
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all(bind_key=None)
+            stamp(directory=directory)
+        else:
+            upgrade(directory=directory)
+
+
+def seed(app, venues=100, artists=1000, shows=5000, seed=0,
+         reference_date=None, chunk_size=5000, log=print):
+    """Fill an empty database with generated venues, artists and shows."""
+    from counters import recount, roll_forward
+    from models import db, Genre, Venue, Artist, venue_genre, artist_genre
+    from search import reset_index
+
+    rng = random.Random(seed)
+    reference = datetime.combine(reference_date or date.today(),
+                                 datetime.min.time())
+    span = SLOT * math.ceil(shows / max(min(venues, artists), 1))
+    with app.app_context():
+        started = time.perf_counter()
+        _insert(Genre.__table__, [{'id': number, 'name': name} for number, name
+                                  in enumerate(GENRES, 1)], chunk_size)
+        genre_ids = {name: number for number, name in enumerate(GENRES, 1)}
+        counts = {
+            'venues': _insert_owners(
+                Venue, venue_genre,
+                generate_owners(rng, venues, VENUE_KINDS, venue=True),
+                genre_ids, chunk_size),
+            'artists': _insert_owners(
+                Artist, artist_genre,
+                generate_owners(rng, artists, ARTIST_KINDS, venue=False),
+                genre_ids, chunk_size),
+        }
+        # the watermark first, so that the counts are taken against it
+        roll_forward(reference)
+        counts['shows'] = _insert(
+            db.metadata.tables['show'],
+            generate_shows(rng, shows, venues, artists, reference - span / 2),
+            chunk_size)
+        if db.engine.dialect.name == 'postgresql':
+            for table in ('genre', 'venue', 'artist', 'show'):
+                db.session.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"coalesce(max(id), 1)) FROM {table}"))
+            db.session.commit()
+        recount(fix=True)
+        reset_index(Venue)
+        reset_index(Artist)
+        log(f'Seeded {counts} in {time.perf_counter() - started:.1f}s.')
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=100)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--date', type=date.fromisoformat,
+                        help='Day the shows are spread around, today if '
+                             'omitted.')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    app = create_app()
+    reset_database(app)
+    seed(app, args.venues, args.artists, args.shows, seed=args.seed,
+         reference_date=args.date, chunk_size=args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
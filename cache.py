@@ -0,0 +1,385 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import current_app, g, request, session
+
+from routing import pinned_to_primary
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+
+class CacheBackend:
+    """Interface of the key/value stores the response cache can use.
+
+    Values are arbitrary picklable objects.  A shared backend (Redis,
+    memcached, ...) lets every worker process see the same entries and
+    the same invalidations.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key):
+        """Atomically increment the integer stored at key and return it."""
+        raise NotImplementedError
+
+    @property
+    def evictions(self):
+        return 0
+
+
+class LRUCache(CacheBackend):
+    """In-process backend bounded both in size (LRU) and in age (TTL).
+
+    Counters are kept apart from the entries and never evicted, since
+    losing a tag version would resurrect the entries it invalidated.
+    """
+
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+
+class RedisCache(CacheBackend):
+    """Shared backend over a redis-py compatible client.
+
+    Any object providing get/mget/set/delete/incr with the redis-py
+    signatures can be passed as ``client``.  Tag versions are stored
+    without expiry, so the server should evict with a ``volatile-*``
+    policy rather than ``allkeys-*``.
+    """
+
+    def __init__(self, client, default_timeout=300, prefix='fyyur:'):
+        self.client = client
+        self.default_timeout = default_timeout
+        self.prefix = prefix
+
+    def _load(self, raw):
+        if raw is None:
+            return None
+        try:
+            return int(raw)
+        except ValueError:
+            return pickle.loads(raw)
+
+    def get(self, key):
+        return self._load(self.client.get(self.prefix + key))
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        return [self._load(raw) for raw in
+                self.client.mget([self.prefix + key for key in keys])]
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        self.client.set(self.prefix + key, pickle.dumps(value),
+                        ex=timeout or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+# ----------------------------------------------------------------------------#
+# Response cache.
+# ----------------------------------------------------------------------------#
+
+
+class ResponseCache:
+    """Cache of rendered GET responses invalidated through tags.
+
+    Each entry remembers the version of every tag it was rendered under
+    (e.g. ``venues`` or ``venue:3``).  ``invalidate`` bumps tag versions,
+    which makes every entry recorded under an older version a miss,
+    without having to know the keys (query strings, pages) of those
+    entries.
+
+    With read replicas, a page rendered just after an invalidation may
+    have been read from a replica lacking the write behind it: tags
+    invalidated in the last ``replica_lag`` seconds are remembered, see
+    ``recently_invalidated``.
+    """
+
+    def __init__(self, backend, timeout=None, replica_lag=0):
+        self.backend = backend
+        self.timeout = timeout
+        self.replica_lag = replica_lag
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def tag_versions(self, tags):
+        tags = sorted(tags)
+        versions = self.backend.get_many([f'tag:{tag}' for tag in tags])
+        return {tag: version or 0 for tag, version in zip(tags, versions)}
+
+    def get(self, key):
+        entry = self.backend.get(f'view:{key}')
+        if entry is None or \
+                self.tag_versions(entry['tags']) != entry['tags']:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['response']
+
+    def set(self, key, response, tags, versions=None):
+        """Store response under tags.
+
+        ``versions`` holds tag versions read before rendering, so that an
+        invalidation racing with the render leaves the entry stale.
+        """
+        versions = dict(versions or {})
+        versions.update(self.tag_versions(set(tags) - set(versions)))
+        self.backend.set(f'view:{key}', {
+            'tags': versions,
+            'response': response,
+        }, self.timeout)
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr(f'tag:{tag}')
+            if self.replica_lag:
+                self.backend.set(f'invalidated:{tag}', True, self.replica_lag)
+        self.invalidations += len(tags)
+
+    def recently_invalidated(self, tags):
+        """Whether any of tags was invalidated in the last replica_lag
+        seconds."""
+        return any(self.backend.get_many(
+            [f'invalidated:{tag}' for tag in tags]))
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+def cache_setup(app):
+    """Create the response cache configured by CACHE_TYPE.
+
+    CACHE_TYPE is 'lru' (per-process, the default), 'redis' (shared,
+    needs the redis package and CACHE_REDIS_URL) or 'null' to disable it.
+    """
+    cache_type = app.config.get('CACHE_TYPE', 'lru')
+    timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    if cache_type == 'null':
+        return None
+    if cache_type == 'redis':
+        import redis
+        backend = RedisCache(redis.Redis.from_url(app.config['CACHE_REDIS_URL']),
+                             default_timeout=timeout)
+    else:
+        backend = LRUCache(max_entries=app.config.get('CACHE_MAX_ENTRIES', 1024),
+                           default_timeout=timeout)
+    replica_lag = app.config.get('DB_READ_AFTER_WRITE_WINDOW', 5) \
+        if app.config.get('DB_REPLICA_URIS') else 0
+    cache = ResponseCache(backend, timeout, replica_lag)
+    app.extensions['response_cache'] = cache
+    return cache
+
+
+# ----------------------------------------------------------------------------#
+# View helpers.
+# ----------------------------------------------------------------------------#
+
+
+def tag_response(*tags):
+    """Add tags to the response being rendered by a cached view.
+
+    Used for data only known while rendering, such as the venues listed
+    on an artist page.
+    """
+    g.setdefault('cache_tags', set()).update(tags)
+
+
+def invalidate(*tags):
+    """Invalidate every cached response rendered under any of tags."""
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.invalidate(*tags)
+
+
+def cached(*tags):
+    """Cache successful GET responses of a view.
+
+    Tags may reference the view arguments, e.g. ``'venue:{venue_id}'``.
+    Requests with pending flash messages bypass the cache, as the
+    rendered page has to show them.  Clients pinned to the primary after
+    a write render the page rather than reading it from the cache, and a
+    page read from a replica right after an invalidation of its tags is
+    not stored, as the replica may not have the write yet.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None or request.method != 'GET' \
+                    or session.get('_flashes'):
+                return view(**kwargs)
+
+            key = request.full_path
+            response = None if pinned_to_primary() else cache.get(key)
+            if response is not None:
+                body, status, headers = response
+                return current_app.response_class(body, status, headers)
+
+            g.cache_tags = {tag.format(**kwargs) for tag in tags}
+            versions = cache.tag_versions(g.cache_tags)
+            response = current_app.make_response(view(**kwargs))
+            if response.status_code == 200 \
+                    and not response.direct_passthrough \
+                    and not (g.get('read_from_replica')
+                             and cache.recently_invalidated(g.cache_tags)):
+                cache.set(key, (response.get_data(), response.status_code,
+                                list(response.headers)),
+                          g.cache_tags, versions)
+            return response
+        return wrapper
+    return decorator
+
+
+# ----------------------------------------------------------------------------#
+# HTTP caching.
+# ----------------------------------------------------------------------------#
+
+
+def no_store(view):
+    """Exclude a view, such as a form, from its blueprint's cache policy."""
+    view.no_store = True
+    return view
+
+
+def last_modified(modified):
+    """Send the Last-Modified of a GET view, and answer 304 Not Modified
+    without running it when nothing changed since the If-Modified-Since
+    of the request.
+
+    modified is called with the view arguments and returns the UTC time
+    of the last change to what the view renders, or None to just render
+    it.  Requests with pending flash messages are always rendered, as
+    by cached.  HTTP dates are to the second, so a page changed within the last
+    second is sent without Last-Modified, which could miss a change
+    later in that second.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # a page with flash messages must be rendered to show them
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(**kwargs)
+            changed = modified(**kwargs)
+            if changed is None \
+                    or datetime.utcnow() - changed < timedelta(seconds=1):
+                return view(**kwargs)
+            changed = changed.replace(microsecond=0, tzinfo=timezone.utc)
+            since = request.if_modified_since
+            if since is not None and changed <= since:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(**kwargs))
+            if response.status_code in (200, 304):
+                response.last_modified = changed
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_policy(blueprint, max_age=None, s_maxage=None,
+                 stale_while_revalidate=None, vary=('Accept-Encoding',)):
+    """Set the Cache-Control and Vary headers of a blueprint's responses.
+
+    Successful GET responses (200, and 304 revalidations) are public for
+    max_age seconds, for s_maxage seconds in shared caches such as a CDN,
+    which may then serve them stale for stale_while_revalidate seconds
+    while refetching.  Without max_age, and for any other response, views
+    marked no_store, and responses rendering or setting session data
+    (flash messages), nothing is stored.
+
+    Flask adds ``Vary: Cookie`` to pages reading the session: clients
+    without a session cookie still share a single cached copy.
+    """
+    directives = [] if max_age is None else ['public', f'max-age={max_age}']
+    if directives and s_maxage is not None:
+        directives.append(f's-maxage={s_maxage}')
+    if directives and stale_while_revalidate is not None:
+        directives.append(f'stale-while-revalidate={stale_while_revalidate}')
+
+    @blueprint.after_request
+    def set_cache_headers(response):
+        view = current_app.view_functions.get(request.endpoint)
+        if not directives or request.method not in ('GET', 'HEAD') \
+                or response.status_code not in (200, 304) \
+                or getattr(view, 'no_store', False) \
+                or session.modified or '_flashes' in session:
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        response.headers['Cache-Control'] = ', '.join(directives)
+        for header in vary:
+            response.vary.add(header)
+        return response
+
+    return set_cache_headers
@@ -3,15 +3,116 @@ import os
 
 load_dotenv()
 
-SECRET_KEY = os.urandom(32)
+# Set SECRET_KEY in production: a random key differs between servers and
+# restarts, signing out every session.
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Enable debug mode with FLASK_DEBUG=1 (or flask run --debug).
+DEBUG = os.environ.get('FLASK_DEBUG') == '1'
+
+# Outside debug mode and tests, the application log goes to LOG_FILE
+# (relative to the working directory); empty to leave it to the server.
+LOG_FILE = os.environ.get('LOG_FILE', 'error.log')
 
 # Connect to the database
 
 
 # IMPLEMENT DATABASE URL -> DB_URI is stored in .env file
-SQLALCHEMY_DATABASE_URI = os.environ['DB_URI']
+SQLALCHEMY_DATABASE_URI = os.environ.get('DB_URI')
+
+# Connection pool, see models.engine_options (ignored for SQLite).
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+# Statement timeout in milliseconds, 0 disables it.
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+# 'session', or 'transaction' when connecting through pgbouncer in
+# transaction pooling mode.
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'session')
+
+# Read replicas, a comma separated list of database URIs.  GET requests
+# and searches read from a healthy replica, unless the client wrote in
+# the last DB_READ_AFTER_WRITE_WINDOW seconds.  A failing replica is
+# ejected for DB_REPLICA_RETRY_AFTER seconds.
+DB_REPLICA_URIS = os.environ.get('DB_REPLICA_URIS')
+DB_READ_AFTER_WRITE_WINDOW = 5
+DB_REPLICA_RETRY_AFTER = 30
+
+# Number of past shows listed per page on the venue and artist pages.
+PAST_SHOWS_PER_PAGE = 12
+
+# Number of shows listed per page on the /shows feed.
+SHOWS_PER_PAGE = 24
+
+# Number of hits listed per page of venue and artist search results.
+SEARCH_RESULTS_PER_PAGE = 20
+
+# Response cache: 'lru' (per process), 'redis' (shared, needs
+# CACHE_REDIS_URL) or 'null' to disable caching.  Several gunicorn
+# workers need 'redis', see gunicorn.conf.py.
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'lru')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_MAX_ENTRIES = 1024
+
+# Rate limits, declared by each blueprint, per client address (behind a
+# proxy, wrap the app in werkzeug's ProxyFix).  Counted per process, or
+# in Redis with the 'redis' CACHE_TYPE.
+RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+
+# Query instrumentation: in debug and testing mode, a request issuing
+# more than QUERY_BUDGET statements, or the same statement
+# REPEATED_QUERY_THRESHOLD times, 'warn's or 'raise's.
+QUERY_BUDGET = 20
+REPEATED_QUERY_THRESHOLD = 5
+QUERY_BUDGET_ACTION = os.environ.get('QUERY_BUDGET_ACTION', 'warn')
+
+# Rows inserted per transaction by bulk imports.
+IMPORT_BATCH_SIZE = 1000
+
+# Shows deleted per transaction when purging a deleted venue or artist.
+PURGE_BATCH_SIZE = 1000
+
+# Rows fetched per server-side cursor round trip by exports.
+EXPORT_CHUNK_SIZE = 1000
+
+# Locale and timezone name of the dates shown on pages.  Show times are
+# stored as local wall-clock times and printed as stored; the timezone
+# only converts aware datetimes and names the zone of the naive ones.
+DATETIME_LOCALE = os.environ.get('DATETIME_LOCALE', 'en')
+DATETIME_TIMEZONE = os.environ.get('DATETIME_TIMEZONE')
+
+# Cache lifetime, in seconds, of the fingerprinted files written by
+# `flask build-assets`.
+ASSETS_MAX_AGE = 365 * 24 * 3600
+
+# Background jobs: 'thread' (run by a thread pool of each web process),
+# 'sqlite' (queued in JOBS_SQLITE_PATH and run by `flask worker`) or
+# 'sync' (run inline, for tests).  Some jobs (purges, show counts)
+# invalidate the response cache, so a separate worker needs the shared
+# 'redis' CACHE_TYPE (or 'null'): 'sqlite' is refused with 'lru'.
+JOBS_BACKEND = os.environ.get('JOBS_BACKEND', 'thread')
+JOBS_SQLITE_PATH = os.environ.get('JOBS_SQLITE_PATH', 'jobs.db')
+JOBS_CONCURRENCY = 4
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_DELAY = 1.0
+
+# Image proxy: thumbnails of the external image links are cached in
+# IMAGE_CACHE_DIR (relative to the app) up to IMAGE_CACHE_MAX_BYTES.
+# Links resolving to private addresses are refused unless
+# IMAGE_PROXY_ALLOW_PRIVATE is set (for a local stand-in server).
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', 'image_cache')
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_FETCH_TIMEOUT = 5
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_MAX_AGE = 365 * 24 * 3600
+IMAGE_PROXY_ALLOW_PRIVATE = bool(os.environ.get('IMAGE_PROXY_ALLOW_PRIVATE'))
+IMAGE_PROXY_KEY = os.environ.get('IMAGE_PROXY_KEY')
+
+# Budget, in milliseconds, of a cold start: from the first import to the
+# response of the first request, see `flask startup-profile`.
+STARTUP_BUDGET_MS = int(os.environ.get('STARTUP_BUDGET_MS', 2000))
@@ -0,0 +1,125 @@
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select, update
+
+from cache import invalidate
+from jobs import job
+from models import (db, Venue, Artist, Show, CounterWatermark,
+                    shows_watermark)
+
+
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+# Seconds between roll forwards, the most the listed counts lag behind.
+ROLL_INTERVAL = 60
+
+
+def roll_forward(now=None):
+    """Move the shows which started since the last roll forward from the
+    upcoming to the past counts of their venue and artist, and return
+    how many moved.
+
+    Runs in one transaction holding the watermark row, so bookings made
+    meanwhile wait and are counted against the new watermark.
+    """
+    now = now or datetime.now()
+    connection = db.session.connection()
+    rolled_at = shows_watermark(connection, for_update=True)
+    if now <= rolled_at:
+        db.session.rollback()
+        return 0
+    moved = 0
+    for model, fk in OWNERS:
+        started = (select(fk, func.count(Show.id))
+                   .where(Show.start_time > rolled_at, Show.start_time <= now)
+                   .group_by(fk)
+                   .order_by(fk))
+        for owner_id, count in connection.execute(started).all():
+            connection.execute(
+                update(model.__table__)
+                .where(model.id == owner_id)
+                .values(upcoming_shows_count=model.upcoming_shows_count - count,
+                        past_shows_count=model.past_shows_count + count))
+            moved += count
+    if rolled_at == datetime.min:
+        connection.execute(insert(CounterWatermark)
+                           .values(name='shows', rolled_at=now))
+    else:
+        connection.execute(update(CounterWatermark)
+                           .where(CounterWatermark.name == 'shows')
+                           .values(rolled_at=now))
+    db.session.commit()
+    return moved // len(OWNERS)
+
+
+def recount(fix=False):
+    """Compare the stored show counts with counts of the show table, and
+    return the drifted rows as (model, id, stored, actual) tuples, the
+    counts being (upcoming, past) pairs.
+
+    With fix, the drifted rows are set to the actual counts.  The
+    watermark row is held meanwhile, so no show is counted in between.
+    """
+    connection = db.session.connection()
+    rolled_at = shows_watermark(connection, for_update=fix)
+    drifted = []
+    for model, fk in OWNERS:
+        actual = (select(fk.label('owner_id'),
+                         func.count(Show.id).filter(
+                             Show.start_time > rolled_at).label('upcoming'),
+                         func.count(Show.id).filter(
+                             Show.start_time <= rolled_at).label('past'))
+                  .group_by(fk)
+                  .subquery())
+        upcoming = func.coalesce(actual.c.upcoming, 0)
+        past = func.coalesce(actual.c.past, 0)
+        rows = connection.execute(
+            select(model.id, model.upcoming_shows_count,
+                   model.past_shows_count, upcoming, past)
+            .outerjoin(actual, actual.c.owner_id == model.id)
+            .where((model.upcoming_shows_count != upcoming)
+                   | (model.past_shows_count != past))
+            .order_by(model.id)).all()
+        for owner_id, stored_upcoming, stored_past, \
+                actual_upcoming, actual_past in rows:
+            drifted.append((model, owner_id, (stored_upcoming, stored_past),
+                            (actual_upcoming, actual_past)))
+            if fix:
+                connection.execute(
+                    update(model.__table__)
+                    .where(model.id == owner_id)
+                    .values(upcoming_shows_count=actual_upcoming,
+                            past_shows_count=actual_past))
+    if fix:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return drifted
+
+
+@job('shows.roll_forward', every=ROLL_INTERVAL)
+def roll_forward_job():
+    if roll_forward():
+        invalidate('venues')
+
+
+@click.command('recount')
+@click.option('--fix', is_flag=True,
+              help='Set the drifted counts to the actual ones.')
+@with_appcontext
+def recount_command(fix):
+    """Check the stored upcoming and past show counts."""
+    drifted = recount(fix=fix)
+    for model, owner_id, stored, actual in drifted:
+        click.echo(f'{model.__tablename__} {owner_id}: stored '
+                   f'{stored[0]} upcoming / {stored[1]} past, actual '
+                   f'{actual[0]} upcoming / {actual[1]} past', err=True)
+    if not drifted:
+        click.echo('Show counts are consistent.')
+    elif fix:
+        click.echo(f'Fixed the show counts of {len(drifted)} rows.')
+    else:
+        raise click.ClickException(
+            f'{len(drifted)} rows drifted; run flask recount --fix.')
@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import sys
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Boolean, DateTime, Integer, case, select
+
+from models import db, Venue, Artist, Show, venue_genre, artist_genre
+from queries import genres_column
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+
+# Columns of the tombstones of deleted rows, see export_statement.
+TOMBSTONE_COLUMNS = {'id', 'deleted_at', 'updated_at'}
+
+
+def export_statement(kind, after_id=None, changed_since=None):
+    """Return the select of one export, ordered by id.
+
+    For incremental exports, after_id restricts the export to rows
+    created after that id, and changed_since to the rows created,
+    edited or deleted since that UTC time, on updated_at.  Deleted
+    venues and artists are left out, and so are their shows; with
+    changed_since they come out as tombstones instead: id, deleted_at
+    and updated_at set, the other columns empty.  A show is a tombstone
+    when its venue or artist was deleted; once purged, it is only
+    implied by theirs.
+    """
+    model = {'venues': Venue, 'artists': Artist, 'shows': Show}[kind]
+    columns = list(model.__table__.columns)
+    if kind == 'venues':
+        columns.append(genres_column(Venue, venue_genre))
+    elif kind == 'artists':
+        columns.append(genres_column(Artist, artist_genre))
+    if kind == 'shows':
+        deleted_at = case((Venue.deleted_at.isnot(None), Venue.deleted_at),
+                          else_=Artist.deleted_at)
+        columns.append(deleted_at.label('deleted_at'))
+    else:
+        deleted_at = model.deleted_at
+    if changed_since is not None:
+        columns = [column if column.name in TOMBSTONE_COLUMNS
+                   else case((deleted_at.is_(None), column))
+                   .label(column.name)
+                   for column in columns]
+    statement = select(*columns).order_by(model.id)
+    if kind == 'shows':
+        statement = (statement
+                     .join(Venue, Venue.id == Show.venue_id)
+                     .join(Artist, Artist.id == Show.artist_id))
+    if changed_since is None:
+        statement = statement.where(deleted_at.is_(None))
+    elif kind == 'shows':
+        statement = statement.where(
+            (Show.updated_at >= changed_since)
+            | (Venue.deleted_at.isnot(None)
+               & (Venue.updated_at >= changed_since))
+            | (Artist.deleted_at.isnot(None)
+               & (Artist.updated_at >= changed_since)))
+    else:
+        statement = statement.where(model.updated_at >= changed_since)
+    if after_id is not None:
+        statement = statement.where(model.id > after_id)
+    return statement
+
+
+def iter_rows(statement, chunk_size=1000):
+    """Yield the rows of statement as dicts through a server-side cursor,
+    holding at most chunk_size rows in memory."""
+    result = db.session.execute(
+        statement.execution_options(stream_results=True,
+                                    yield_per=chunk_size))
+    for row in result.mappings():
+        yield dict(row)
+
+
+def _chunks(rows, chunk_size):
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _plain(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat(sep=' ')
+    return value
+
+
+# ----------------------------------------------------------------------------#
+# Writers.
+# ----------------------------------------------------------------------------#
+
+
+def write_csv(rows, fields, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for chunk in _chunks(rows, chunk_size):
+        writer.writerows({key: _plain(value) for key, value in row.items()}
+                         for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def write_ndjson(rows, chunk_size):
+    for chunk in _chunks(rows, chunk_size):
+        lines = []
+        for row in chunk:
+            row = {key: _plain(value) for key, value in row.items()}
+            if 'genres' in row:
+                row['genres'] = row['genres'].split(',') \
+                    if row['genres'] else []
+            lines.append(json.dumps(row))
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Writable file object whose content is drained chunk by chunk."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.extend(data)
+        return len(data)
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _arrow_schema(pa, statement):
+    types = []
+    for column in statement.selected_columns:
+        if isinstance(column.type, Integer):
+            types.append((column.name, pa.int64()))
+        elif isinstance(column.type, Boolean):
+            types.append((column.name, pa.bool_()))
+        elif isinstance(column.type, DateTime):
+            types.append((column.name, pa.timestamp('us')))
+        else:
+            types.append((column.name, pa.string()))
+    return pa.schema(types)
+
+
+def _write_arrow(rows, statement, chunk_size, open_writer):
+    import pyarrow as pa
+
+    schema = _arrow_schema(pa, statement)
+    sink = _ChunkSink()
+    writer = open_writer(sink, schema)
+    for chunk in _chunks(rows, chunk_size):
+        writer.write_batch(pa.RecordBatch.from_pylist(chunk, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def write_parquet(rows, statement, chunk_size):
+    import pyarrow.parquet as pq
+    return _write_arrow(rows, statement, chunk_size, pq.ParquetWriter)
+
+
+def write_arrow(rows, statement, chunk_size):
+    import pyarrow as pa
+    return _write_arrow(rows, statement, chunk_size, pa.ipc.new_stream)
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def export(kind, format, after_id=None, chunk_size=1000, changed_since=None):
+    """Return a generator of the encoded chunks of an export, see
+    export_statement.
+
+    Parquet and Arrow need the optional pyarrow package.
+    """
+    statement = export_statement(kind, after_id, changed_since)
+    rows = iter_rows(statement, chunk_size)
+    if format == 'csv':
+        return write_csv(rows, [column.name for column in
+                                statement.selected_columns], chunk_size)
+    if format == 'ndjson':
+        return write_ndjson(rows, chunk_size)
+    if format == 'parquet':
+        return write_parquet(rows, statement, chunk_size)
+    if format == 'arrow':
+        return write_arrow(rows, statement, chunk_size)
+    raise ValueError(f'unknown export format {format!r}')
+
+
+# ----------------------------------------------------------------------------#
+# Command.
+# ----------------------------------------------------------------------------#
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'format', type=click.Choice(list(FORMATS)),
+              default='csv', show_default=True)
+@click.option('--after-id', type=int,
+              help='Only export rows created after this id.')
+@click.option('--changed-since', type=click.DateTime(),
+              help='Only export rows created, edited or deleted since '
+                   'this UTC time, deleted ones as tombstones: the start '
+                   'of the previous export, less a margin for the '
+                   'transactions then in progress.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False),
+              help='Output file, standard output if omitted.')
+@click.option('--chunk-size', default=1000, show_default=True)
+@with_appcontext
+def export_command(kind, format, after_id, changed_since, output, chunk_size):
+    """Stream venues, artists or shows as CSV, JSON lines, Parquet or Arrow."""
+    try:
+        chunks = export(kind, format, after_id, chunk_size, changed_since)
+    except ImportError:
+        raise click.UsageError(f'The {format} format needs pyarrow installed.')
+    stream = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
@@ -3,13 +3,14 @@ from fabric.contrib.console import confirm
 
 # prepare for deployment
 
+# The benchmarks seed a database of their own, never the app's.
+BENCHMARK = "DB_URI=sqlite:///bench.db python benchmarks/routes.py"
+
 
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
-    if result.failed and not confirm("Tests failed. Continue?"):
+        result = local(BENCHMARK, capture=True)
+    if result.failed and not confirm("Benchmarks regressed. Continue?"):
         abort("Aborted at user request.")
 
 
@@ -39,9 +40,7 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    local('heroku run "{} --workers 0"'.format(BENCHMARK))
 
 
 def deploy():
@@ -0,0 +1,85 @@
+from datetime import datetime
+from functools import lru_cache
+
+from flask import current_app
+
+
+# Named formats of the datetime filter; any other format is used as a
+# babel (CLDR) pattern.
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+# ----------------------------------------------------------------------------#
+# Formatting.
+# ----------------------------------------------------------------------------#
+
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format, locale):
+    """Return the parsed babel pattern and Locale of (format, locale)."""
+    # babel is imported on the first use, not at startup
+    from babel import Locale
+    from babel.dates import parse_pattern
+
+    return parse_pattern(PATTERNS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=32)
+def _timezone(name):
+    from babel.dates import get_timezone
+
+    return get_timezone(name)
+
+
+def _parse(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        import dateutil.parser
+
+        return dateutil.parser.parse(value)
+
+
+@lru_cache(maxsize=4096)
+def _format(value, tzinfo, format, locale, display_timezone):
+    # tzinfo is part of the key only: aware datetimes of the same instant
+    # in different zones compare equal but may not format the same.
+    if isinstance(value, str):
+        value = _parse(value)
+    if display_timezone is not None:
+        zone = _timezone(display_timezone)
+        if value.tzinfo is not None:
+            value = value.astimezone(zone)
+        elif hasattr(zone, 'localize'):
+            # pytz zones, which babel returns when pytz is installed
+            value = zone.localize(value)
+        else:
+            value = value.replace(tzinfo=zone)
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=None, tzinfo=None):
+    """Format a datetime (or an ISO 8601 string) for display.
+
+    ``locale`` and ``tzinfo`` (a timezone name) default to the
+    DATETIME_LOCALE and DATETIME_TIMEZONE settings.  Naive datetimes, as
+    show times are stored, are local wall-clock times: they are taken as
+    times of that timezone, and only aware datetimes are converted to
+    it.  Results are memoized, as a page formats
+    the same few timestamps over and over.
+    """
+    if value is None:
+        return ''
+    config = current_app.config
+    locale = locale or config.get('DATETIME_LOCALE', 'en')
+    tzinfo = tzinfo or config.get('DATETIME_TIMEZONE')
+    return _format(value, getattr(value, 'tzinfo', None), format, locale,
+                   tzinfo)
+
+
+def filters_setup(app):
+    app.jinja_env.filters['datetime'] = format_datetime
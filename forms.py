@@ -1,14 +1,17 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
 from flask_wtf import Form
 from wtforms import (StringField, SelectField,
                      SelectMultipleField, DateTimeField,
-                     BooleanField)
-from wtforms.validators import DataRequired, AnyOf, URL, Regexp, Optional
+                     BooleanField, IntegerField)
+from wtforms.validators import (DataRequired, AnyOf, URL, Regexp, Optional,
+                                NumberRange)
 
 import enum
 from markupsafe import escape
 
+from models import Genre, MAX_SHOW_DURATION
+
 
 class Genres(enum.Enum):
     Blues = 'Blues'
@@ -60,11 +63,35 @@ def enum_field_options(enum):
         try:
             return enum[name]
         except KeyError:
-            raise ValueError(name)
+            # options render their label (e.g. 'Hip-Hop') as the value
+            return enum(name)
 
     return {'choices': [(v, escape(v)) for v in enum], 'coerce': coerce}
 
 
+class GenresField(SelectMultipleField):
+    """Multiple select of Genres bound to a model's genres relationship.
+
+    Loads its data from Genre rows and writes the selection back as Genre
+    rows, creating any that do not exist yet.
+    """
+
+    def __init__(self, label=None, validators=None, **kwargs):
+        kwargs.update(enum_field_options(Genres))
+        super().__init__(label, validators, **kwargs)
+
+    def process_data(self, value):
+        if value:
+            names = (getattr(genre, 'name', genre) for genre in value)
+            value = [Genres(name) for name in names
+                     if name in Genres._value2member_map_]
+        super().process_data(value)
+
+    def populate_obj(self, obj, name):
+        setattr(obj, name,
+                Genre.from_names(genre.value for genre in self.data or []))
+
+
 class ShowForm(Form):
     artist_id = StringField(
         'artist_id'
@@ -77,6 +104,16 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(
+            min=1, max=MAX_SHOW_DURATION // timedelta(minutes=1))],
+        default=120
+    )
+
+    @property
+    def end_time(self):
+        return self.start_time.data + timedelta(minutes=self.duration.data)
 
 
 class VenueForm(Form):
@@ -155,9 +192,8 @@ class VenueForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
-        'genres', validators=[DataRequired()],
-        **enum_field_options(Genres)
+    genres = GenresField(
+        'genres', validators=[DataRequired()]
     )
     facebook_link = StringField(
         'facebook_link', validators=[Optional(), URL()]
@@ -246,9 +282,8 @@ class ArtistForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
-        'genres', validators=[DataRequired()],
-        **enum_field_options(Genres)
+    genres = GenresField(
+        'genres', validators=[DataRequired()]
     )
     facebook_link = StringField(
         'facebook_link', validators=[Optional(), URL()]
@@ -0,0 +1,82 @@
+# ----------------------------------------------------------------------------#
+# Gunicorn settings: gunicorn -c gunicorn.conf.py
+# ----------------------------------------------------------------------------#
+
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+
+# Requests mostly wait on the database, so each worker process serves
+# several requests on threads.  Every thread may hold a database
+# connection: keep DB_POOL_SIZE at least GUNICORN_THREADS, and
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the server's
+# max_connections.
+#
+# The response cache and the rate-limit counters are kept per process
+# unless CACHE_TYPE is 'redis': with several workers, a write would
+# only invalidate the pages cached by the worker handling it, and each
+# worker would let a client through up to the whole limit.  Without
+# Redis there is one worker by default, and more are refused, see
+# on_starting.
+shared_state = os.environ.get('CACHE_TYPE', 'lru') == 'redis'
+workers = int(os.environ.get('GUNICORN_WORKERS',
+                             multiprocessing.cpu_count() * 2 + 1
+                             if shared_state else 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the application once in the master: workers share its code and
+# data copy-on-write, and start faster.  The engines' pooled
+# connections are dropped in each worker after the fork, see
+# models.dispose_engines.
+preload_app = True
+
+# Recycle workers now and then, bounding leaks; the jitter keeps them
+# from all restarting at once.
+max_requests = 2000
+max_requests_jitter = 200
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    if server.cfg.workers <= 1:
+        return
+    from ratelimit import MemoryCounter
+    app = server.app.wsgi()
+    per_process = []
+    if app.config.get('CACHE_TYPE') == 'lru':
+        per_process.append("the 'lru' response cache")
+    if isinstance(app.extensions.get('rate_limiter'), MemoryCounter):
+        per_process.append('the in-memory rate-limit counters')
+    if per_process:
+        raise RuntimeError(
+            f"{' and '.join(per_process)} would be per worker: set "
+            f"CACHE_TYPE=redis and CACHE_REDIS_URL to run "
+            f"{server.cfg.workers} workers, or GUNICORN_WORKERS=1")
+
+
+# SIGHUP rereads this file and replaces the workers, letting the old
+# ones finish their requests for up to graceful_timeout seconds.  As
+# the application is preloaded, new workers fork from the code already
+# in the master: to deploy new code, send USR2 (start a new master)
+# then QUIT to the old master, or restart the service.
+def on_reload(server):
+    server.log.info('Reloading: replacing the workers gracefully.')
+
+
+def worker_exit(server, worker):
+    # the thread job backend runs jobs in the worker: finish them
+    app = server.app.wsgi()
+    queue = app.extensions.get('jobs')
+    if queue is not None and queue._worker is not None \
+            and queue._worker_pid == os.getpid():
+        queue._worker.stop()
+        queue._worker.join()
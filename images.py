@@ -0,0 +1,420 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from flask import Blueprint, abort, current_app, send_file, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from jobs import job
+from models import db, Venue, Artist
+
+
+images = Blueprint('images', __name__, url_prefix='/images')
+
+# Thumbnail bounding boxes (width, height).  Tiles show images at most
+# 200px high in a third of the container; the -2x sizes are for high
+# density screens.
+SIZES = {
+    'tile': (360, 200),
+    'tile-2x': (720, 400),
+    'detail': (570, 500),
+    'detail-2x': (1140, 1000),
+}
+
+
+class ImageFetchError(Exception):
+    """Raised when a source image cannot be fetched or decoded."""
+
+
+# ----------------------------------------------------------------------------#
+# Disk cache.
+# ----------------------------------------------------------------------------#
+
+
+class DiskCache:
+    """Files under ``directory`` bounded to ``max_bytes`` in total.
+
+    Reads bump the access time of a file, and the least recently used
+    files are removed once the total size goes over the bound.
+    Writes are atomic, so several processes can share the directory.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, name):
+        """Return the path of a cached file, or None."""
+        path = self.path(name)
+        try:
+            # set explicitly, as the filesystem may not track access times
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def set(self, name, content):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as stream:
+            stream.write(content)
+        os.replace(temporary, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._files())
+            else:
+                self._size += len(content)
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def _files(self):
+        for directory, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_atime, stat.st_size, path
+
+    def _evict(self):
+        # down to 90%, so that evictions do not run on every write
+        files = sorted(self._files())
+        self._size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.evictions += 1
+
+
+# ----------------------------------------------------------------------------#
+# Fetching and resizing.
+# ----------------------------------------------------------------------------#
+
+
+# Redirects followed by fetch before giving up.
+MAX_REDIRECTS = 5
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to the address it is given, whatever its host resolves
+    to by then, and still sends the host in the Host header."""
+
+    def __init__(self, host, port, address, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port),
+                                             self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """_PinnedHTTPConnection over TLS, checking the certificate of the
+    host."""
+
+    def __init__(self, host, port, address, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port),
+                                        self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def _is_public(address):
+    return ipaddress.ip_address(address).is_global
+
+
+def _resolve(url, allow_private):
+    """Return the address to connect to for url, refusing hosts that
+    resolve to a private, loopback or link-local address."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ImageFetchError(f'not an http(s) URL: {url!r}')
+    try:
+        addresses = [info[4][0] for info in
+                     socket.getaddrinfo(parts.hostname, parts.port or None,
+                                        type=socket.SOCK_STREAM)]
+    except (socket.gaierror, ValueError) as error:
+        raise ImageFetchError(f'cannot resolve {parts.hostname}: {error}')
+    if not addresses:
+        raise ImageFetchError(f'cannot resolve {parts.hostname}')
+    if not allow_private and not all(map(_is_public, addresses)):
+        raise ImageFetchError(f'{parts.hostname} is not a public host')
+    return addresses[0]
+
+
+def fetch(url, timeout=5, max_bytes=10 * 1024 * 1024, allow_private=False):
+    """Download an image, refusing other content and oversized bodies.
+
+    The host is resolved once per request and the connection made to
+    the address checked, so that a DNS answer changed in between cannot
+    point it to a private host; redirects are followed by hand, up to
+    MAX_REDIRECTS, each location checked the same way.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        address = _resolve(url, allow_private)
+        parts = urlsplit(url)
+        connection_class = (_PinnedHTTPSConnection if parts.scheme == 'https'
+                            else _PinnedHTTPConnection)
+        connection = connection_class(parts.hostname, parts.port, address,
+                                      timeout=timeout)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        try:
+            connection.request('GET', path,
+                               headers={'User-Agent': 'Fyyur image proxy'})
+            response = connection.getresponse()
+            if response.status in REDIRECT_STATUSES:
+                location = response.getheader('Location')
+                if not location:
+                    raise ImageFetchError(f'{url} redirects nowhere')
+                url = urljoin(url, location)
+                continue
+            if response.status != 200:
+                raise ImageFetchError(f'cannot fetch {url}: HTTP '
+                                      f'{response.status}')
+            content_type = response.getheader('Content-Type', '')
+            if not content_type.startswith('image/'):
+                raise ImageFetchError(f'{url} is {content_type!r}, '
+                                      f'not an image')
+            content = response.read(max_bytes + 1)
+        except (OSError, http.client.HTTPException) as error:
+            raise ImageFetchError(f'cannot fetch {url}: {error}')
+        finally:
+            connection.close()
+        if len(content) > max_bytes:
+            raise ImageFetchError(f'{url} is larger than {max_bytes} bytes')
+        return content, content_type
+    raise ImageFetchError(f'{url}: more than {MAX_REDIRECTS} redirects')
+
+
+def thumbnails(content, sizes):
+    """Return {size: (bytes, mimetype)} of the image scaled down to fit
+    each bounding box.
+
+    Needs Pillow; without it every size is the original image.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        source = Image.open(io.BytesIO(content))
+        source.load()
+    except Exception as error:
+        raise ImageFetchError(f'cannot decode image: {error}')
+    transparent = source.mode in ('RGBA', 'LA') or \
+        'transparency' in source.info
+    results = {}
+    for size, box in sizes.items():
+        image = source.copy()
+        image.thumbnail(box)
+        output = io.BytesIO()
+        if transparent:
+            image.save(output, 'PNG', optimize=True)
+            results[size] = output.getvalue(), 'image/png'
+        else:
+            image.convert('RGB').save(output, 'JPEG', quality=85,
+                                      optimize=True, progressive=True)
+            results[size] = output.getvalue(), 'image/jpeg'
+    return results
+
+
+# ----------------------------------------------------------------------------#
+# Proxy.
+# ----------------------------------------------------------------------------#
+
+
+EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg'}
+
+
+class ImageProxy:
+    """Thumbnails of external images, fetched once per source URL.
+
+    Every size is generated on the first request for any of them.  A
+    source that fails is not fetched again for ``retry_after`` seconds.
+    """
+
+    def __init__(self, cache, timeout=5, max_bytes=10 * 1024 * 1024,
+                 allow_private=False, retry_after=300):
+        self.cache = cache
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.allow_private = allow_private
+        self.retry_after = retry_after
+        self.fetches = 0
+        self._failures = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _find(self, digest, size):
+        for mimetype, extension in EXTENSIONS.items():
+            path = self.cache.get(f'{digest}-{size}.{extension}')
+            if path is not None:
+                return path, mimetype
+        return None
+
+    def get(self, url, size):
+        """Return (path, mimetype) of a thumbnail of url."""
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        found = self._find(digest, size)
+        if found:
+            return found
+        with self._lock:
+            lock = self._locks.setdefault(digest, threading.Lock())
+        with lock:
+            # another request may have generated it meanwhile
+            found = self._find(digest, size)
+            if found:
+                return found
+            failed_until = self._failures.get(digest, 0)
+            if failed_until > time.monotonic():
+                raise ImageFetchError(f'{url} failed recently')
+            try:
+                self._generate(url, digest)
+            except ImageFetchError:
+                with self._lock:
+                    self._failures[digest] = \
+                        time.monotonic() + self.retry_after
+                    if len(self._failures) > 10000:
+                        self._failures.clear()
+                raise
+            finally:
+                with self._lock:
+                    self._locks.pop(digest, None)
+            return self._find(digest, size)
+
+    def prefetch(self, url):
+        """Generate the thumbnails of url ahead of their first request."""
+        self.get(url, next(iter(SIZES)))
+
+    def _generate(self, url, digest):
+        self.fetches += 1
+        content, content_type = fetch(url, self.timeout, self.max_bytes,
+                                      self.allow_private)
+        results = thumbnails(content, SIZES)
+        if results is None:
+            if content_type not in EXTENSIONS:
+                raise ImageFetchError(f'cannot resize {content_type} '
+                                      f'without Pillow')
+            results = {size: (content, content_type) for size in SIZES}
+        for size, (data, mimetype) in results.items():
+            self.cache.set(f'{digest}-{size}.{EXTENSIONS[mimetype]}', data)
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config.get('IMAGE_PROXY_KEY')
+                             or current_app.config['SECRET_KEY'],
+                             salt='image-proxy')
+
+
+def image_url(link, size='tile'):
+    """Return the proxied URL of an external image at one of SIZES.
+
+    URLs are signed, so that the proxy only fetches the links the site
+    rendered.
+    """
+    if not link:
+        return link
+    return url_for('images.thumbnail', size=size,
+                   token=_serializer().dumps(link))
+
+
+@images.route('/<any(' + ', '.join(repr(size) for size in SIZES)
+              + '):size>/<token>')
+def thumbnail(size, token):
+    try:
+        link = _serializer().loads(token)
+    except BadSignature:
+        abort(404)
+    proxy = current_app.extensions['image_proxy']
+    try:
+        path, mimetype = proxy.get(link, size)
+    except ImageFetchError as error:
+        current_app.logger.warning(f'image proxy: {error}')
+        abort(502)
+    # the token embeds the source URL, so a URL always has the same image
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get(
+        'IMAGE_MAX_AGE', 31536000)
+    response.cache_control.immutable = True
+    return response
+
+
+def images_setup(app):
+    """Serve resized copies of external images under /images, see
+    image_url."""
+    cache = DiskCache(os.path.join(app.root_path,
+                                   app.config.get('IMAGE_CACHE_DIR',
+                                                  'image_cache')),
+                      app.config.get('IMAGE_CACHE_MAX_BYTES',
+                                     512 * 1024 * 1024))
+    app.extensions['image_proxy'] = ImageProxy(
+        cache,
+        timeout=app.config.get('IMAGE_FETCH_TIMEOUT', 5),
+        max_bytes=app.config.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024),
+        allow_private=app.config.get('IMAGE_PROXY_ALLOW_PRIVATE', False))
+    app.jinja_env.globals['image_url'] = image_url
+    app.register_blueprint(images)
+
+
+# ----------------------------------------------------------------------------#
+# Events.
+# ----------------------------------------------------------------------------#
+
+# Queued by the create and edit views once committed: the thumbnails of
+# a new or changed image_link are generated in the background rather
+# than by the first page view showing them.
+
+
+def _prefetch(model, owner_id):
+    owner = db.session.get(model, owner_id)
+    if owner is None or not owner.image_link:
+        return
+    try:
+        current_app.extensions['image_proxy'].prefetch(owner.image_link)
+    except ImageFetchError as error:
+        # not retried: the proxy does not fetch a failed source again
+        # for its retry_after anyway
+        current_app.logger.warning(f'image proxy: {error}')
+
+
+@job('venue.created')
+@job('venue.updated')
+def prefetch_venue_image(venue_id):
+    _prefetch(Venue, venue_id)
+
+
+@job('artist.created')
+@job('artist.updated')
+def prefetch_artist_image(artist_id):
+    _prefetch(Artist, artist_id)
@@ -0,0 +1,352 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from werkzeug.datastructures import MultiDict
+
+from models import (db, Venue, Artist, Show, Genre, venue_genre, artist_genre,
+                    adjust_show_counts)
+from cache import invalidate
+from search import reset_index
+from queries import booked_shows
+
+
+# ----------------------------------------------------------------------------#
+# Readers.
+# ----------------------------------------------------------------------------#
+
+
+def read_csv(stream):
+    """Yield rows of a CSV file with a header line.
+
+    Multi-valued columns (genres) hold their values separated by commas.
+    """
+    for row in csv.DictReader(stream):
+        if row.get('genres'):
+            row['genres'] = [genre.strip() for genre in
+                             row['genres'].split(',') if genre.strip()]
+        yield row
+
+
+class InvalidRow:
+    """Stands for a row a reader could not decode, with the errors
+    reported for it."""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+
+def read_ndjson(stream):
+    """Yield rows of a JSON lines file, one JSON object per line.
+
+    Lines that are not JSON objects are yielded as InvalidRow.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield InvalidRow({'row': [f'Not valid JSON: {error}.']})
+            continue
+        if isinstance(row, dict):
+            yield row
+        else:
+            yield InvalidRow({'row': ['Not a JSON object.']})
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+# ----------------------------------------------------------------------------#
+# Import.
+# ----------------------------------------------------------------------------#
+
+
+class ImportReport:
+    """Outcome of an import: inserted row count and per-row errors.
+
+    Only the first ``max_errors`` errors are kept, so that a file of
+    invalid rows does not grow the report without bound.
+    """
+
+    def __init__(self, max_errors=1000):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def error(self, row_number, messages):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'errors': messages})
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def _form_errors(form):
+    return {field: list(errors) for field, errors in form.errors.items()}
+
+
+def _validate(form_class, row):
+    formdata = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            formdata.setlist(key, [str(item) for item in value])
+        elif value is not None:
+            formdata[key] = value
+    form = form_class(formdata=formdata, meta={'csrf': False})
+    return form, form.validate()
+
+
+def _insert_rows(table, rows):
+    """Insert rows into table and return their primary keys, for the
+    association rows to reference.
+
+    On PostgreSQL the keys are drawn from the table's sequence first, so
+    that the rows go in with one executemany.  Other databases insert
+    the rows one by one and return the keys they assigned: reserving
+    max(id) + 1 onwards would hand the same keys to a concurrent import
+    or create.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return [db.session.execute(table.insert(), values)
+                .inserted_primary_key[0] for values in rows]
+    ids = list(db.session.execute(
+        select(func.nextval(f'{table.name}_id_seq'))
+        .select_from(func.generate_series(1, len(rows)))).scalars())
+    for values, row_id in zip(rows, ids):
+        values['id'] = row_id
+    db.session.execute(table.insert(), rows)
+    return ids
+
+
+class _GenreResolver:
+    """Maps genre names to ids, creating unknown genres as they appear."""
+
+    def __init__(self):
+        self.ids = dict(db.session.execute(select(Genre.name, Genre.id)).all())
+
+    def __call__(self, names):
+        missing = [name for name in dict.fromkeys(names)
+                   if name not in self.ids]
+        if missing:
+            created = Genre.from_names(missing)
+            db.session.flush()
+            self.ids.update((genre.name, genre.id) for genre in created)
+        return [self.ids[name] for name in names]
+
+
+def _import_owner_batch(model, association, batch, genres):
+    """Insert validated venue or artist rows with their genres."""
+    ids = _insert_rows(model.__table__, [values for values, _ in batch])
+    owner_key = f'{model.__tablename__}_id'
+    links = []
+    for owner_id, (_, names) in zip(ids, batch):
+        links.extend({'genre_id': genre_id, owner_key: owner_id}
+                     for genre_id in genres(names))
+    if links:
+        db.session.execute(association.insert(), links)
+
+
+def _import_show_batch(batch, report):
+    """Insert validated show rows whose artist and venue exist and are
+    free for the length of the show."""
+    artist_ids = {values['artist_id'] for _, values in batch}
+    venue_ids = {values['venue_id'] for _, values in batch}
+    known_artists = set(db.session.execute(
+        select(Artist.id).where(Artist.id.in_(artist_ids),
+                                Artist.deleted_at.is_(None))).scalars())
+    known_venues = set(db.session.execute(
+        select(Venue.id).where(Venue.id.in_(venue_ids),
+                               Venue.deleted_at.is_(None))).scalars())
+
+    # (kind, id) -> shows of the venues and artists of the batch which
+    # overlap its slots, fetched at once and checked row by row
+    existing = {}
+    slots = [(values['start_time'], values['end_time'])
+             for _, values in batch]
+    if slots:
+        for show in booked_shows(known_venues, known_artists,
+                                 min(start for start, _ in slots),
+                                 max(end for _, end in slots)):
+            kind = show['conflict']
+            existing.setdefault((kind, show[f'{kind}_id']), []).append(show)
+
+    rows = []
+    # (kind, id) -> [(start_time, end_time)] of the rows accepted so far,
+    # which are not in the database yet
+    booked = {}
+    for row_number, values in batch:
+        messages = {}
+        if values['artist_id'] not in known_artists:
+            messages['artist_id'] = ['Artist does not exist.']
+        if values['venue_id'] not in known_venues:
+            messages['venue_id'] = ['Venue does not exist.']
+        if not messages:
+            slot = (values['start_time'], values['end_time'])
+            conflicts = [
+                f"The {conflict['conflict']} is already booked "
+                f"(show {conflict['id']})."
+                for conflict in sorted(
+                    (show for kind in ('venue', 'artist')
+                     for show in existing.get((kind, values[f'{kind}_id']),
+                                              ())
+                     if show['start_time'] < slot[1]
+                     and show['end_time'] > slot[0]),
+                    key=lambda show: show['start_time'])]
+            conflicts.extend(
+                f'The {kind} is already booked by an earlier row.'
+                for kind in ('venue', 'artist')
+                if any(start < slot[1] and end > slot[0] for start, end in
+                       booked.get((kind, values[f'{kind}_id']), ())))
+            if conflicts:
+                messages['start_time'] = conflicts
+        if messages:
+            report.error(row_number, messages)
+        else:
+            rows.append(values)
+            for kind in ('venue', 'artist'):
+                booked.setdefault((kind, values[f'{kind}_id']), []).append(
+                    (values['start_time'], values['end_time']))
+    if rows:
+        db.session.execute(Show.__table__.insert(), rows)
+        adjust_show_counts(db.session.connection(),
+                           [(values['venue_id'], values['artist_id'],
+                             values['start_time']) for values in rows])
+    return len(rows)
+
+
+def _decoded(rows, report):
+    for row_number, row in rows:
+        if isinstance(row, InvalidRow):
+            report.error(row_number, row.messages)
+        else:
+            yield row_number, row
+
+
+def _validated_owners(form_class, rows, report):
+    for row_number, row in _decoded(rows, report):
+        form, valid = _validate(form_class, row)
+        if not valid:
+            report.error(row_number, _form_errors(form))
+            continue
+        values = {name: field.data for name, field in form._fields.items()
+                  if name not in ('genres', 'csrf_token')}
+        yield row_number, (values, [genre.value for genre in form.genres.data])
+
+
+def _validated_shows(rows, report):
+    from forms import ShowForm
+
+    for row_number, row in _decoded(rows, report):
+        form, valid = _validate(ShowForm, row)
+        messages = _form_errors(form)
+        ids = {}
+        for field in ('artist_id', 'venue_id'):
+            try:
+                ids[field] = int(form[field].data)
+            except (TypeError, ValueError):
+                messages.setdefault(field, []).append('Not a valid id.')
+        if not valid or messages:
+            report.error(row_number, messages)
+            continue
+        yield row_number, dict(start_time=form.start_time.data,
+                               end_time=form.end_time, **ids)
+
+
+def import_rows(kind, rows, batch_size=1000, max_errors=1000):
+    """Validate and insert an iterable of venue, artist or show rows.
+
+    Rows are validated with the same forms as the create pages, then
+    inserted batch_size at a time, one transaction per batch, with
+    executemany where the database allows it.  Only one batch is held
+    in memory, whatever the input size.  Returns an ImportReport.
+    """
+    # the forms pull in WTForms, deferred to the first import
+    from forms import VenueForm, ArtistForm
+
+    report = ImportReport(max_errors)
+    numbered = enumerate(rows, start=1)
+    if kind == 'venues':
+        validated = _validated_owners(VenueForm, numbered, report)
+    elif kind == 'artists':
+        validated = _validated_owners(ArtistForm, numbered, report)
+    elif kind == 'shows':
+        validated = _validated_shows(numbered, report)
+    else:
+        raise ValueError(f'unknown import kind {kind!r}')
+
+    genres = _GenreResolver() if kind != 'shows' else None
+    while True:
+        batch = list(islice(validated, batch_size))
+        if not batch:
+            break
+        try:
+            if kind == 'shows':
+                report.inserted += _import_show_batch(batch, report)
+            else:
+                model, association = ((Venue, venue_genre)
+                                      if kind == 'venues'
+                                      else (Artist, artist_genre))
+                _import_owner_batch(model, association,
+                                    [values for _, values in batch], genres)
+                report.inserted += len(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.expunge_all()
+
+    if kind == 'shows':
+        invalidate('shows', 'venues')
+    else:
+        invalidate(kind)
+        reset_index(Venue if kind == 'venues' else Artist)
+    return report
+
+
+def import_stream(kind, stream, format, **kwargs):
+    """Import a binary stream of CSV or JSON lines."""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return import_rows(kind, READERS[format](text), **kwargs)
+
+
+# ----------------------------------------------------------------------------#
+# Command.
+# ----------------------------------------------------------------------------#
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(list(READERS)),
+              help='Input format, guessed from the file extension if omitted.')
+@click.option('--batch-size', default=1000, show_default=True)
+@with_appcontext
+def import_command(kind, path, format, batch_size):
+    """Bulk import venues, artists or shows from a CSV or JSON lines file."""
+    format = format or ('csv' if path.endswith('.csv') else 'ndjson')
+    started = datetime.now()
+    with open(path, 'rb') as stream:
+        report = import_stream(kind, stream, format, batch_size=batch_size)
+    click.echo(f'Imported {report.inserted} {kind} in '
+               f'{(datetime.now() - started).total_seconds():.1f}s, '
+               f'{report.failed} rows rejected.')
+    for error in report.errors:
+        click.echo(f"row {error['row']}: {json.dumps(error['errors'])}",
+                   err=True)
@@ -0,0 +1,267 @@
+import json
+import logging
+import re
+import threading
+import time
+import warnings
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+# ----------------------------------------------------------------------------#
+# Query budget.
+# ----------------------------------------------------------------------------#
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request issues more statements than QUERY_BUDGET."""
+
+
+class QueryBudgetWarning(UserWarning):
+    """Warned when a request exceeds its query budget or repeats a query."""
+
+
+# The JSON lines of the requests, apart from the application log: bare
+# messages, one per line, for log collectors to parse.
+query_logger = logging.getLogger('fyyur.queries')
+
+WHITESPACE = re.compile(r'\s+')
+IN_LIST = re.compile(r'\bIN\s*\((?:[^()]|\([^()]*\))*\)', re.IGNORECASE)
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def fingerprint(statement):
+    """Normalize a statement so that repeats with other values compare equal."""
+    statement = WHITESPACE.sub(' ', statement).strip()
+    statement = IN_LIST.sub('IN (?)', statement)
+    return LITERAL.sub('?', statement)
+
+
+# ----------------------------------------------------------------------------#
+# Per-request statistics.
+# ----------------------------------------------------------------------------#
+
+
+class QueryStats:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        return {statement: count
+                for statement, count in self.fingerprints.most_common()
+                if count >= threshold}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+    if has_request_context() and 'query_stats' in g:
+        g.query_stats.record(statement, duration)
+
+
+def instrument_engine(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+# ----------------------------------------------------------------------------#
+# Connection pool statistics.
+# ----------------------------------------------------------------------------#
+
+
+class PoolStats:
+    """Checkout counters of one engine's connection pool.
+
+    ``saturation`` is the share of the pool (size + overflow) in use;
+    at 1.0 further checkouts wait up to DB_POOL_TIMEOUT seconds.  Those
+    are counted as ``waits``, with the time they waited, and as
+    ``timeouts`` when no connection came back in time.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        event.listen(engine.pool, 'connect', self._connect)
+        event.listen(engine.pool, 'checkout', self._checkout)
+        event.listen(engine.pool, 'checkin', self._checkin)
+        # dispose replaces the pool, see dispose_engines
+        event.listen(engine, 'engine_disposed',
+                     lambda engine: self._watch_waits(engine.pool))
+        self._watch_waits(engine.pool)
+
+    def _watch_waits(self, pool):
+        # QueuePool has no event before a checkout: wrap its _do_get
+        if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+            return
+        do_get = pool._do_get
+
+        def counting_do_get():
+            if pool.checkedout() < pool.size() + pool._max_overflow:
+                return do_get()
+            started = time.perf_counter()
+            try:
+                return do_get()
+            except exc.TimeoutError:
+                with self.lock:
+                    self.timeouts += 1
+                raise
+            finally:
+                with self.lock:
+                    self.waits += 1
+                    self.wait_time += time.perf_counter() - started
+
+        pool._do_get = counting_do_get
+
+    def _connect(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.connects += 1
+
+    def _checkout(self, dbapi_connection, connection_record,
+                  connection_proxy):
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _checkin(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.in_use -= 1
+
+    def snapshot(self):
+        pool = self.engine.pool
+        stats = {
+            'pool': type(pool).__name__,
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'checkouts': self.checkouts,
+            'connects': self.connects,
+            'waits': self.waits,
+            'wait_ms': round(self.wait_time * 1000, 1),
+            'timeouts': self.timeouts,
+        }
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            stats.update({
+                'size': pool.size(),
+                'max_overflow': pool._max_overflow,
+                'overflow': pool.overflow(),
+                'saturation': round(self.in_use / capacity, 3)
+                if capacity else None,
+            })
+        return stats
+
+
+def pool_stats(app):
+    """Return the pool statistics of every engine, keyed by bind."""
+    return {bind or 'default': stats.snapshot() for bind, stats in
+            app.extensions.get('pool_stats', {}).items()}
+
+
+# ----------------------------------------------------------------------------#
+# Setup.
+# ----------------------------------------------------------------------------#
+
+
+def instrumentation_setup(app, db):
+    """Count and time the statements issued by every request.
+
+    Also tracks the connection pool usage of every engine, see pool_stats.
+
+    Each response gets X-DB-Query-Count, X-DB-Query-Time (ms) and
+    X-DB-Repeated-Queries headers and a JSON line on the fyyur.queries
+    logger, written to stderr unless it is configured already.  In debug or
+    testing mode, a request issuing more than QUERY_BUDGET statements, or
+    repeating one statement REPEATED_QUERY_THRESHOLD times (the N+1
+    pattern), warns or raises according to QUERY_BUDGET_ACTION.
+    Streamed responses only get the log line, written once the body is
+    sent, and are not held to the budget.
+    """
+    with app.app_context():
+        app.extensions['pool_stats'] = {}
+        for bind, engine in db.engines.items():
+            instrument_engine(engine)
+            app.extensions['pool_stats'][bind] = PoolStats(engine)
+
+    if not query_logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        query_logger.addHandler(handler)
+        query_logger.setLevel(logging.INFO)
+        query_logger.propagate = False
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+
+    def log_query_stats(fields, stats, repeated):
+        query_logger.info(json.dumps({
+            'event': 'request_queries',
+            **fields,
+            'query_count': stats.count,
+            'query_time_ms': round(stats.duration * 1000, 2),
+            'repeated_queries': repeated,
+        }))
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+        threshold = app.config.get('REPEATED_QUERY_THRESHOLD', 5)
+        fields = {'method': request.method, 'path': request.path,
+                  'endpoint': request.endpoint,
+                  'status': response.status_code, 'streamed': False}
+        if response.is_streamed:
+            # a streamed body (the exports) runs its queries after the
+            # headers are sent: only the log line, once it is, has them
+            fields['streamed'] = True
+            response.call_on_close(lambda: log_query_stats(
+                fields, stats, stats.repeated(threshold)))
+            return response
+        del g.query_stats
+        repeated = stats.repeated(threshold)
+
+        response.headers['X-DB-Query-Count'] = str(stats.count)
+        response.headers['X-DB-Query-Time'] = f'{stats.duration * 1000:.2f}'
+        response.headers['X-DB-Repeated-Queries'] = str(len(repeated))
+        log_query_stats(fields, stats, repeated)
+
+        if not (app.debug or app.testing):
+            return response
+        budget = app.config.get('QUERY_BUDGET')
+        problems = []
+        if budget is not None and stats.count > budget:
+            problems.append(f'{request.method} {request.path} issued '
+                            f'{stats.count} statements (budget {budget})')
+        for statement, count in repeated.items():
+            problems.append(f'{request.method} {request.path} repeated '
+                            f'{count} times: {statement}')
+        if problems:
+            if app.config.get('QUERY_BUDGET_ACTION', 'warn') == 'raise':
+                raise QueryBudgetExceeded('\n'.join(problems))
+            for problem in problems:
+                warnings.warn(problem, QueryBudgetWarning)
+        return response
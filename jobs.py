@@ -0,0 +1,473 @@
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+# Job handlers by name, see the job decorator.
+JOBS = {}
+
+# Interval in seconds of the jobs workers queue periodically, by name.
+SCHEDULE = {}
+
+
+def job(name, every=None):
+    """Register a function as the handler of the jobs called name.
+
+    Handlers receive the job payload as keyword arguments and run in an
+    application context.  Jobs are delivered at least once, so handlers
+    must tolerate running twice.  With ``every``, workers also queue the
+    job, without payload, every ``every`` seconds.
+    """
+    def decorator(function):
+        JOBS[name] = function
+        if every is not None:
+            SCHEDULE[name] = every
+        return function
+    return decorator
+
+
+class Job:
+
+    def __init__(self, name, payload, key=None, max_attempts=3, id=None,
+                 attempts=0, run_at=None):
+        self.id = id
+        self.name = name
+        self.payload = payload
+        self.key = key
+        self.max_attempts = max_attempts
+        self.attempts = attempts
+        self.run_at = time.time() if run_at is None else run_at
+
+    def __repr__(self):
+        return (f"<Job id: {self.id} - name: {self.name} - "
+                f"attempts: {self.attempts}/{self.max_attempts}>")
+
+
+# ----------------------------------------------------------------------------#
+# Brokers.
+# ----------------------------------------------------------------------------#
+
+
+class Broker:
+    """Interface of the stores jobs wait in until a worker runs them.
+
+    ``reserve`` hands a due job to one worker and counts the attempt;
+    the worker then ``ack``s it, schedules a ``retry`` or marks it as
+    ``fail``ed.  ``publish`` returns False, without queueing anything,
+    when a job with the same idempotency key was already published.
+    """
+
+    def publish(self, job):
+        raise NotImplementedError
+
+    def reserve(self, timeout=None):
+        raise NotImplementedError
+
+    def ack(self, job):
+        raise NotImplementedError
+
+    def retry(self, job, run_at, error):
+        raise NotImplementedError
+
+    def fail(self, job, error):
+        raise NotImplementedError
+
+
+class MemoryBroker(Broker):
+    """In-process broker, for the thread backend.
+
+    Queued jobs are lost when the process exits.  The last ``max_keys``
+    idempotency keys are remembered.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._heap = []
+        self._keys = OrderedDict()
+        self._ids = itertools.count(1)
+        self._ready = threading.Condition()
+        self.failed = []
+
+    def publish(self, job):
+        with self._ready:
+            if job.key is not None:
+                if job.key in self._keys:
+                    return False
+                self._keys[job.key] = True
+                while len(self._keys) > self.max_keys:
+                    self._keys.popitem(last=False)
+            job.id = next(self._ids)
+            heapq.heappush(self._heap, (job.run_at, job.id, job))
+            self._ready.notify()
+            return True
+
+    def reserve(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._ready:
+            while True:
+                wait = None if deadline is None \
+                    else deadline - time.monotonic()
+                if self._heap:
+                    due = self._heap[0][0] - time.time()
+                    if due <= 0:
+                        job = heapq.heappop(self._heap)[2]
+                        job.attempts += 1
+                        return job
+                    wait = due if wait is None else min(wait, due)
+                if wait is not None and wait <= 0:
+                    return None
+                self._ready.wait(wait)
+
+    def ack(self, job):
+        pass
+
+    def retry(self, job, run_at, error):
+        job.run_at = run_at
+        with self._ready:
+            heapq.heappush(self._heap, (job.run_at, job.id, job))
+            self._ready.notify()
+
+    def fail(self, job, error):
+        with self._ready:
+            self.failed.append((job, error))
+            del self.failed[:-100]
+
+
+class SQLiteBroker(Broker):
+    """Durable broker in an SQLite file, shared by the processes of one
+    host: the web processes publish and ``flask worker`` runs the jobs.
+
+    A reserved job is handed to another worker if it is not acked
+    within ``visibility_timeout`` seconds, as its worker likely died.
+    Succeeded jobs are only kept while they hold an idempotency key.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS job (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            key TEXT UNIQUE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_at REAL NOT NULL,
+            locked_until REAL,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_job_status_run_at ON job (status, run_at);
+    """
+
+    def __init__(self, path, visibility_timeout=300, poll_interval=0.5):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        connection = sqlite3.connect(path, timeout=30)
+        try:
+            # WAL lets the web processes publish while a worker reads
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(self.SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        return _Transaction(sqlite3.connect(self.path, timeout=30,
+                                            isolation_level=None))
+
+    def publish(self, job):
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO job "
+                "(name, payload, key, max_attempts, run_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job.name, json.dumps(job.payload), job.key,
+                 job.max_attempts, job.run_at))
+            job.id = cursor.lastrowid if cursor.rowcount else None
+            return cursor.rowcount == 1
+
+    def _reserve(self):
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT id, name, payload, key, attempts, max_attempts, "
+                "run_at FROM job "
+                "WHERE (status = 'queued' AND run_at <= ?) "
+                "OR (status = 'running' AND locked_until < ?) "
+                "ORDER BY run_at LIMIT 1", (now, now)).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE job SET status = 'running', locked_until = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (now + self.visibility_timeout, row[0]))
+        id, name, payload, key, attempts, max_attempts, run_at = row
+        return Job(name, json.loads(payload), key, max_attempts, id=id,
+                   attempts=attempts + 1, run_at=run_at)
+
+    def reserve(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self._reserve()
+            if job is not None:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def ack(self, job):
+        with self._connect() as connection:
+            if job.key is None:
+                connection.execute("DELETE FROM job WHERE id = ?", (job.id,))
+            else:
+                connection.execute(
+                    "UPDATE job SET status = 'done', locked_until = NULL, "
+                    "error = NULL WHERE id = ?", (job.id,))
+
+    def retry(self, job, run_at, error):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE job SET status = 'queued', run_at = ?, "
+                "locked_until = NULL, error = ? WHERE id = ?",
+                (run_at, error, job.id))
+
+    def fail(self, job, error):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE job SET status = 'failed', locked_until = NULL, "
+                "error = ? WHERE id = ?", (error, job.id))
+
+
+class _Transaction:
+    """Runs the statements of a with block in one immediate transaction,
+    then closes the connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, type, value, traceback):
+        try:
+            self.connection.execute('ROLLBACK' if type else 'COMMIT')
+        finally:
+            self.connection.close()
+
+
+# ----------------------------------------------------------------------------#
+# Worker.
+# ----------------------------------------------------------------------------#
+
+
+class Worker:
+    """Runs the jobs of a broker on ``concurrency`` threads.
+
+    A failed job is retried ``retry_delay * 2 ** (attempt - 1)`` seconds
+    later, until it has been attempted ``max_attempts`` times.  Unless
+    started in burst mode, another thread queues the SCHEDULE jobs.
+    """
+
+    def __init__(self, app, broker, concurrency=1, retry_delay=1.0,
+                 poll_interval=1.0):
+        self.app = app
+        self.broker = broker
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self.threads = []
+        self._next_runs = {}
+
+    def execute(self, job):
+        handler = JOBS.get(job.name)
+        try:
+            if handler is None:
+                raise LookupError(f'no handler for job {job.name!r}')
+            with self.app.app_context():
+                handler(**job.payload)
+        except Exception as error:
+            message = f'{type(error).__name__}: {error}'
+            if job.attempts < job.max_attempts:
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                self.app.logger.warning(f'{job!r} failed, retrying in '
+                                        f'{delay:.1f}s: {message}')
+                self.broker.retry(job, time.time() + delay, message)
+            else:
+                self.app.logger.exception(f'{job!r} failed for good')
+                self.broker.fail(job, message)
+            return False
+        self.broker.ack(job)
+        return True
+
+    def _loop(self, burst):
+        while not self.stopping.is_set():
+            job = self.broker.reserve(timeout=self.poll_interval)
+            if job is not None:
+                self.execute(job)
+            elif burst:
+                return
+
+    def publish_scheduled(self, now=None):
+        """Queue the SCHEDULE jobs whose period started since last time."""
+        now = time.time() if now is None else now
+        for name, every in SCHEDULE.items():
+            if now < self._next_runs.get(name, 0):
+                continue
+            period = int(now // every)
+            self._next_runs[name] = (period + 1) * every
+            # keyed by period, so that several workers queue it once;
+            # a failed run is not retried, the next period runs anyway
+            self.broker.publish(Job(name, {}, key=f'{name}:{period}',
+                                    max_attempts=1))
+
+    def _schedule(self):
+        while True:
+            self.publish_scheduled()
+            if self.stopping.wait(self.poll_interval):
+                return
+
+    def start(self, burst=False):
+        self.threads = [threading.Thread(target=self._loop, args=(burst,),
+                                         name=f'job-worker-{number}',
+                                         daemon=True)
+                        for number in range(self.concurrency)]
+        if SCHEDULE and not burst:
+            self.threads.append(threading.Thread(
+                target=self._schedule, name='job-scheduler', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def join(self):
+        for thread in self.threads:
+            # a timeout keeps the main thread responsive to Ctrl+C
+            while thread.is_alive():
+                thread.join(0.5)
+
+
+# ----------------------------------------------------------------------------#
+# Queue.
+# ----------------------------------------------------------------------------#
+
+
+class JobQueue:
+    """Publishes jobs to the broker of the configured backend.
+
+    With the thread backend, the jobs run on a pool of threads of the
+    publishing process, started on the first job (and again in a forked
+    child, as threads do not survive a fork).
+    """
+
+    def __init__(self, app, backend, broker, max_attempts=3, retry_delay=1.0,
+                 concurrency=4):
+        self.app = app
+        self.backend = backend
+        self.broker = broker
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.concurrency = concurrency
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+
+    def worker(self, concurrency=None):
+        return Worker(self.app, self.broker,
+                      concurrency=concurrency or self.concurrency,
+                      retry_delay=self.retry_delay)
+
+    def _start_local_worker(self):
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                self._worker = self.worker()
+                self._worker.start()
+                self._worker_pid = os.getpid()
+
+    def enqueue(self, name, key=None, **payload):
+        """Queue the job name with payload, unless a job with the same
+        idempotency key was queued already.  Returns whether it was."""
+        if name not in JOBS:
+            raise LookupError(f'no handler for job {name!r}')
+        job = Job(name, payload, key, self.max_attempts)
+        if self.backend == 'sync':
+            # run inline, once, for tests and debugging
+            job.attempts = job.max_attempts
+            Worker(self.app, self.broker).execute(job)
+            return True
+        if self.backend == 'thread' and self._worker_pid != os.getpid():
+            self._start_local_worker()
+        return self.broker.publish(job)
+
+
+def jobs_setup(app):
+    """Create the job queue configured by JOBS_BACKEND.
+
+    JOBS_BACKEND is 'thread' (a thread pool of each web process, the
+    default), 'sqlite' (jobs persisted to JOBS_SQLITE_PATH and run by
+    ``flask worker``, refused with the per-process 'lru' cache) or
+    'sync' (run inline, for tests).
+    """
+    backend = app.config.get('JOBS_BACKEND', 'thread')
+    if backend == 'sqlite' and app.config.get('CACHE_TYPE', 'lru') == 'lru':
+        # the jobs invalidating pages (purges, show counts) would only
+        # reach the worker's own cache
+        raise RuntimeError("JOBS_BACKEND 'sqlite' runs jobs in another "
+                           "process: it needs CACHE_TYPE 'redis' or 'null'")
+    if backend == 'sqlite':
+        broker = SQLiteBroker(app.config.get('JOBS_SQLITE_PATH', 'jobs.db'))
+    else:
+        broker = MemoryBroker()
+    queue = JobQueue(app, backend, broker,
+                     max_attempts=app.config.get('JOBS_MAX_ATTEMPTS', 3),
+                     retry_delay=app.config.get('JOBS_RETRY_DELAY', 1.0),
+                     concurrency=app.config.get('JOBS_CONCURRENCY', 4))
+    app.extensions['jobs'] = queue
+
+    if backend == 'thread':
+        @app.before_request
+        def start_scheduled_jobs():
+            # the SCHEDULE jobs run without waiting for a first job
+            if SCHEDULE and queue._worker_pid != os.getpid():
+                queue._start_local_worker()
+
+    return queue
+
+
+def enqueue(name, key=None, **payload):
+    """Queue a job on the application's job queue, see JobQueue.enqueue."""
+    return current_app.extensions['jobs'].enqueue(name, key, **payload)
+
+
+@click.command('worker')
+@click.option('--concurrency', '-c', type=int,
+              help='Worker threads, JOBS_CONCURRENCY if omitted.')
+@click.option('--burst', is_flag=True,
+              help='Exit once no job is due instead of waiting for more.')
+@with_appcontext
+def worker_command(concurrency, burst):
+    """Run the queued background jobs."""
+    queue = current_app.extensions['jobs']
+    if queue.backend != 'sqlite':
+        raise click.UsageError(
+            f'The {queue.backend} job backend runs jobs inside the web '
+            f'process; set JOBS_BACKEND=sqlite to use a worker.')
+    worker = queue.worker(concurrency)
+    worker.start(burst=burst)
+    click.echo(f'Worker running {worker.concurrency} threads.')
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
+        worker.join()
+
@@ -0,0 +1,27 @@
+"""adding the show(start_time, id) keyset index and show foreign key indexes
+
+Revision ID: 3c9a1e5f7b20
+Revises: f64effafbb28
+Create Date: 2026-10-17 09:12:31.402118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a1e5f7b20'
+down_revision = 'f64effafbb28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'], unique=False)
+    op.create_index(op.f('ix_show_artist_id'), 'show', ['artist_id'], unique=False)
+    op.create_index(op.f('ix_show_venue_id'), 'show', ['venue_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_show_venue_id'), table_name='show')
+    op.drop_index(op.f('ix_show_artist_id'), table_name='show')
+    op.drop_index('ix_show_start_time_id', table_name='show')
@@ -0,0 +1,92 @@
+"""adding show end times and preventing overlapping bookings
+
+Revision ID: 5d2f8c7a1e93
+Revises: a7d25b9e4c18
+Create Date: 2026-10-17 14:05:48.217604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2f8c7a1e93'
+down_revision = 'a7d25b9e4c18'
+branch_labels = None
+depends_on = None
+
+# Length given to the shows booked before end times were recorded.
+DEFAULT_DURATION_HOURS = 2
+
+# Must match models.MAX_SHOW_DURATION.
+MAX_DURATION_HOURS = 12
+
+OVERLAPS = """
+    SELECT count(*) FROM show a JOIN show b
+      ON a.id < b.id AND a.{column} = b.{column}
+     AND a.start_time < b.end_time AND b.start_time < a.end_time
+"""
+
+
+def upgrade():
+    op.add_column('show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    if postgresql:
+        op.execute(f"UPDATE show SET end_time = start_time + "
+                   f"interval '{DEFAULT_DURATION_HOURS} hours'")
+    else:
+        # keeps the fractional seconds SQLAlchemy stores on SQLite
+        op.execute(f"UPDATE show SET end_time = strftime('%Y-%m-%d %H:%M:%S', "
+                   f"start_time, '+{DEFAULT_DURATION_HOURS} hours') "
+                   f"|| substr(start_time, 20)")
+
+    with op.batch_alter_table('show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(),
+                              nullable=False)
+        batch_op.create_check_constraint('ck_show_end_after_start',
+                                         'end_time > start_time')
+        batch_op.drop_index('ix_show_venue_id')
+        batch_op.drop_index('ix_show_artist_id')
+        batch_op.create_index('ix_show_venue_id_start_time',
+                              ['venue_id', 'start_time'], unique=False)
+        batch_op.create_index('ix_show_artist_id_start_time',
+                              ['artist_id', 'start_time'], unique=False)
+
+    if not postgresql:
+        return
+    # The application checks for conflicts before booking; the exclusion
+    # constraints also refuse the bookings racing past that check.
+    op.create_check_constraint(
+        'ck_show_max_duration', 'show',
+        f"end_time - start_time <= interval '{MAX_DURATION_HOURS} hours'")
+    for column in ('venue_id', 'artist_id'):
+        overlaps = op.get_bind().execute(
+            sa.text(OVERLAPS.format(column=column))).scalar()
+        if overlaps:
+            raise RuntimeError(
+                f'{overlaps} pairs of shows overlap on {column}; resolve '
+                f'them before applying this migration.')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute("""
+        ALTER TABLE show ADD CONSTRAINT ex_show_venue_overlap
+        EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)
+    """)
+    op.execute("""
+        ALTER TABLE show ADD CONSTRAINT ex_show_artist_overlap
+        EXCLUDE USING gist (artist_id WITH =, tsrange(start_time, end_time) WITH &&)
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('ex_show_artist_overlap', 'show')
+        op.drop_constraint('ex_show_venue_overlap', 'show')
+        op.drop_constraint('ck_show_max_duration', 'show')
+
+    with op.batch_alter_table('show') as batch_op:
+        batch_op.drop_index('ix_show_artist_id_start_time')
+        batch_op.drop_index('ix_show_venue_id_start_time')
+        batch_op.create_index('ix_show_artist_id', ['artist_id'], unique=False)
+        batch_op.create_index('ix_show_venue_id', ['venue_id'], unique=False)
+        batch_op.drop_constraint('ck_show_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
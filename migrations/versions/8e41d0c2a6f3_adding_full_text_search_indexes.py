@@ -0,0 +1,48 @@
+"""adding full-text search vectors and trigram indexes to Venue and Artist
+
+Revision ID: 8e41d0c2a6f3
+Revises: 3c9a1e5f7b20
+Create Date: 2026-10-17 10:03:54.881207
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8e41d0c2a6f3'
+down_revision = '3c9a1e5f7b20'
+branch_labels = None
+depends_on = None
+
+# Kept in sync by Postgres itself: search_vector is a stored generated
+# column, recomputed on every insert and update of the row.
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple'::regconfig,
+                          coalesce(city, '') || ' ' || coalesce(state, '')), 'B') ||
+    setweight(to_tsvector('simple'::regconfig,
+                          replace(coalesce(genres, ''), '-', ' ')), 'C')
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('venue', 'artist'):
+        op.execute(f'ALTER TABLE {table} ADD COLUMN search_vector tsvector '
+                   f'GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED')
+        op.create_index(f'ix_{table}_search_vector', table, ['search_vector'],
+                        postgresql_using='gin')
+        op.create_index(f'ix_{table}_name_trgm', table, ['name'],
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('venue', 'artist'):
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table)
+        op.drop_index(f'ix_{table}_search_vector', table_name=table)
+        op.drop_column(table, 'search_vector')
@@ -0,0 +1,49 @@
+"""adding created_at and updated_at to Venue, Artist and Show
+
+Revision ID: 9b4e6f1a3c75
+Revises: c83f1d6e2b47
+Create Date: 2026-10-17 22:05:12.731904
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e6f1a3c75'
+down_revision = 'c83f1d6e2b47'
+branch_labels = None
+depends_on = None
+
+TABLES = ('venue', 'artist', 'show')
+
+
+def upgrade():
+    # the existing rows are dated from the upgrade, in UTC like the
+    # application sets them
+    now = datetime.utcnow()
+    for table in TABLES:
+        op.add_column(table, sa.Column('created_at', sa.DateTime(),
+                                       nullable=True))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(),
+                                       nullable=True))
+        timestamps = sa.table(table, sa.column('created_at', sa.DateTime),
+                              sa.column('updated_at', sa.DateTime))
+        op.execute(timestamps.update().values(created_at=now, updated_at=now))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('created_at', existing_type=sa.DateTime(),
+                                  nullable=False)
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(),
+                                  nullable=False)
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'],
+                        unique=False)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
+            batch_op.drop_column('created_at')
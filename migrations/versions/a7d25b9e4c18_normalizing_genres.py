@@ -0,0 +1,141 @@
+"""normalizing the genres of Venue and Artist into a genre table
+
+Revision ID: a7d25b9e4c18
+Revises: 8e41d0c2a6f3
+Create Date: 2026-10-17 11:20:07.164530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d25b9e4c18'
+down_revision = '8e41d0c2a6f3'
+branch_labels = None
+depends_on = None
+
+# The values of forms.Genres when the genres were stored "-"-joined.
+KNOWN_GENRES = [
+    'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+    'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre',
+    'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Alternative', 'Soul',
+    'Other',
+]
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple'::regconfig,
+                          coalesce(city, '') || ' ' || coalesce(state, '')), 'B')
+"""
+
+OLD_SEARCH_VECTOR = SEARCH_VECTOR + """ ||
+    setweight(to_tsvector('simple'::regconfig,
+                          replace(coalesce(genres, ''), '-', ' ')), 'C')
+"""
+
+genre = sa.table('genre', sa.column('id', sa.Integer),
+                 sa.column('name', sa.String))
+
+
+def split_genres(value):
+    """Split a "-"-joined genres string without breaking "Hip-Hop"."""
+    parts = [part for part in (value or '').split('-') if part]
+    names = []
+    while parts:
+        if len(parts) > 1 and f'{parts[0]}-{parts[1]}' in KNOWN_GENRES:
+            names.append(f'{parts.pop(0)}-{parts.pop(0)}')
+        else:
+            names.append(parts.pop(0))
+    return list(dict.fromkeys(names))
+
+
+def _replace_search_vector(table, expression):
+    op.drop_index(f'ix_{table}_search_vector', table_name=table)
+    op.drop_column(table, 'search_vector')
+    op.execute(f'ALTER TABLE {table} ADD COLUMN search_vector tsvector '
+               f'GENERATED ALWAYS AS ({expression}) STORED')
+    op.create_index(f'ix_{table}_search_vector', table, ['search_vector'],
+                    postgresql_using='gin')
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    op.create_table('genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table in ('venue', 'artist'):
+        op.create_table(f'{table}_genre',
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.Column(f'{table}_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+        sa.ForeignKeyConstraint([f'{table}_id'], [f'{table}.id'], ),
+        sa.PrimaryKeyConstraint('genre_id', f'{table}_id')
+        )
+        op.create_index(op.f(f'ix_{table}_genre_{table}_id'), f'{table}_genre',
+                        [f'{table}_id'], unique=False)
+
+    owners = {}
+    for table in ('venue', 'artist'):
+        owner = sa.table(table, sa.column('id', sa.Integer),
+                         sa.column('genres', sa.String))
+        owners[table] = [(owner_id, split_genres(genres))
+                         for owner_id, genres in bind.execute(
+                             sa.select(owner.c.id, owner.c.genres))]
+
+    names = list(KNOWN_GENRES)
+    for rows in owners.values():
+        for _, owner_genres in rows:
+            names.extend(name for name in owner_genres if name not in names)
+    op.bulk_insert(genre, [{'name': name} for name in names])
+    genre_ids = dict(bind.execute(sa.select(genre.c.name, genre.c.id)).all())
+
+    for table, rows in owners.items():
+        association = sa.table(f'{table}_genre',
+                               sa.column('genre_id', sa.Integer),
+                               sa.column(f'{table}_id', sa.Integer))
+        associations = [{'genre_id': genre_ids[name], f'{table}_id': owner_id}
+                        for owner_id, owner_genres in rows
+                        for name in owner_genres]
+        if associations:
+            op.bulk_insert(association, associations)
+
+        if bind.dialect.name == 'postgresql':
+            # search_vector is generated from the genres column.
+            _replace_search_vector(table, SEARCH_VECTOR)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table in ('venue', 'artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('genres', sa.String(length=120),
+                                          nullable=True))
+        owner = sa.table(table, sa.column('id', sa.Integer),
+                         sa.column('genres', sa.String))
+        association = sa.table(f'{table}_genre',
+                               sa.column('genre_id', sa.Integer),
+                               sa.column(f'{table}_id', sa.Integer))
+        genres = {}
+        for owner_id, name in bind.execute(
+                sa.select(association.c[f'{table}_id'], genre.c.name)
+                .select_from(association.join(
+                    genre, genre.c.id == association.c.genre_id))
+                .order_by(genre.c.name)):
+            genres.setdefault(owner_id, []).append(name)
+        for owner_id, names in genres.items():
+            bind.execute(owner.update().where(owner.c.id == owner_id)
+                         .values(genres='-'.join(names)))
+        if bind.dialect.name == 'postgresql':
+            _replace_search_vector(table, OLD_SEARCH_VECTOR)
+
+        op.drop_index(op.f(f'ix_{table}_genre_{table}_id'),
+                      table_name=f'{table}_genre')
+        op.drop_table(f'{table}_genre')
+    op.drop_table('genre')
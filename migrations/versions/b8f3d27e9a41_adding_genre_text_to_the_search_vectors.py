@@ -0,0 +1,93 @@
+"""adding the genre names back to the search vectors of Venue and Artist
+
+Revision ID: b8f3d27e9a41
+Revises: e5a1c9d3f702
+Create Date: 2026-10-18 09:41:26.530118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f3d27e9a41'
+down_revision = 'e5a1c9d3f702'
+branch_labels = None
+depends_on = None
+
+# A generated column can not reference the genre association tables, so
+# triggers on them keep a genre_text column, which search_vector is
+# generated from, up to date.
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple'::regconfig,
+                          coalesce(city, '') || ' ' || coalesce(state, '')), 'B')
+"""
+
+GENRE_SEARCH_VECTOR = SEARCH_VECTOR + """ ||
+    setweight(to_tsvector('simple'::regconfig,
+                          replace(coalesce(genre_text, ''), '-', ' ')), 'C')
+"""
+
+# Statement level, so that a bulk insert of genres updates each owner
+# once; the INSERT and DELETE triggers both name their rows "changed".
+GENRE_TEXT_FUNCTION = """
+CREATE FUNCTION {table}_genre_text() RETURNS trigger AS $$
+BEGIN
+    UPDATE {table} SET genre_text = (
+        SELECT string_agg(genre.name, ' ' ORDER BY genre.name)
+        FROM {table}_genre JOIN genre ON genre.id = {table}_genre.genre_id
+        WHERE {table}_genre.{table}_id = {table}.id)
+    WHERE {table}.id IN (SELECT {table}_id FROM changed);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+GENRE_TEXT_TRIGGER = """
+CREATE TRIGGER {table}_genre_text_{event} AFTER {event} ON {table}_genre
+REFERENCING {rows} TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION {table}_genre_text()
+"""
+
+
+def _replace_search_vector(table, expression):
+    op.drop_index(f'ix_{table}_search_vector', table_name=table)
+    op.drop_column(table, 'search_vector')
+    op.execute(f'ALTER TABLE {table} ADD COLUMN search_vector tsvector '
+               f'GENERATED ALWAYS AS ({expression}) STORED')
+    op.create_index(f'ix_{table}_search_vector', table, ['search_vector'],
+                    postgresql_using='gin')
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('venue', 'artist'):
+        op.execute(f'ALTER TABLE {table} ADD COLUMN genre_text text')
+        op.execute(GENRE_TEXT_FUNCTION.format(table=table))
+        for event, rows in (('insert', 'NEW'), ('delete', 'OLD')):
+            op.execute(GENRE_TEXT_TRIGGER.format(table=table, event=event,
+                                                 rows=rows))
+        op.execute(f"""
+            UPDATE {table} SET genre_text = genres.names
+            FROM (SELECT {table}_genre.{table}_id AS id,
+                         string_agg(genre.name, ' ' ORDER BY genre.name)
+                             AS names
+                  FROM {table}_genre
+                  JOIN genre ON genre.id = {table}_genre.genre_id
+                  GROUP BY {table}_genre.{table}_id) AS genres
+            WHERE {table}.id = genres.id
+        """)
+        _replace_search_vector(table, GENRE_SEARCH_VECTOR)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('venue', 'artist'):
+        _replace_search_vector(table, SEARCH_VECTOR)
+        for event in ('insert', 'delete'):
+            op.execute(f'DROP TRIGGER {table}_genre_text_{event} '
+                       f'ON {table}_genre')
+        op.execute(f'DROP FUNCTION {table}_genre_text()')
+        op.execute(f'ALTER TABLE {table} DROP COLUMN genre_text')
@@ -0,0 +1,59 @@
+"""adding stored upcoming and past show counts to Venue and Artist
+
+Revision ID: c83f1d6e2b47
+Revises: 5d2f8c7a1e93
+Create Date: 2026-10-17 16:42:31.508112
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c83f1d6e2b47'
+down_revision = '5d2f8c7a1e93'
+branch_labels = None
+depends_on = None
+
+COUNTS = """
+    UPDATE {table} SET
+      upcoming_shows_count = (SELECT count(*) FROM show
+                              WHERE show.{table}_id = {table}.id
+                                AND show.start_time > :rolled_at),
+      past_shows_count = (SELECT count(*) FROM show
+                          WHERE show.{table}_id = {table}.id
+                            AND show.start_time <= :rolled_at)
+"""
+
+
+def upgrade():
+    op.create_table(
+        'counter_watermark',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('rolled_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(),
+                                       server_default='0', nullable=False))
+
+    rolled_at = datetime.now()
+    for table in ('venue', 'artist'):
+        op.get_bind().execute(
+            sa.text(COUNTS.format(table=table)).bindparams(
+                sa.bindparam('rolled_at', rolled_at, type_=sa.DateTime())))
+    watermark = sa.table('counter_watermark', sa.column('name', sa.String),
+                         sa.column('rolled_at', sa.DateTime))
+    op.bulk_insert(watermark, [{'name': 'shows', 'rolled_at': rolled_at}])
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
+    op.drop_table('counter_watermark')
@@ -0,0 +1,38 @@
+"""adding soft delete to Venue and Artist, with partial listing indexes
+
+Revision ID: e5a1c9d3f702
+Revises: 9b4e6f1a3c75
+Create Date: 2026-10-17 23:12:47.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c9d3f702'
+down_revision = '9b4e6f1a3c75'
+branch_labels = None
+depends_on = None
+
+ACTIVE = sa.text('deleted_at IS NULL')
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(),
+                                       nullable=True))
+    op.create_index('ix_venue_active_state_city_name', 'venue',
+                    ['state', 'city', 'name', 'id'], unique=False,
+                    postgresql_where=ACTIVE, sqlite_where=ACTIVE)
+    op.create_index('ix_artist_active_name', 'artist', ['name', 'id'],
+                    unique=False, postgresql_where=ACTIVE,
+                    sqlite_where=ACTIVE)
+
+
+def downgrade():
+    op.drop_index('ix_artist_active_name', table_name='artist')
+    op.drop_index('ix_venue_active_state_city_name', table_name='venue')
+    for table in ('artist', 'venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('deleted_at')
@@ -1,26 +1,178 @@
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from routing import RoutingSession, replica_binds, routing_setup
 
 
 # ----------------------------------------------------------------------------#
 # init DB
 # ----------------------------------------------------------------------------#
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def engine_options(config):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings.
+
+    In 'transaction' pool mode (pgbouncer transaction pooling) a server
+    connection is only ours for the length of a transaction, so
+    prepared statements are not cached and the statement timeout is set
+    per transaction instead of as a connection startup option.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return options
+
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+    options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', config['DB_POOL_PRE_PING'])
+
+    connect_args = options.setdefault('connect_args', {})
+    if config['DB_POOL_MODE'] == 'transaction':
+        if url.get_driver_name() == 'psycopg':
+            connect_args.setdefault('prepare_threshold', None)
+        elif url.get_driver_name() == 'asyncpg':
+            connect_args.setdefault('prepared_statement_cache_size', 0)
+    elif config['DB_STATEMENT_TIMEOUT']:
+        connect_args.setdefault(
+            'options', f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}")
+    return options
+
+
+def _set_local_statement_timeout(timeout):
+    def set_timeout(conn):
+        conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+    return set_timeout
+
+
+def dispose_engines(app):
+    """Drop the pooled connections inherited from a parent process.
+
+    Registered to run in every forked child (such as preforked server
+    workers): a connection shared by two processes gets their traffic
+    interleaved.  The parent's connections are left open for the parent.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def migrate_setup(app):
+    """Set up Flask-Migrate, for the flask db commands.
+
+    Kept out of db_setup: it imports alembic, which the web processes
+    never need and which makes a good share of the startup time.
+    """
+    from flask_migrate import Migrate
+
+    Migrate(app, db)
+
 
 def db_setup(app):
-    app.config.from_object('config')
+    if not app.config.get('SQLALCHEMY_DATABASE_URI'):
+        raise RuntimeError('Set DB_URI, in the environment or in .env, to '
+                           'the URI of the database.')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    app.config['SQLALCHEMY_BINDS'] = {
+        **app.config.get('SQLALCHEMY_BINDS', {}),
+        **replica_binds(app.config.get('DB_REPLICA_URIS')),
+    }
     db.init_app(app)
-    Migrate(app, db)
+    routing_setup(app, db)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: dispose_engines(app))
+    if app.config['DB_POOL_MODE'] == 'transaction' \
+            and app.config['DB_STATEMENT_TIMEOUT']:
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == 'postgresql':
+                    event.listen(engine, 'begin', _set_local_statement_timeout(
+                        app.config['DB_STATEMENT_TIMEOUT']))
     return db
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
 
+# Association tables are keyed (genre_id, owner_id) so that filtering by
+# genre is a primary key range lookup; the owner_id indexes serve the
+# reverse lookup of an entity's genres.
+venue_genre = db.Table(
+    'venue_genre',
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'),
+              primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('venue.id'),
+              primary_key=True, index=True),
+)
+
+artist_genre = db.Table(
+    'artist_genre',
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'),
+              primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('artist.id'),
+              primary_key=True, index=True),
+)
+
+
+class Genre(db.Model):
+    __tablename__ = 'genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def from_names(cls, names):
+        """Return the Genre rows for names, creating the missing ones."""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return []
+        existing = {genre.name: genre
+                    for genre in cls.query.filter(cls.name.in_(names))}
+        for name in names:
+            if name not in existing:
+                existing[name] = cls(name=name)
+                db.session.add(existing[name])
+        return [existing[name] for name in names]
+
+    def __repr__(self):
+        return f"<Genre id: {self.id} - name: {self.name}>"
 
-class Venue(db.Model):
+
+class SoftDeleted:
+    """Soft deletion of venues and artists.
+
+    A deleted row gets a deleted_at time and is no longer listed, shown
+    nor bookable; its shows and genres are removed in the background
+    (see purge.py).  The row itself stays, so that the listings' last
+    modification time still accounts for it.
+    """
+    deleted_at = db.Column(db.DateTime)
+
+    @classmethod
+    def active(cls):
+        """Return the query of the rows which are not deleted."""
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+
+# Partial indexes of the listings, which skip the deleted rows.
+ACTIVE = db.text('deleted_at IS NULL')
+
+
+class Venue(SoftDeleted, db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        db.Index('ix_venue_active_state_city_name', 'state', 'city', 'name',
+                 'id', postgresql_where=ACTIVE, sqlite_where=ACTIVE),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -29,7 +181,8 @@ class Venue(db.Model):
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
 
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genre, lazy=True,
+                             order_by='Genre.name')
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
@@ -39,19 +192,37 @@ class Venue(db.Model):
 
     shows = db.relationship('Show', backref='venue', lazy=True)
 
+    # Shows starting after / before the show counts watermark, see
+    # adjust_show_counts.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
+
+    # UTC times, see Timestamps.
+    created_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+
     def __repr__(self):
         return f"<Venue id: {self.id} - name: {self.name}>"
 
 
-class Artist(db.Model):
+class Artist(SoftDeleted, db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+        db.Index('ix_artist_active_name', 'name', 'id',
+                 postgresql_where=ACTIVE, sqlite_where=ACTIVE),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genre, lazy=True,
+                             order_by='Genre.name')
 
     # address = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
@@ -63,23 +234,167 @@ class Artist(db.Model):
 
     shows = db.relationship('Show', backref='artist', lazy=True)
 
+    # Shows starting after / before the show counts watermark, see
+    # adjust_show_counts.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
+
+    # UTC times, see Timestamps.
+    created_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+
     def __repr__(self):
         return f"<Artist id: {self.id} - name: {self.name}>"
 
 
+# Longest a show may last.  Bounds the start_time range a conflict check
+# has to scan, see queries.booking_conflicts.
+MAX_SHOW_DURATION = timedelta(hours=12)
+
+
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.CheckConstraint('end_time > start_time',
+                           name='ck_show_end_after_start'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.DateTime, nullable=False)
+    # active_history loads the previous value of an expired attribute
+    # when it is set, so that a moved show is uncounted where it was
+    start_time = db.column_property(
+        db.Column(db.DateTime, nullable=False), active_history=True)
+    end_time = db.Column(db.DateTime, nullable=False)
 
-    artist_id = db.Column(
+    artist_id = db.column_property(db.Column(
         db.Integer,
         db.ForeignKey('artist.id'),
-        nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
+        nullable=False), active_history=True)
+    venue_id = db.column_property(db.Column(
+        db.Integer,
+        db.ForeignKey('venue.id'),
+        nullable=False), active_history=True)
+
+    # UTC times, see Timestamps.
+    created_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __repr__(self):
         return (f"<Show id: {self.id} -"
                 f"artist_id: {self.artist_id} -"
                 f"venue_id: {self.venue_id} >")
+
+
+# ----------------------------------------------------------------------------#
+# Timestamps.
+# ----------------------------------------------------------------------------#
+
+# created_at and updated_at are set by the column defaults, for Core
+# statements too: the show count updates below touch the venues and
+# artists of the shows booked, moved, deleted or started, as the pages
+# listing them change.  The pages derive their Last-Modified from them,
+# see queries.last_modified.
+
+
+@event.listens_for(Session, 'before_flush')
+def _touch_changed_owners(session, flush_context, instances):
+    """Touch the venues and artists whose genres changed, which leaves
+    their own row unchanged."""
+    for obj in session.dirty:
+        if isinstance(obj, (Venue, Artist)) and session.is_modified(obj):
+            obj.updated_at = datetime.utcnow()
+
+# ----------------------------------------------------------------------------#
+# Show counts.
+# ----------------------------------------------------------------------------#
+
+
+class CounterWatermark(db.Model):
+    """The time up to which a set of stored counters was rolled forward.
+
+    The upcoming_shows_count and past_shows_count of venues and artists
+    split their shows at the 'shows' watermark, which counters.roll_forward
+    moves up to the present, so listings show counts at most one roll
+    interval old.
+    """
+    __tablename__ = 'counter_watermark'
+
+    name = db.Column(db.String(64), primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<CounterWatermark name: {self.name} - rolled_at: {self.rolled_at}>"
+
+
+def shows_watermark(connection, for_update=False):
+    """Return the time the show counts were rolled forward to.
+
+    The row is locked, shared unless for_update, so that a show is not
+    counted against a watermark being moved.  Before the first roll
+    forward every show counts as upcoming.
+    """
+    statement = (select(CounterWatermark.rolled_at)
+                 .where(CounterWatermark.name == 'shows')
+                 .with_for_update(read=not for_update))
+    return connection.execute(statement).scalar() or datetime.min
+
+
+def adjust_show_counts(connection, shows, sign=1):
+    """Add (sign=1) or remove (sign=-1) shows, (venue_id, artist_id,
+    start_time) tuples, from the counts of their venue and artist.
+
+    Counts are incremented in the database, so concurrent bookings do
+    not lose updates.  Show inserts and deletes through the session are
+    counted by the mapper events below; bulk statements must call this.
+    """
+    rolled_at = shows_watermark(connection)
+    deltas = Counter()
+    for venue_id, artist_id, start_time in shows:
+        column = 'upcoming_shows_count' if start_time > rolled_at \
+            else 'past_shows_count'
+        deltas[Venue.__table__, venue_id, column] += sign
+        deltas[Artist.__table__, artist_id, column] += sign
+    # in a fixed order, so that concurrent transactions do not deadlock
+    for (table, id, column), delta in sorted(
+            deltas.items(), key=lambda item: (item[0][0].name, item[0][1:])):
+        if delta:
+            connection.execute(update(table)
+                               .where(table.c.id == id)
+                               .values({column: table.c[column] + delta}))
+
+
+@event.listens_for(Show, 'after_insert')
+def _count_inserted_show(mapper, connection, show):
+    adjust_show_counts(connection,
+                       [(show.venue_id, show.artist_id, show.start_time)])
+
+
+@event.listens_for(Show, 'after_delete')
+def _uncount_deleted_show(mapper, connection, show):
+    adjust_show_counts(connection,
+                       [(show.venue_id, show.artist_id, show.start_time)],
+                       sign=-1)
+
+
+@event.listens_for(Show, 'after_update')
+def _recount_updated_show(mapper, connection, show):
+    state = inspect(show)
+    columns = ('venue_id', 'artist_id', 'start_time')
+    histories = [state.attrs[column].history for column in columns]
+    if not any(history.deleted for history in histories):
+        return
+    before = tuple(history.deleted[0] if history.deleted
+                   else getattr(show, column)
+                   for column, history in zip(columns, histories))
+    adjust_show_counts(connection, [before], sign=-1)
+    adjust_show_counts(connection,
+                       [(show.venue_id, show.artist_id, show.start_time)])
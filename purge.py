@@ -0,0 +1,87 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, select
+
+from cache import invalidate
+from jobs import job
+from models import (db, Venue, Artist, Show, venue_genre, artist_genre,
+                    adjust_show_counts)
+
+
+ASSOCIATIONS = {Venue: venue_genre, Artist: artist_genre}
+
+
+def purge(model, owner_id, batch_size=1000):
+    """Delete the shows and genres of a deleted venue or artist, and
+    return how many shows were deleted.
+
+    Shows go batch_size at a time, each batch in a transaction of its
+    own, so that a venue with a hundred thousand shows does not hold
+    locks on the show table for the whole purge.  The show counts of
+    the other side are decremented along.  Until purged, the shows are
+    hidden from the pages, the API and the exports alike.
+    """
+    owner = db.session.get(model, owner_id)
+    if owner is None or owner.deleted_at is None:
+        db.session.rollback()
+        return 0
+    fk = getattr(Show, f'{model.__tablename__}_id')
+    purged = 0
+    while True:
+        shows = db.session.execute(
+            select(Show.id, Show.venue_id, Show.artist_id, Show.start_time)
+            .where(fk == owner_id)
+            .order_by(Show.id)
+            .limit(batch_size)).all()
+        if not shows:
+            break
+        connection = db.session.connection()
+        connection.execute(delete(Show.__table__).where(
+            Show.id.in_([show.id for show in shows])))
+        adjust_show_counts(connection, [tuple(show)[1:] for show in shows],
+                           sign=-1)
+        db.session.commit()
+        purged += len(shows)
+    association = ASSOCIATIONS[model]
+    db.session.execute(delete(association).where(
+        association.c[f'{model.__tablename__}_id'] == owner_id))
+    db.session.commit()
+    return purged
+
+
+@job('venue.deleted')
+def venue_deleted(venue_id):
+    purge(Venue, venue_id, current_app.config['PURGE_BATCH_SIZE'])
+    # the artist pages listed its shows
+    invalidate(f'venue:{venue_id}', 'shows')
+
+
+@job('artist.deleted')
+def artist_deleted(artist_id):
+    purge(Artist, artist_id, current_app.config['PURGE_BATCH_SIZE'])
+    # the venue pages listed its shows, the venue listing counted them
+    invalidate(f'artist:{artist_id}', 'venues', 'shows')
+
+
+@click.command('purge')
+@with_appcontext
+def purge_command():
+    """Purge the deleted venues and artists left with shows or genres,
+    e.g. when their purge jobs were lost."""
+    for model in (Venue, Artist):
+        association = ASSOCIATIONS[model]
+        owner_id = association.c[f'{model.__tablename__}_id']
+        fk = getattr(Show, f'{model.__tablename__}_id')
+        pending = db.session.execute(
+            select(model.id)
+            .where(model.deleted_at.isnot(None),
+                   select(fk).where(fk == model.id).exists()
+                   | select(owner_id).where(owner_id == model.id).exists())
+            .order_by(model.id)).scalars().all()
+        for pending_id in pending:
+            purged = purge(model, pending_id,
+                           current_app.config['PURGE_BATCH_SIZE'])
+            click.echo(f'{model.__tablename__} {pending_id}: purged '
+                       f'{purged} shows.')
+    invalidate('venues', 'artists', 'shows')
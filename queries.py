@@ -0,0 +1,372 @@
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import and_, func, literal, select, tuple_, union
+
+from models import (db, Venue, Artist, Show, Genre, venue_genre, artist_genre,
+                    MAX_SHOW_DURATION)
+
+
+# ----------------------------------------------------------------------------#
+# Listing queries.
+# ----------------------------------------------------------------------------#
+
+
+def _filter_by_genre(query, model, association, genre):
+    """Restrict query to rows of model tagged with the genre named genre.
+
+    Runs as a lookup on the unique genre.name index followed by a range
+    scan of the (genre_id, owner_id) association primary key.
+    """
+    if not genre:
+        return query
+    owner_id = association.c[f"{model.__tablename__}_id"]
+    return (query
+            .join(association, owner_id == model.id)
+            .join(Genre, Genre.id == association.c.genre_id)
+            .filter(Genre.name == genre))
+
+
+def venue_areas(genre=None):
+    """Return every venue grouped by (city, state) with its upcoming shows.
+
+    The upcoming-show counts are the ones stored on the venues, so
+    listing takes a single statement without aggregating shows, along
+    the partial index of the venues not deleted.  If genre is given,
+    only venues tagged with it are listed.
+    """
+    query = (db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                              Venue.upcoming_shows_count)
+             .filter(Venue.deleted_at.is_(None)))
+    rows = (
+        _filter_by_genre(query, Venue, venue_genre, genre)
+        .order_by(Venue.state, Venue.city, Venue.name, Venue.id)
+        .all()
+    )
+
+    areas = {}
+    for venue_id, name, city, state, upcoming in rows:
+        area = areas.setdefault((city, state), {
+            "city": city,
+            "state": state,
+            "venues": [],
+        })
+        area["venues"].append({
+            "id": venue_id,
+            "name": name,
+            "num_upcoming_shows": upcoming,
+        })
+    return list(areas.values())
+
+
+def genres_column(model, association):
+    """Correlated subquery returning the comma-joined genres of a row."""
+    owner_id = association.c[f"{model.__tablename__}_id"]
+    if db.engine.dialect.name == "postgresql":
+        names = func.string_agg(Genre.name, ",")
+    else:
+        names = func.group_concat(Genre.name, ",")
+    return (select(names)
+            .select_from(association.join(Genre,
+                                          Genre.id == association.c.genre_id))
+            .where(owner_id == model.id)
+            .scalar_subquery()
+            .label("genres"))
+
+
+def artist_list(genre=None):
+    """Return id and name of every artist, optionally only of one genre."""
+    query = (db.session.query(Artist.id, Artist.name)
+             .filter(Artist.deleted_at.is_(None)))
+    return [{"id": artist_id, "name": name} for artist_id, name in
+            _filter_by_genre(query, Artist, artist_genre, genre)
+            .order_by(Artist.name, Artist.id)]
+
+
+def search_results(model, ids):
+    """Return id, name and upcoming-show count of the given search hits,
+    in the order of ``ids``."""
+    rows = (
+        db.session.query(model.id, model.name, model.upcoming_shows_count)
+        .filter(model.id.in_(ids), model.deleted_at.is_(None))
+        .all()
+    )
+    rank = {hit_id: i for i, hit_id in enumerate(ids)}
+    return [{
+        "id": hit_id,
+        "name": name,
+        "num_upcoming_shows": num_upcoming_shows,
+    } for hit_id, name, num_upcoming_shows in sorted(
+        rows, key=lambda row: rank[row[0]])]
+
+
+# ----------------------------------------------------------------------------#
+# Detail queries.
+# ----------------------------------------------------------------------------#
+
+
+def serialize_columns(obj):
+    """Copy the mapped column values of a model instance into a dict."""
+    return {column.key: getattr(obj, column.key)
+            for column in obj.__table__.columns}
+
+
+def _show_timeline(model, entity_id, counterpart, prefix, now,
+                   past_page, per_page):
+    """Load an entity with its upcoming shows and one page of past shows.
+
+    ``model`` is the entity being displayed (Venue or Artist) and
+    ``counterpart`` the model on the other side of each show, whose name
+    and image are rendered on the show tiles under ``prefix``.  Every
+    show is classified against the same ``now`` timestamp.
+    """
+    own_fk = getattr(Show, f"{model.__tablename__}_id")
+    counterpart_fk = getattr(Show, f"{counterpart.__tablename__}_id")
+
+    # counterparts deleted, whose shows are being purged, count no more
+    upcoming_count = func.count(counterpart.id).filter(Show.start_time > now)
+    past_count = func.count(counterpart.id).filter(Show.start_time <= now)
+    row = (
+        db.session.query(model, upcoming_count, past_count)
+        .outerjoin(Show, own_fk == model.id)
+        .outerjoin(counterpart, and_(counterpart.id == counterpart_fk,
+                                     counterpart.deleted_at.is_(None)))
+        .filter(model.id == entity_id, model.deleted_at.is_(None))
+        .group_by(model.id)
+        .first()
+    )
+    if row is None:
+        return None
+    entity, upcoming_shows_count, past_shows_count = row
+
+    def shows(*criteria, order_by):
+        return (
+            db.session.query(Show.start_time, counterpart.id,
+                             counterpart.name, counterpart.image_link)
+            .join(counterpart, counterpart.id == counterpart_fk)
+            .filter(own_fk == entity_id, counterpart.deleted_at.is_(None),
+                    *criteria)
+            .order_by(*order_by)
+        )
+
+    def serialize(start_time, counterpart_id, name, image_link):
+        return {
+            f"{prefix}_id": counterpart_id,
+            f"{prefix}_name": name,
+            f"{prefix}_image_link": image_link,
+            "start_time": start_time,
+        }
+
+    past_pages = max(1, -(-past_shows_count // per_page))
+    past_page = min(max(1, past_page), past_pages)
+    upcoming = shows(Show.start_time > now,
+                     order_by=(Show.start_time, Show.id)).all()
+    past = (shows(Show.start_time <= now,
+                  order_by=(Show.start_time.desc(), Show.id.desc()))
+            .limit(per_page)
+            .offset((past_page - 1) * per_page)
+            .all())
+
+    data = serialize_columns(entity)
+    data["genres"] = [genre.name for genre in entity.genres]
+    data["upcoming_shows"] = [serialize(*show) for show in upcoming]
+    data["past_shows"] = [serialize(*show) for show in past]
+    data["upcoming_shows_count"] = upcoming_shows_count
+    data["past_shows_count"] = past_shows_count
+    data["past_shows_page"] = past_page
+    data["past_shows_pages"] = past_pages
+    return data
+
+
+def venue_detail(venue_id, past_page=1, per_page=12, reference_time=None):
+    """Return the venue page data, or None if the venue does not exist."""
+    return _show_timeline(Venue, venue_id, Artist, "artist",
+                          reference_time or datetime.now(),
+                          past_page, per_page)
+
+
+def artist_detail(artist_id, past_page=1, per_page=12, reference_time=None):
+    """Return the artist page data, or None if the artist does not exist."""
+    return _show_timeline(Artist, artist_id, Venue, "venue",
+                          reference_time or datetime.now(),
+                          past_page, per_page)
+
+
+# ----------------------------------------------------------------------------#
+# Last modification.
+# ----------------------------------------------------------------------------#
+
+
+def _latest(*times):
+    times = [time for time in times if time is not None]
+    return max(times) if times else None
+
+
+def _last_update(*models):
+    """Return the latest updated_at of the rows of models, or None if
+    there is no row.  Each maximum is read from the end of the
+    updated_at index."""
+    return _latest(*db.session.execute(
+        select(*(select(func.max(model.updated_at)).scalar_subquery()
+                 for model in models))).one())
+
+
+def venues_modified():
+    """Return the last change of the venue listing.
+
+    As for every page, a show starting counts as a change from the next
+    counters.roll_forward on, which touches its venue and artist.
+    """
+    return _last_update(Venue)
+
+
+def artists_modified():
+    return _last_update(Artist)
+
+
+def shows_modified():
+    """Return the last change of the show feed, which lists the names
+    and images of the venues and artists too."""
+    return _last_update(Show, Venue, Artist)
+
+
+def _owner_modified(model, entity_id, counterpart):
+    """Return the last change of a venue or artist page: of the entity,
+    its shows and the counterparts they show, or None if the entity does
+    not exist or was deleted."""
+    own_fk = getattr(Show, f"{model.__tablename__}_id")
+    counterpart_fk = getattr(Show, f"{counterpart.__tablename__}_id")
+    row = db.session.execute(
+        select(model.updated_at,
+               select(func.max(Show.updated_at))
+               .where(own_fk == entity_id)
+               .scalar_subquery(),
+               select(func.max(counterpart.updated_at))
+               .join(Show, counterpart_fk == counterpart.id)
+               .where(own_fk == entity_id)
+               .scalar_subquery())
+        .where(model.id == entity_id, model.deleted_at.is_(None))
+    ).first()
+    return None if row is None else _latest(*row)
+
+
+def venue_modified(venue_id):
+    return _owner_modified(Venue, venue_id, Artist)
+
+
+def artist_modified(artist_id):
+    return _owner_modified(Artist, artist_id, Venue)
+
+
+# ----------------------------------------------------------------------------#
+# Show feed.
+# ----------------------------------------------------------------------------#
+
+
+def encode_show_cursor(start_time, show_id):
+    """Encode the (start_time, id) position of a show as an opaque token."""
+    raw = f"{start_time.isoformat()}|{show_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_show_cursor(cursor):
+    """Decode a token produced by encode_show_cursor.
+
+    Raises ValueError if the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        start_time, show_id = raw.decode().split("|")
+        return datetime.fromisoformat(start_time), int(show_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError) as e:
+        raise ValueError(f"invalid cursor {cursor!r}") from e
+
+
+def show_feed(cursor=None, limit=24, upcoming_only=False,
+              start=None, end=None, reference_time=None):
+    """Return one page of shows ordered by (start_time, id).
+
+    Pages are fetched with keyset pagination: ``cursor`` is the token of
+    the last show of the previous page and the query seeks past it on the
+    ``show(start_time, id)`` index instead of skipping rows with OFFSET.
+    Returns ``(shows, next_cursor)``; ``next_cursor`` is None on the last
+    page.
+    """
+    query = (
+        db.session.query(Show.id, Show.start_time,
+                         Venue.id, Venue.name,
+                         Artist.id, Artist.name, Artist.image_link)
+        .join(Venue, Venue.id == Show.venue_id)
+        .join(Artist, Artist.id == Show.artist_id)
+        # the shows of deleted venues and artists, until purged
+        .filter(Venue.deleted_at.is_(None), Artist.deleted_at.is_(None))
+    )
+    if upcoming_only:
+        query = query.filter(Show.start_time > (reference_time
+                                                or datetime.now()))
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    if cursor is not None:
+        query = query.filter(
+            tuple_(Show.start_time, Show.id) > tuple_(*decode_show_cursor(cursor)))
+
+    rows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+
+    shows = [{
+        "venue_id": venue_id,
+        "venue_name": venue_name,
+        "artist_id": artist_id,
+        "artist_name": artist_name,
+        "artist_image_link": artist_image_link,
+        "start_time": start_time,
+    } for (_, start_time, venue_id, venue_name,
+           artist_id, artist_name, artist_image_link) in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_id, last_start_time = rows[limit - 1][:2]
+        next_cursor = encode_show_cursor(last_start_time, last_id)
+    return shows, next_cursor
+
+
+# ----------------------------------------------------------------------------#
+# Booking conflicts.
+# ----------------------------------------------------------------------------#
+
+
+def booking_conflicts(venue_id, artist_id, start_time, end_time):
+    """Return the shows overlapping [start_time, end_time) at the venue or
+    with the artist, each labelled with the ``conflict`` ('venue' or
+    'artist') it causes.
+    """
+    return booked_shows([venue_id], [artist_id], start_time, end_time)
+
+
+def booked_shows(venue_ids, artist_ids, start_time, end_time):
+    """Return the shows overlapping [start_time, end_time) at any of
+    venue_ids or with any of artist_ids, labelled as by booking_conflicts,
+    so that the slots of many shows (e.g. an import batch) within that
+    range are checked against a single query.
+
+    A show overlapping the range started less than MAX_SHOW_DURATION
+    before it, so each side is a range scan of the (venue_id, start_time)
+    or (artist_id, start_time) index bounded on both ends, however many
+    past shows there are.
+    """
+    def overlapping(kind, fk, values):
+        return (
+            select(literal(kind).label("conflict"), Show.id, Show.venue_id,
+                   Show.artist_id, Show.start_time, Show.end_time)
+            .where(fk.in_(values),
+                   Show.start_time < end_time,
+                   Show.start_time > start_time - MAX_SHOW_DURATION,
+                   Show.end_time > start_time)
+        )
+
+    statement = union(overlapping("venue", Show.venue_id, venue_ids),
+                      overlapping("artist", Show.artist_id, artist_ids))
+    return db.session.execute(
+        statement.order_by("start_time")).mappings().all()
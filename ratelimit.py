@@ -0,0 +1,100 @@
+import math
+import threading
+import time
+
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+
+
+# ----------------------------------------------------------------------------#
+# Counters.
+# ----------------------------------------------------------------------------#
+
+
+class MemoryCounter:
+    """In-process hit counters, per process like the 'lru' cache."""
+
+    # expired counters are dropped once there are this many
+    PRUNE_ABOVE = 10000
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, expires_in):
+        """Count a hit of key and return the hits counted since it was
+        first hit, up to expires_in seconds ago."""
+        now = time.monotonic()
+        with self._lock:
+            expires, count = self._counts.get(key, (0, 0))
+            if expires <= now:
+                expires, count = now + expires_in, 0
+            self._counts[key] = (expires, count + 1)
+            if len(self._counts) > self.PRUNE_ABOVE:
+                self._counts = {key: entry for key, entry
+                                in self._counts.items() if entry[0] > now}
+            return count + 1
+
+
+class RedisCounter:
+    """Hit counters shared by every process, over a redis-py client."""
+
+    def __init__(self, client, prefix='fyyur:rate:'):
+        self.client = client
+        self.prefix = prefix
+
+    def hit(self, key, expires_in):
+        key = self.prefix + key
+        count = self.client.incr(key)
+        if count == 1:
+            self.client.expire(key, math.ceil(expires_in))
+        return count
+
+
+def ratelimit_setup(app):
+    """Create the hit counters of the rate limits, shared through Redis
+    with the 'redis' CACHE_TYPE.  RATELIMIT_ENABLED turns them off."""
+    if not app.config.get('RATELIMIT_ENABLED', True):
+        return None
+    if app.config.get('CACHE_TYPE') == 'redis':
+        import redis
+        counter = RedisCounter(
+            redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+    else:
+        counter = MemoryCounter()
+    app.extensions['rate_limiter'] = counter
+    return counter
+
+
+# ----------------------------------------------------------------------------#
+# Limits.
+# ----------------------------------------------------------------------------#
+
+
+def rate_limit(blueprint, limit, per=60, methods=None):
+    """Allow each client limit requests to a blueprint every per seconds,
+    and answer 429 Too Many Requests past it.
+
+    Clients are told apart by address: behind a proxy or a CDN, the app
+    must be wrapped in werkzeug's ProxyFix for it to be theirs.  With
+    methods, only the requests of those methods are counted and limited,
+    so writes can be limited apart from reads.
+    """
+    scope = f"{blueprint.name}:{','.join(sorted(methods or ['*']))}"
+
+    @blueprint.before_request
+    def check_rate_limit():
+        counter = current_app.extensions.get('rate_limiter')
+        if counter is None or methods and request.method not in methods:
+            return None
+        now = time.time()
+        window = int(now // per)
+        count = counter.hit(f'{scope}:{request.remote_addr}:{window}',
+                            (window + 1) * per - now)
+        if count > limit:
+            raise TooManyRequests(
+                f'More than {limit} requests in {per} seconds.',
+                retry_after=math.ceil((window + 1) * per - now))
+        return None
+
+    return check_rate_limit
@@ -0,0 +1,163 @@
+import itertools
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+
+# ----------------------------------------------------------------------------#
+# Replicas.
+# ----------------------------------------------------------------------------#
+
+
+class ReplicaSet:
+    """The read replica engines, picked round-robin among the healthy ones.
+
+    A replica whose connection fails is ejected for ``retry_after``
+    seconds, after which it is tried again.
+    """
+
+    def __init__(self, engines, retry_after=30, logger=None):
+        self.engines = engines
+        self.retry_after = retry_after
+        self.logger = logger
+        self.ejected_until = {}
+        self.ejections = dict.fromkeys(engines, 0)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        for name, engine in engines.items():
+            event.listen(engine, 'handle_error', self._error_handler(name))
+
+    def _error_handler(self, name):
+        def handle_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.eject(name, context.original_exception)
+        return handle_error
+
+    def eject(self, name, reason=None):
+        with self._lock:
+            self.ejected_until[name] = time.monotonic() + self.retry_after
+            self.ejections[name] += 1
+        if self.logger is not None:
+            self.logger.warning(f'replica {name} ejected for '
+                                f'{self.retry_after}s: {reason}')
+
+    def healthy(self):
+        now = time.monotonic()
+        return [name for name in self.engines
+                if self.ejected_until.get(name, 0) <= now]
+
+    def choose(self):
+        """Return a healthy replica engine, or None if there is none."""
+        names = self.healthy()
+        if not names:
+            return None
+        return self.engines[names[next(self._counter) % len(names)]]
+
+    def snapshot(self):
+        healthy = self.healthy()
+        return {name: {'healthy': name in healthy,
+                       'ejections': self.ejections[name]}
+                for name in self.engines}
+
+
+# ----------------------------------------------------------------------------#
+# Routing session.
+# ----------------------------------------------------------------------------#
+
+
+def pinned_to_primary():
+    """Whether the client of the request wrote in the last
+    DB_READ_AFTER_WRITE_WINDOW seconds: replicas may not have its write
+    yet."""
+    return session.get('_primary_until', 0) > time.time()
+
+
+def _reads_from_replica():
+    if not has_request_context():
+        return False
+    if request.method not in ('GET', 'HEAD') and not g.get('use_replica'):
+        return False
+    return not pinned_to_primary()
+
+
+class RoutingSession(Session):
+    """Session sending the reads of GET requests (and of views marked
+    with reads_from_replica) to a replica, everything else to the primary.
+
+    Once a session has written, it reads from the primary too, and so
+    does the client for DB_READ_AFTER_WRITE_WINDOW seconds.  Requests
+    which read from a replica set ``g.read_from_replica``, for the
+    response cache.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing \
+                and not self.info.get('wrote') \
+                and (clause is None or getattr(clause, 'is_select', False)):
+            replicas = current_app.extensions.get('replicas') \
+                if has_request_context() else None
+            if replicas is not None and _reads_from_replica():
+                engine = replicas.choose()
+                if engine is not None:
+                    g.read_from_replica = True
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(state):
+    if not state.is_select:
+        state.session.info['wrote'] = True
+
+
+def reads_from_replica(view):
+    """Let a view that does not write, such as a search form posted with
+    POST, read from the replicas like GET views do."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def routing_setup(app, db):
+    """Route reads to the DB_REPLICA_URIS replicas, see RoutingSession.
+
+    The replicas are configured as SQLALCHEMY_BINDS replica_0, replica_1
+    ..., before db.init_app.
+    """
+    names = [name for name in app.config.get('SQLALCHEMY_BINDS', {})
+             if name.startswith('replica_')]
+    if not names:
+        return None
+    with app.app_context():
+        replicas = ReplicaSet(
+            {name: db.engines[name] for name in names},
+            retry_after=app.config.get('DB_REPLICA_RETRY_AFTER', 30),
+            logger=app.logger)
+    app.extensions['replicas'] = replicas
+    window = app.config.get('DB_READ_AFTER_WRITE_WINDOW', 5)
+
+    @app.after_request
+    def pin_to_primary(response):
+        if db.session().info.get('wrote'):
+            session['_primary_until'] = time.time() + window
+        return response
+
+    return replicas
+
+
+def replica_binds(uris):
+    """Return the SQLALCHEMY_BINDS of a comma separated list of URIs."""
+    return {f'replica_{number}': uri.strip() for number, uri in
+            enumerate(uri for uri in (uris or '').split(',') if uri.strip())}
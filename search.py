@@ -0,0 +1,225 @@
+import bisect
+import re
+from collections import defaultdict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, literal_column, or_
+from sqlalchemy.orm import Session
+
+from models import db, Venue, Artist, Genre
+
+
+# ----------------------------------------------------------------------------#
+# Search fields.
+# ----------------------------------------------------------------------------#
+
+# Searchable columns and their weight, mirroring the setweight() labels
+# of the Postgres search_vector columns (A=4, B=2, C=1).
+SEARCH_FIELDS = {
+    'name': 4,
+    'city': 2,
+    'state': 2,
+    'genres': 1,
+}
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens ("Hip-Hop" -> hip, hop)."""
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+# ----------------------------------------------------------------------------#
+# In-process inverted index.
+# ----------------------------------------------------------------------------#
+
+
+class InvertedIndex:
+    """A token -> {id: weight} index used when Postgres is not available.
+
+    Query terms are matched as prefixes, the same way the Postgres search
+    matches ``term:*``, and every term of the query must match.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self._tokens = []
+        self._dirty = False
+
+    def add(self, doc_id, fields):
+        self.remove(doc_id)
+        weights = {}
+        for field, weight in SEARCH_FIELDS.items():
+            for token in tokenize(fields.get(field)):
+                weights[token] = max(weights.get(token, 0), weight)
+        for token, weight in weights.items():
+            self.postings[token][doc_id] = weight
+        self.documents[doc_id] = tuple(weights)
+        self._dirty = True
+
+    def remove(self, doc_id):
+        for token in self.documents.pop(doc_id, ()):
+            self.postings[token].pop(doc_id, None)
+            if not self.postings[token]:
+                del self.postings[token]
+        self._dirty = True
+
+    def _prefixed(self, prefix):
+        if self._dirty:
+            self._tokens = sorted(self.postings)
+            self._dirty = False
+        start = bisect.bisect_left(self._tokens, prefix)
+        for token in self._tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def search(self, term):
+        """Return matching ids, best match first."""
+        terms = tokenize(term)
+        if not terms:
+            return sorted(self.documents)
+        scores = None
+        for query_term in terms:
+            matches = {}
+            for token in self._prefixed(query_term):
+                for doc_id, weight in self.postings[token].items():
+                    matches[doc_id] = max(matches.get(doc_id, 0), weight)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {doc_id: score + matches[doc_id]
+                          for doc_id, score in scores.items()
+                          if doc_id in matches}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+
+
+def _document(obj):
+    return {
+        'name': obj.name,
+        'city': obj.city,
+        'state': obj.state,
+        'genres': ' '.join(genre.name for genre in obj.genres),
+    }
+
+
+def _inverted_index(model):
+    indexes = current_app.extensions.setdefault('search_indexes', {})
+    index = indexes.get(model)
+    if index is None:
+        genres = defaultdict(list)
+        for owner_id, name in (db.session.query(model.id, Genre.name)
+                               .join(model.genres)):
+            genres[owner_id].append(name)
+        index = InvertedIndex()
+        for owner_id, name, city, state in db.session.query(
+                model.id, model.name, model.city, model.state
+        ).filter(model.deleted_at.is_(None)):
+            index.add(owner_id, {'name': name, 'city': city, 'state': state,
+                                 'genres': ' '.join(genres[owner_id])})
+        indexes[model] = index
+    return index
+
+
+def reset_index(model):
+    """Drop the in-process index of model, e.g. after a bulk insert that
+    bypassed the session; it is rebuilt on the next search."""
+    current_app.extensions.get('search_indexes', {}).pop(model, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_search_changes(session, flush_context):
+    pending = session.info.setdefault('search_pending', {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, (Venue, Artist)):
+            pending[(type(obj), obj.id)] = \
+                None if obj.deleted_at else _document(obj)
+    for obj in session.deleted:
+        if isinstance(obj, (Venue, Artist)):
+            pending[(type(obj), obj.id)] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_search_changes(session):
+    pending = session.info.pop('search_pending', None)
+    if not pending or not has_app_context():
+        return
+    indexes = current_app.extensions.get('search_indexes', {})
+    for (model, doc_id), fields in pending.items():
+        index = indexes.get(model)
+        if index is None:
+            continue
+        if fields is None:
+            index.remove(doc_id)
+        else:
+            index.add(doc_id, fields)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_search_changes(session):
+    session.info.pop('search_pending', None)
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+
+def _postgres_query(model, term):
+    """Return the query of the ids of model rows matching term on
+    Postgres, best match first.
+
+    Its filter is an OR of the ``search_vector`` GIN index and the
+    ``name`` trigram index, which Postgres combines in a BitmapOr: genre
+    names are part of search_vector, through the genre_text column the
+    genre association tables keep up to date.
+    """
+    terms = tokenize(term)
+    vector = literal_column(f'{model.__tablename__}.search_vector')
+    matches = func.to_tsquery(
+        'simple', ' & '.join(f'{query_term}:*' for query_term in terms))
+    tsquery = func.to_tsquery(
+        'simple', ' | '.join(f'{query_term}:*' for query_term in terms))
+    escaped = re.sub(r'([\\%_])', r'\\\1', term)
+    return (
+        db.session.query(model.id)
+        .filter(model.deleted_at.is_(None))
+        .filter(or_(vector.op('@@')(matches),
+                    model.name.ilike(f'%{escaped}%', escape='\\')))
+        .order_by(func.ts_rank(vector, tsquery).desc(),
+                  func.similarity(model.name, term).desc(),
+                  model.id)
+    )
+
+
+def _postgres_search(model, term, limit, offset):
+    if tokenize(term):
+        query = _postgres_query(model, term)
+    else:
+        query = (db.session.query(model.id)
+                 .filter(model.deleted_at.is_(None))
+                 .order_by(model.id))
+    return query.count(), [row[0] for row in
+                           query.limit(limit).offset(offset)]
+
+
+def search(model, term, limit=None, offset=0):
+    """Return ``(total, ids)`` of ``model`` rows matching ``term``.
+
+    ``ids`` holds at most ``limit`` ids starting at ``offset``, best match
+    first, and ``total`` is the number of matches across all pages.
+
+    Name, city, state and genres are searched.  On Postgres the query runs
+    against the ``search_vector`` GIN index and the ``name`` trigram index;
+    other databases use an in-process inverted index kept in sync on
+    commit.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return _postgres_search(model, term, limit, offset)
+    ids = _inverted_index(model).search(term)
+    end = None if limit is None else offset + limit
+    return len(ids), ids[offset:end]
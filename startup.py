@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+import sys
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+# Modules create_app leaves to the first request needing them, see
+# warm_up.
+DEFERRED_IMPORTS = ['forms', 'babel.dates', 'dateutil.parser']
+
+# Run in a fresh interpreter by startup_profile, which times it with
+# python -X importtime.
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000,
+                  'create_ms': (created - imported) * 1000,
+                  'first_request_ms': (done - created) * 1000,
+                  'total_ms': (done - started) * 1000,
+                  'status': response.status_code}))
+"""
+
+
+def warm_up(app):
+    """Import the deferred modules and compile the templates, the work
+    otherwise left to the first requests.
+
+    For servers: with gunicorn's preload_app, it is done once in the
+    master and the forked workers share the result.
+    """
+    for name in DEFERRED_IMPORTS:
+        __import__(name)
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+
+def parse_importtime(output):
+    """Return {module: (self_us, cumulative_us)} of python -X importtime
+    output."""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def startup_profile(path='/', root_path=None):
+    """Time a cold start, from the imports to the first response, in a
+    new interpreter.  Returns (timings, modules), see parse_importtime."""
+    environment = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, path],
+        cwd=root_path, env=environment, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f'the startup probe failed:\n{result.stderr}')
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(result.stderr)
+
+
+@click.command('startup-profile')
+@click.option('--path', default='/', show_default=True,
+              help='Path of the first request.')
+@click.option('--top', default=25, show_default=True,
+              help='Number of modules listed.')
+@click.option('--budget', type=float,
+              help='Time to first request allowed, in milliseconds; '
+                   'STARTUP_BUDGET_MS if omitted.')
+@with_appcontext
+def startup_profile_command(path, top, budget):
+    """Report the import time of each module and the time to the first
+    request of a cold start, failing over the budget."""
+    timings, modules = startup_profile(path, current_app.root_path)
+    packages = {}
+    for name, (self_us, _) in modules.items():
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    click.echo(f"{'package':32} {'self ms':>9}")
+    for package, self_us in sorted(packages.items(),
+                                   key=lambda item: -item[1])[:top]:
+        click.echo(f'{package:32} {self_us / 1000:9.1f}')
+    click.echo(f"\n{'module':48} {'cumulative ms':>14}")
+    for name, (_, cumulative_us) in sorted(modules.items(),
+                                           key=lambda item: -item[1][1])[:top]:
+        click.echo(f'{name:48} {cumulative_us / 1000:14.1f}')
+    click.echo(f"\nimports {timings['import_ms']:.0f} ms, create_app "
+               f"{timings['create_ms']:.0f} ms, first request "
+               f"{timings['first_request_ms']:.0f} ms (status "
+               f"{timings['status']}): {timings['total_ms']:.0f} ms to the "
+               f"first response")
+    budget = budget or current_app.config.get('STARTUP_BUDGET_MS')
+    if budget and timings['total_ms'] > budget:
+        raise click.ClickException(
+            f"the first response took {timings['total_ms']:.0f} ms, over "
+            f"the {budget:.0f} ms budget")
@@ -3,14 +3,15 @@ window.parseISOString = function parseISOString(s) {
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
 
-// delete btn venue
-deleteBtn = document.querySelectorAll(".delete-venue")[0]
-if (deleteBtn) {
+// delete btn venue / artist
+document.querySelectorAll(".delete-venue, .delete-artist").forEach(function(deleteBtn) {
 deleteBtn.onclick = function(e) {
-	const venueId = e.target.dataset.id;
-	fetch('/venues/'+ venueId,{
+	fetch(e.target.dataset.url,{
 	  method: 'DELETE'
-	}).then(function() {
+	}).then(function(response) {
+		if (!response.ok) {
+			throw new Error(response.statusText);
+		}
 		document.getElementById("error").className = "hidden";
 		window.location.replace("/");
 	  })
@@ -19,4 +20,4 @@ deleteBtn.onclick = function(e) {
 		document.getElementById("error").className = "";
 	  });
   };
-}
\ No newline at end of file
+});
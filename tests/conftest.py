@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Create applications on an SQLite database of their own, with
+    config overriding the test settings."""
+    from app import create_app
+    from models import db
+
+    def make_app(**config):
+        settings = {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'fyyur.db'}",
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'RATELIMIT_ENABLED': False,
+            'JOBS_BACKEND': 'sync',
+            'IMAGE_CACHE_DIR': str(tmp_path / 'images'),
+        }
+        settings.update(config)
+        app = create_app(settings)
+        with app.app_context():
+            db.create_all(bind_key=None)
+        return app
+
+    return make_app
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
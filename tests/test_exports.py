@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from exporter import export, export_statement
+from models import db, Venue, Artist, Show
+
+
+@pytest.fixture
+def catalog(app):
+    """An artist with a show at each of two venues, then a watermark."""
+    with app.app_context():
+        artist = Artist(name='Guns N Petals', city='San Francisco',
+                        state='CA')
+        venues = [Venue(name=name, city='San Francisco', state='CA',
+                        address='1015 Folsom Street')
+                  for name in ('The Musical Hop', 'Park Square')]
+        db.session.add_all([artist] + venues)
+        db.session.flush()
+        start = datetime(2035, 4, 1, 20)
+        for venue in venues:
+            db.session.add(Show(artist_id=artist.id, venue_id=venue.id,
+                                start_time=start,
+                                end_time=start + timedelta(hours=2)))
+        db.session.commit()
+    return datetime.utcnow() + timedelta(milliseconds=1)
+
+
+def _rows(kind, **options):
+    return db.session.execute(
+        export_statement(kind, **options)).mappings().all()
+
+
+def test_changed_since_exports_edits(app, catalog):
+    with app.app_context():
+        assert _rows('venues', changed_since=catalog) == []
+        db.session.get(Venue, 1).phone = '123-123-1234'
+        db.session.commit()
+        rows = _rows('venues', changed_since=catalog)
+        # created before the watermark, so after_id would miss it
+        assert _rows('venues', after_id=2) == []
+    assert [(row['id'], row['phone'], row['deleted_at']) for row in rows] \
+        == [(1, '123-123-1234', None)]
+
+
+def test_changed_since_exports_tombstones(app, catalog):
+    with app.app_context():
+        db.session.get(Venue, 2).deleted_at = datetime.utcnow()
+        db.session.commit()
+        venues = _rows('venues', changed_since=catalog)
+        shows = _rows('shows', changed_since=catalog)
+        assert [row['id'] for row in _rows('venues')] == [1]
+    assert [(row['id'], row['name'], row['deleted_at'] is not None)
+            for row in venues] == [(2, None, True)]
+    assert [(row['venue_id'], row['start_time'], row['deleted_at'] is not None)
+            for row in shows] == [(None, None, True)]
+
+
+@pytest.mark.parametrize('format', ['csv', 'ndjson', 'parquet'])
+def test_tombstones_encode(app, catalog, format):
+    if format == 'parquet':
+        pytest.importorskip('pyarrow')
+    with app.app_context():
+        db.session.get(Venue, 2).deleted_at = datetime.utcnow()
+        db.session.commit()
+        for kind in ('venues', 'shows'):
+            assert b''.join(export(kind, format, changed_since=catalog))
+
+
+def test_export_download_rejects_bad_watermarks(app):
+    client = app.test_client()
+    assert client.get('/export/venues?changed_since=yesterday').status_code \
+        == 400
+    assert client.get('/export/venues?changed_since=2030-01-01T00:00:00'
+                      ).status_code == 200
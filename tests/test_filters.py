@@ -0,0 +1,13 @@
+from datetime import datetime, timezone
+
+from filters import format_datetime
+
+
+def test_naive_show_times_are_wall_clock_times_of_the_timezone(make_app):
+    app = make_app(DATETIME_TIMEZONE='America/Los_Angeles')
+    with app.app_context():
+        assert format_datetime(datetime(2030, 5, 21, 21, 30), 'H:mm z') \
+            == '21:30 PDT'
+        assert format_datetime(datetime(2030, 5, 21, 21, 30,
+                                        tzinfo=timezone.utc),
+                               'H:mm z') == '14:30 PDT'
@@ -0,0 +1,113 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import images
+from images import ImageFetchError, fetch
+
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 16
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Serves /image.png, redirects /redirect?to=<url> and records the
+    paths asked for."""
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        if self.path.startswith('/redirect?to='):
+            self.send_response(302)
+            self.send_header('Location', self.path[len('/redirect?to='):])
+            self.end_headers()
+        elif self.path == '/image.png':
+            self.server.hosts.append(self.headers['Host'])
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(PNG)))
+            self.end_headers()
+            self.wfile.write(PNG)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    """A local server taken for a public host: 127.0.0.1 counts as
+    public, every other address as usual."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    server.paths, server.hosts = [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    is_public = images._is_public
+    monkeypatch.setattr(images, '_is_public',
+                        lambda address: address == '127.0.0.1'
+                        or is_public(address))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_follows_public_redirects(stand_in):
+    port = stand_in.server_address[1]
+    content, content_type = fetch(
+        f'http://127.0.0.1:{port}/redirect?to=/image.png')
+    assert (content, content_type) == (PNG, 'image/png')
+    assert stand_in.hosts == [f'127.0.0.1:{port}']
+
+
+@pytest.mark.parametrize('target', ['http://127.0.0.2:{port}/image.png',
+                                    'http://[::1]:{port}/image.png',
+                                    'http://169.254.169.254/latest/'])
+def test_fetch_refuses_redirects_to_private_hosts(stand_in, target):
+    port = stand_in.server_address[1]
+    with pytest.raises(ImageFetchError, match='not a public host'):
+        fetch(f'http://127.0.0.1:{port}/redirect?to='
+              + target.format(port=port))
+    assert stand_in.paths == [f'/redirect?to={target.format(port=port)}']
+
+
+def test_fetch_connects_to_the_address_checked(stand_in, monkeypatch):
+    """A host resolving to another address on the second lookup is still
+    reached at the first one, with its name in the Host header."""
+    port = stand_in.server_address[1]
+    answers = iter(['127.0.0.1', '127.0.0.2'])
+
+    getaddrinfo = images.socket.getaddrinfo
+
+    def rebinding(host, port, *args, **kwargs):
+        if host != 'images.example':
+            return getaddrinfo(host, port, *args, **kwargs)
+        return [(None, None, None, '', (next(answers), port))]
+
+    monkeypatch.setattr(images.socket, 'getaddrinfo', rebinding)
+    assert fetch(f'http://images.example:{port}/image.png')[0] == PNG
+    assert stand_in.hosts == [f'images.example:{port}']
+
+
+def test_fetch_gives_up_on_redirect_loops(stand_in):
+    port = stand_in.server_address[1]
+    url = f'http://127.0.0.1:{port}/redirect?to=/redirect?to=/redirect?to='
+    with pytest.raises(ImageFetchError):
+        fetch(url + '/redirect?to=' * images.MAX_REDIRECTS)
+
+
+def test_new_venues_get_their_thumbnails_ahead(app, stand_in, monkeypatch):
+    monkeypatch.setattr(images, 'thumbnails', lambda content, sizes: None)
+    link = f'http://127.0.0.1:{stand_in.server_address[1]}/image.png'
+    client = app.test_client()
+    response = client.post('/venues/create', data={
+        'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+        'address': '1015 Folsom Street', 'phone': '123-123-1234',
+        'image_link': link,
+        'website_link': 'https://www.themusicalhop.com', 'genres': ['Jazz']})
+    assert response.status_code == 200
+    assert stand_in.paths == ['/image.png']
+    with app.test_request_context():
+        url = images.image_url(link, 'detail')
+    assert client.get(url).data == PNG
+    assert app.extensions['image_proxy'].fetches == 1
@@ -0,0 +1,86 @@
+import io
+from datetime import datetime
+
+from sqlalchemy import event
+
+from importer import import_stream
+from models import db, Venue, Artist, Show
+
+
+VENUE = ('{"name": "The Musical Hop", "city": "San Francisco", '
+         '"state": "CA", "address": "1015 Folsom Street", '
+         '"phone": "123-123-1234", '
+         '"website_link": "https://www.themusicalhop.com", '
+         '"genres": ["Jazz"]}\n')
+
+
+def test_ndjson_import_reports_lines_that_are_not_objects(app):
+    lines = VENUE + '{"name": \n' + '[1, 2]\n' + '\n' + VENUE
+    with app.app_context():
+        report = import_stream('venues', io.BytesIO(lines.encode()),
+                               'ndjson', batch_size=1)
+        assert db.session.query(Venue).count() == 2
+    assert (report.inserted, report.failed) == (2, 2)
+    assert [error['row'] for error in report.errors] == [2, 3]
+    assert report.errors[0]['errors']['row'][0].startswith('Not valid JSON')
+    assert report.errors[1]['errors'] == {'row': ['Not a JSON object.']}
+
+
+def test_import_upload_survives_malformed_lines(app):
+    response = app.test_client().post(
+        '/import/venues', data=b'{"name": \n' + VENUE.encode(),
+        content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.get_json()['inserted'] == 1
+
+
+def test_imported_venues_keep_their_genres(app):
+    lines = VENUE + VENUE.replace('Jazz', 'Folk') * 2
+    with app.app_context():
+        db.session.add(Venue(name='Park Square', city='San Francisco',
+                             state='CA', address='34 Whiskey Moore Ave'))
+        db.session.commit()
+        report = import_stream('venues', io.BytesIO(lines.encode()),
+                               'ndjson', batch_size=2)
+        genres = [[genre.name for genre in venue.genres]
+                  for venue in Venue.query.order_by(Venue.id)]
+    assert report.inserted == 3
+    assert genres == [[], ['Jazz'], ['Folk'], ['Folk']]
+
+
+def test_show_import_checks_conflicts_once_per_batch(app):
+    shows = ''.join(
+        f'{{"artist_id": 1, "venue_id": 1, "start_time": "{start}", '
+        f'"duration": 120}}\n'
+        for start in ('2030-01-01 20:30:00', '2030-01-02 20:00:00',
+                      '2030-01-02 21:00:00', '2030-01-03 20:00:00'))
+    selects = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and 'FROM show' in statement:
+            selects.append(statement)
+
+    with app.app_context():
+        venue = Venue(name='The Musical Hop', city='San Francisco',
+                      state='CA', address='1015 Folsom Street')
+        artist = Artist(name='Guns N Petals', city='San Francisco',
+                        state='CA')
+        db.session.add(Show(venue=venue, artist=artist,
+                            start_time=datetime(2030, 1, 1, 20),
+                            end_time=datetime(2030, 1, 1, 22)))
+        db.session.commit()
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            report = import_stream('shows', io.BytesIO(shows.encode()),
+                                   'ndjson', batch_size=4)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+    assert report.inserted == 2
+    assert [(error['row'], error['errors']['start_time']) for error in
+            report.errors] == [
+        (1, ['The venue is already booked (show 1).',
+             'The artist is already booked (show 1).']),
+        (3, ['The venue is already booked by an earlier row.',
+             'The artist is already booked by an earlier row.']),
+    ]
+    assert len(selects) == 1
@@ -0,0 +1,79 @@
+import json
+import logging
+import threading
+
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool
+
+from instrumentation import PoolStats
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}",
+                           poolclass=QueuePool, pool_size=1, max_overflow=0,
+                           pool_timeout=0.2)
+    yield engine
+    engine.dispose()
+
+
+def test_pool_stats_count_waits_and_timeouts(engine):
+    stats = PoolStats(engine)
+    held = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    threading.Timer(0.05, held.close).start()
+    engine.connect().close()
+    snapshot = stats.snapshot()
+    assert (snapshot['checkouts'], snapshot['waits'],
+            snapshot['timeouts']) == (2, 2, 1)
+    assert snapshot['wait_ms'] >= 200
+
+
+def test_pool_stats_count_waits_after_dispose(engine):
+    stats = PoolStats(engine)
+    engine.dispose()
+    held = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    held.close()
+    assert stats.snapshot()['timeouts'] == 1
+
+
+@pytest.fixture
+def query_log(caplog):
+    """caplog, also receiving the fyyur.queries lines, which do not
+    propagate to the root logger."""
+    query_logger = logging.getLogger('fyyur.queries')
+    query_logger.addHandler(caplog.handler)
+    yield caplog
+    query_logger.removeHandler(caplog.handler)
+
+
+def test_query_stats_are_bare_json_lines(app, query_log):
+    app.test_client().get('/api/v1/venues')
+    query_logger = logging.getLogger('fyyur.queries')
+    handler = query_logger.handlers[0]
+    line = json.loads(handler.format(query_log.records[-1]))
+    assert (line['event'], line['path']) == ('request_queries',
+                                             '/api/v1/venues')
+    assert not query_logger.propagate
+
+
+def test_streamed_exports_log_their_queries_once_sent(app, query_log):
+    caplog = query_log
+    response = app.test_client().get('/export/venues')
+    assert response.status_code == 200
+    assert 'X-DB-Query-Count' not in response.headers
+    response.get_data()
+    response.close()
+    lines = [json.loads(record.getMessage()) for record in caplog.records
+             if 'request_queries' in record.getMessage()]
+    assert lines[-1]['path'] == '/export/venues'
+    assert lines[-1]['streamed'] and lines[-1]['query_count'] >= 1
+
+
+def test_responses_report_their_queries_in_headers(app):
+    response = app.test_client().get('/api/v1/venues')
+    assert int(response.headers['X-DB-Query-Count']) >= 1
@@ -0,0 +1,78 @@
+import flask
+import pytest
+
+import jobs
+from jobs import Job, JobQueue, SQLiteBroker, Worker
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return SQLiteBroker(str(tmp_path / 'jobs.db'), poll_interval=0.01)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Register test.record, which records its payloads and fails while
+    payload['fail'] is positive."""
+    calls = []
+
+    def record(**payload):
+        calls.append(payload)
+        if payload.get('fail', 0) >= len(calls):
+            raise ValueError('failing on purpose')
+
+    monkeypatch.setitem(jobs.JOBS, 'test.record', record)
+    return calls
+
+
+def test_sqlite_broker_drops_repeated_keys(broker):
+    assert broker.publish(Job('test.record', {'n': 1}, key='once'))
+    assert not broker.publish(Job('test.record', {'n': 2}, key='once'))
+    job = broker.reserve(timeout=0)
+    assert (job.name, job.payload, job.attempts) == ('test.record', {'n': 1}, 1)
+    broker.ack(job)
+    assert broker.reserve(timeout=0) is None
+    # acked keys are remembered
+    assert not broker.publish(Job('test.record', {'n': 3}, key='once'))
+
+
+def test_sqlite_broker_hands_out_unacked_jobs_again(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / 'jobs.db'), visibility_timeout=0)
+    broker.publish(Job('test.record', {}))
+    first = broker.reserve(timeout=0)
+    again = broker.reserve(timeout=0)
+    assert again.id == first.id and again.attempts == 2
+
+
+def test_worker_retries_jobs_of_the_sqlite_broker(broker, calls):
+    app = flask.Flask(__name__)
+    broker.publish(Job('test.record', {'fail': 1}, max_attempts=2))
+    broker.publish(Job('test.record', {'fail': 5}, max_attempts=2))
+    worker = Worker(app, broker, retry_delay=0, poll_interval=0.01)
+    worker.start(burst=True)
+    worker.join()
+    assert len(calls) == 4
+    assert broker.reserve(timeout=0) is None
+
+
+def test_sqlite_backend_refuses_the_lru_cache(make_app, tmp_path):
+    with pytest.raises(RuntimeError, match='CACHE_TYPE'):
+        make_app(JOBS_BACKEND='sqlite', CACHE_TYPE='lru',
+                 JOBS_SQLITE_PATH=str(tmp_path / 'jobs.db'))
+
+
+def test_writes_invalidate_before_their_jobs_run(app, tmp_path):
+    """With the jobs queued for a worker that has not run them yet, the
+    listing already shows the new venue."""
+    queue = app.extensions['jobs']
+    app.extensions['jobs'] = JobQueue(
+        app, 'sqlite', SQLiteBroker(str(tmp_path / 'jobs.db')),
+        max_attempts=queue.max_attempts, retry_delay=0, concurrency=1)
+    client = app.test_client()
+    assert b'The Musical Hop' not in client.get('/venues').data
+    response = client.post('/venues/create', data={
+        'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+        'address': '1015 Folsom Street', 'phone': '123-123-1234',
+        'website_link': 'https://www.themusicalhop.com', 'genres': ['Jazz']})
+    assert response.status_code == 200
+    assert b'The Musical Hop' in client.get('/venues').data
@@ -0,0 +1,27 @@
+import logging
+
+
+def _file_handlers(app, path):
+    return [handler for handler in app.logger.handlers
+            if getattr(handler, 'baseFilename', None) == str(path)]
+
+
+def test_apps_share_one_log_file_handler(make_app, tmp_path):
+    path = tmp_path / 'fyyur.log'
+    app = make_app(TESTING=False, LOG_FILE=str(path))
+    try:
+        make_app(TESTING=False, LOG_FILE=str(path))
+        assert len(_file_handlers(app, path)) == 1
+        app.logger.warning('written once')
+        assert path.read_text().count('written once') == 1
+    finally:
+        for handler in _file_handlers(app, path):
+            app.logger.removeHandler(handler)
+            handler.close()
+
+
+def test_tests_do_not_write_the_log_file(make_app, tmp_path):
+    path = tmp_path / 'fyyur.log'
+    app = make_app(LOG_FILE=str(path))
+    assert not _file_handlers(app, path)
+    assert app.logger.getEffectiveLevel() == logging.INFO
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Venue, Artist, Show, Genre
+
+
+def _add_venues(count):
+    """Add count venues across a few cities, each with a genre and an
+    upcoming show of one artist."""
+    artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+    db.session.add(artist)
+    start = datetime.now() + timedelta(days=30)
+    for number in range(count):
+        venue = Venue(name=f'Venue {number}', city=f'City {number % 3}',
+                      state='CA', address='1015 Folsom Street',
+                      genres=Genre.from_names(['Jazz']))
+        db.session.add(venue)
+        db.session.flush()
+        db.session.add(Show(artist=artist, venue=venue,
+                            start_time=start + timedelta(hours=3 * number),
+                            end_time=start + timedelta(hours=3 * number + 2)))
+        db.session.commit()
+
+
+def _statements(app, path):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = app.test_client().get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('path', ['/venues', '/venues?genre=Jazz'])
+def test_venue_listing_statements_do_not_grow_with_venues(make_app, path):
+    app = make_app(CACHE_TYPE='null')
+    counts = []
+    for count in (5, 45):
+        with app.app_context():
+            _add_venues(count)
+        counts.append(_statements(app, path))
+    assert counts[0] == counts[1]
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db, Venue
+
+
+VENUE_FORM = {'name': 'The Musical Hop', 'city': 'San Francisco',
+              'state': 'CA', 'address': '1015 Folsom Street',
+              'phone': '123-123-1234',
+              'website_link': 'https://www.themusicalhop.com',
+              'genres': ['Jazz']}
+
+
+def _names(client):
+    response = client.get('/api/v1/venues?fields=name')
+    assert response.status_code == 200
+    return [venue['name'] for venue in response.get_json()['data']]
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    """A primary and a replica told apart by the name of their venue."""
+    app = make_app(CACHE_TYPE='null',
+                   DB_REPLICA_URIS=f"sqlite:///{tmp_path / 'replica.db'}")
+    with app.app_context():
+        db.metadata.create_all(db.engines['replica_0'])
+        for engine, name in ((db.engines['replica_0'], 'On the replica'),
+                             (db.engine, 'On the primary')):
+            with engine.begin() as connection:
+                connection.execute(Venue.__table__.insert(), {
+                    'name': name, 'city': 'San Francisco', 'state': 'CA',
+                    'address': '1015 Folsom Street'})
+    return app
+
+
+def test_reads_go_to_the_replica(app):
+    assert _names(app.test_client()) == ['On the replica']
+
+
+def test_writes_pin_the_client_to_the_primary(app):
+    client = app.test_client()
+    assert client.post('/venues/create', data=VENUE_FORM).status_code == 200
+    assert _names(client) == ['On the primary', 'The Musical Hop']
+    # other clients still read from the replica
+    assert _names(app.test_client()) == ['On the replica']
+
+
+def test_failing_replicas_are_ejected(make_app, tmp_path):
+    app = make_app(
+        CACHE_TYPE='null',
+        DB_REPLICA_URIS=f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    with app.app_context():
+        db.session.add(Venue(name='On the primary', city='San Francisco',
+                             state='CA', address='1015 Folsom Street'))
+        db.session.commit()
+    replicas = app.extensions['replicas']
+    client = app.test_client()
+    with pytest.raises(OperationalError):
+        client.get('/api/v1/venues')
+    assert replicas.snapshot() == {
+        'replica_0': {'healthy': False, 'ejections': 1}}
+    assert _names(client) == ['On the primary']
+
+
+def test_cached_pages_keep_the_writes_of_the_client(make_app, tmp_path):
+    app = make_app(CACHE_TYPE='lru',
+                   DB_REPLICA_URIS=f"sqlite:///{tmp_path / 'replica.db'}")
+    with app.app_context():
+        db.metadata.create_all(db.engines['replica_0'])
+    writer, other = app.test_client(), app.test_client()
+    assert writer.post('/venues/create', data=VENUE_FORM).status_code == 200
+    # rendered from the replica, which does not have the venue yet
+    assert b'The Musical Hop' not in other.get('/venues').data
+    assert b'The Musical Hop' in writer.get('/venues').data
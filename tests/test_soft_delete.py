@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from exporter import export_statement
+from models import db, Venue, Artist, Show
+
+
+@pytest.fixture
+def shows(app):
+    """Two venues and one artist with a show at each venue, the second
+    venue deleted but not purged yet."""
+    with app.app_context():
+        artist = Artist(name='Guns N Petals', city='San Francisco',
+                        state='CA')
+        kept = Venue(name='The Musical Hop', city='San Francisco',
+                     state='CA', address='1015 Folsom Street')
+        deleted = Venue(name='Park Square', city='San Francisco',
+                        state='CA', address='34 Whiskey Moore Ave')
+        db.session.add_all([artist, kept, deleted])
+        db.session.flush()
+        start = datetime(2035, 4, 1, 20)
+        for venue in (kept, deleted):
+            db.session.add(Show(artist_id=artist.id, venue_id=venue.id,
+                                start_time=start,
+                                end_time=start + timedelta(hours=2)))
+        db.session.commit()
+        deleted.deleted_at = datetime.utcnow()
+        db.session.commit()
+        return kept.id, deleted.id
+
+
+def test_api_hides_the_shows_of_deleted_venues(app, shows):
+    kept, deleted = shows
+    client = app.test_client()
+    for query in ('', '?fields=start_time', '?fields=venue_name'):
+        data = client.get(f'/api/v1/shows{query}').get_json()['data']
+        assert len(data) == 1
+    show_id = client.get('/api/v1/shows?fields=venue_id').get_json()['data']
+    assert show_id[0]['venue_id'] == kept
+    assert client.get('/api/v1/shows/2').status_code == 404
+
+
+def test_exports_leave_out_the_shows_of_deleted_venues(app, shows):
+    kept, deleted = shows
+    with app.app_context():
+        rows = db.session.execute(export_statement('shows')).mappings().all()
+    assert [row['venue_id'] for row in rows] == [kept]
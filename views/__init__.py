@@ -0,0 +1,4 @@
+"""The page controllers, one blueprint per subsystem: venues, artists,
+shows and search.  Each declares its HTTP cache policy (cache.cache_policy)
+and rate limits (ratelimit.rate_limit), the JSON API doing the same in
+api.py."""
@@ -0,0 +1,165 @@
+import sys
+from datetime import datetime
+
+from flask import (Blueprint, render_template, request, abort, flash,
+                   redirect, url_for, jsonify, current_app)
+
+from cache import (cache_policy, cached, invalidate, last_modified, no_store,
+                   tag_response)
+from jobs import enqueue
+from models import db, Artist
+from queries import (artist_list, artist_detail, artists_modified,
+                     artist_modified)
+from ratelimit import rate_limit
+
+
+artists = Blueprint('artists', __name__, url_prefix='/artists')
+
+cache_policy(artists, max_age=60, s_maxage=300, stale_while_revalidate=600)
+rate_limit(artists, 300, per=60)
+rate_limit(artists, 30, per=60, methods=('POST', 'DELETE'))
+
+
+@artists.route('')
+@last_modified(artists_modified)
+@cached('artists')
+def index():
+    genre = request.args.get('genre')
+    return render_template('pages/artists.html',
+                           artists=artist_list(genre=genre), genre=genre)
+
+
+@artists.route('/<int:artist_id>')
+@last_modified(artist_modified)
+@cached('artist:{artist_id}')
+def show_artist(artist_id):
+    data = artist_detail(
+        artist_id,
+        past_page=request.args.get('past_page', 1, type=int),
+        per_page=current_app.config['PAST_SHOWS_PER_PAGE'])
+    if not data:
+        abort(404)
+    tag_response(*(f"venue:{show['venue_id']}"
+                   for show in data['upcoming_shows'] + data['past_shows']))
+    return render_template('pages/show_artist.html', artist=data)
+
+
+@artists.route('/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    artist = Artist.active().filter_by(id=artist_id).first()
+    if artist is None:
+        abort(404)
+    error = False
+    try:
+        # soft deleted: the shows are purged in the background
+        artist.deleted_at = datetime.utcnow()
+        db.session.commit()
+    except Exception:
+        error = True
+        db.session.rollback()
+    finally:
+        db.session.close()
+    if error:
+        abort(500)
+    else:
+        enqueue('artist.deleted', key=f'artist.deleted:{artist_id}',
+                artist_id=artist_id)
+        invalidate('artists', f'artist:{artist_id}', 'venues', 'shows')
+        return jsonify({'success': True})
+
+#  Update
+#  ----------------------------------------------------------------
+
+
+@artists.route('/<int:artist_id>/edit', methods=['GET'])
+@no_store
+def edit_artist(artist_id):
+    from forms import ArtistForm
+
+    artist = Artist.active().filter_by(id=artist_id).first()
+    if not artist:
+        abort(404)
+    form = ArtistForm(obj=artist)
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+
+@artists.route('/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    from forms import ArtistForm
+
+    artist = Artist.active().filter_by(id=artist_id).first()
+    if not artist:
+        abort(404)
+    form = ArtistForm(request.form)
+    error = False
+    if form.validate():
+        try:
+            form.populate_obj(artist)
+            db.session.commit()
+        except Exception as e:
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+        finally:
+            db.session.close()
+        if not error:
+            invalidate('artists', f'artist:{artist_id}', 'shows')
+            enqueue('artist.updated', artist_id=artist_id)
+            flash('Artist ' + request.form['name'] + ' was successfully updated!')
+            return redirect(url_for('artists.show_artist', artist_id=artist_id))
+        else:
+            flash(f'An error occurred. Artist {form.name.data} could not be updated.')
+    else:
+        flash('An error occurred. Form is not  valid', 'error')
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+
+@artists.route('/create', methods=['GET'])
+@no_store
+def create_artist_form():
+    from forms import ArtistForm
+
+    form = ArtistForm()
+    return render_template('forms/new_artist.html', form=form)
+
+
+@artists.route('/create', methods=['POST'])
+def create_artist_submission():
+    from forms import ArtistForm
+
+    form = ArtistForm(request.form)
+    error = False
+    if form.validate():
+        try:
+            artist = Artist(
+                name=form.name.data, phone=form.phone.data, state=form.state.data,
+                website_link=form.website_link.data, facebook_link=form.facebook_link.data,
+                seeking_venue=form.seeking_venue.data, image_link=form.image_link.data,
+                seeking_description=form.seeking_description.data, city=form.city.data,
+            )
+            form.genres.populate_obj(artist, 'genres')
+            db.session.add(artist)
+            db.session.flush()
+            artist_id = artist.id
+            db.session.commit()
+        except Exception as e:
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+        finally:
+            db.session.close()
+        if not error:
+            invalidate('artists')
+            enqueue('artist.created', key=f'artist.created:{artist_id}',
+                    artist_id=artist_id)
+            flash('Artist ' + request.form['name'] + ' was successfully listed!')
+            return render_template('pages/home.html')
+        else:
+            flash(f'An error occurred. Venue {form.name.data} could not be listed.')
+    else:
+        message = [f'{field} ' + '|'.join(err) for field, err in form.errors.items()]
+        flash(f'Errors {message}')
+    return render_template('forms/new_artist.html', form=form)
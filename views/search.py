@@ -0,0 +1,43 @@
+from flask import Blueprint, render_template, request, current_app
+
+from cache import cache_policy
+from models import Venue, Artist
+from queries import search_results
+from ratelimit import rate_limit
+from routing import reads_from_replica
+from search import search as search_ids
+
+
+search = Blueprint('search', __name__)
+
+# Searches are posted forms, never stored; each costs a full text query,
+# hence the lower limit.
+cache_policy(search)
+rate_limit(search, 60, per=60)
+
+
+def _results(model, template):
+    search_term = request.form.get('search_term', '')
+    offset = max(0, request.form.get('offset', 0, type=int))
+    limit = current_app.config['SEARCH_RESULTS_PER_PAGE']
+    count, ids = search_ids(model, search_term, limit=limit, offset=offset)
+    response = {
+        "count": count,
+        "data": search_results(model, ids),
+        "offset": offset,
+        "next_offset": offset + limit if offset + limit < count else None,
+    }
+    return render_template(template, results=response,
+                           search_term=search_term)
+
+
+@search.route('/venues/search', methods=['POST'])
+@reads_from_replica
+def search_venues():
+    return _results(Venue, 'pages/search_venues.html')
+
+
+@search.route('/artists/search', methods=['POST'])
+@reads_from_replica
+def search_artists():
+    return _results(Artist, 'pages/search_artists.html')
@@ -0,0 +1,127 @@
+import sys
+from datetime import date, datetime, time, timedelta
+
+from flask import (Blueprint, render_template, request, abort, flash,
+                   url_for, current_app)
+from sqlalchemy.exc import IntegrityError
+
+from cache import cache_policy, cached, invalidate, last_modified, no_store
+from models import db, Venue, Artist, Show
+from queries import show_feed, booking_conflicts, shows_modified
+from ratelimit import rate_limit
+
+
+shows = Blueprint('shows', __name__, url_prefix='/shows')
+
+# Upcoming shows move to the past as time goes by: a shorter lifetime
+# than the venue and artist pages.
+cache_policy(shows, max_age=30, s_maxage=120, stale_while_revalidate=300)
+rate_limit(shows, 300, per=60)
+rate_limit(shows, 30, per=60, methods=('POST',))
+
+
+@shows.route('')
+@last_modified(shows_modified)
+@cached('shows')
+def index():
+    filters = {
+        'upcoming': request.args.get('upcoming', type=int),
+        'from': request.args.get('from', type=date.fromisoformat),
+        'to': request.args.get('to', type=date.fromisoformat),
+    }
+    try:
+        data, next_cursor = show_feed(
+            cursor=request.args.get('cursor'),
+            limit=current_app.config['SHOWS_PER_PAGE'],
+            upcoming_only=bool(filters['upcoming']),
+            start=filters['from'] and datetime.combine(
+                filters['from'], time.min),
+            end=filters['to'] and datetime.combine(
+                filters['to'] + timedelta(days=1), time.min),
+        )
+    except ValueError:
+        abort(400)
+
+    next_url = None
+    if next_cursor:
+        next_url = url_for(
+            'shows.index', cursor=next_cursor,
+            **{key: value for key, value in filters.items() if value})
+    return render_template('pages/shows.html', shows=data,
+                           filters=filters, next_url=next_url)
+
+
+@shows.route('/create')
+@no_store
+def create_shows():
+    from forms import ShowForm
+
+    # renders form. do not touch.
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+
+# SQLSTATE of a violated Postgres exclusion constraint.
+EXCLUSION_VIOLATION = '23P01'
+
+
+@shows.route('/create', methods=['POST'])
+def create_show_submission():
+    from forms import ShowForm
+
+    form = ShowForm(request.form)
+    error = False
+
+    if form.validate():
+        for model, owner_id in ((Venue, form.venue_id.data),
+                                (Artist, form.artist_id.data)):
+            if not str(owner_id).isdigit() \
+                    or not model.active().filter_by(id=int(owner_id)).count():
+                flash(f'The {model.__tablename__} {owner_id} does not '
+                      f'exist.', 'error')
+                return render_template('forms/new_show.html', form=form)
+        conflicts = booking_conflicts(form.venue_id.data, form.artist_id.data,
+                                      form.start_time.data, form.end_time)
+        for conflict in conflicts:
+            flash(f"The {conflict['conflict']} is already booked from "
+                  f"{conflict['start_time']:%Y-%m-%d %H:%M} to "
+                  f"{conflict['end_time']:%Y-%m-%d %H:%M} "
+                  f"(show {conflict['id']}).", 'error')
+        if conflicts:
+            return render_template('forms/new_show.html', form=form)
+        try:
+            show = Show(
+              start_time=form.start_time.data,
+              end_time=form.end_time,
+              artist_id=form.artist_id.data,
+              venue_id=form.venue_id.data,
+            )
+            db.session.add(show)
+            db.session.commit()
+        except IntegrityError as e:
+            # a concurrent booking won the race to the exclusion constraint
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+            if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+                flash('The show conflicts with another booking.', 'error')
+                return render_template('forms/new_show.html', form=form)
+        except Exception as e:
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+        finally:
+            db.session.close()
+        if not error:
+            invalidate('shows', 'venues', f'venue:{form.venue_id.data}',
+                       f'artist:{form.artist_id.data}')
+            flash('Show was successfully listed!')
+
+            return render_template('pages/home.html')
+
+        else:
+            flash('An error occurred. Show could not be listed.')
+    else:
+        flash('An error occurred. Form is not  valid', 'error')
+
+    return render_template('forms/new_show.html', form=form)
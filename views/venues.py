@@ -0,0 +1,168 @@
+import sys
+from datetime import datetime
+
+from flask import (Blueprint, render_template, request, abort, flash,
+                   redirect, url_for, jsonify, current_app)
+
+from cache import (cache_policy, cached, invalidate, last_modified, no_store,
+                   tag_response)
+from jobs import enqueue
+from models import db, Venue
+from queries import (venue_areas, venue_detail, venues_modified,
+                     venue_modified)
+from ratelimit import rate_limit
+
+
+venues = Blueprint('venues', __name__, url_prefix='/venues')
+
+# Listings and pages change when venues or their shows do, which
+# invalidates the server side cache at once: CDNs may lag a few minutes.
+cache_policy(venues, max_age=60, s_maxage=300, stale_while_revalidate=600)
+rate_limit(venues, 300, per=60)
+rate_limit(venues, 30, per=60, methods=('POST', 'DELETE'))
+
+
+@venues.route('')
+@last_modified(venues_modified)
+@cached('venues')
+def index():
+    genre = request.args.get('genre')
+    return render_template('pages/venues.html',
+                           areas=venue_areas(genre=genre), genre=genre)
+
+
+@venues.route('/<int:venue_id>')
+@last_modified(venue_modified)
+@cached('venue:{venue_id}')
+def show_venue(venue_id):
+    data = venue_detail(
+        venue_id,
+        past_page=request.args.get('past_page', 1, type=int),
+        per_page=current_app.config['PAST_SHOWS_PER_PAGE'])
+    if not data:
+        abort(404)
+    tag_response(*(f"artist:{show['artist_id']}"
+                   for show in data['upcoming_shows'] + data['past_shows']))
+    return render_template('pages/show_venue.html', venue=data)
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+
+@venues.route('/create', methods=['GET'])
+@no_store
+def create_venue_form():
+    from forms import VenueForm
+
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+
+@venues.route('/create', methods=['POST'])
+def create_venue_submission():
+    from forms import VenueForm
+
+    form = VenueForm(request.form)
+    error = False
+    if form.validate():
+        try:
+            venue = Venue(
+              address=form.address.data, phone=form.phone.data, state=form.state.data,
+              website_link=form.website_link.data, facebook_link=form.facebook_link.data,
+              seeking_talent=form.seeking_talent.data, image_link=form.image_link.data,
+              seeking_description=form.seeking_description.data, city=form.city.data,
+              name=form.name.data,
+            )
+            form.genres.populate_obj(venue, 'genres')
+            db.session.add(venue)
+            db.session.flush()
+            venue_id = venue.id
+            db.session.commit()
+        except Exception as e:
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+        finally:
+            db.session.close()
+        if not error:
+            invalidate('venues')
+            enqueue('venue.created', key=f'venue.created:{venue_id}',
+                    venue_id=venue_id)
+            flash('Venue ' + request.form['name'] + ' was successfully listed!')
+            return render_template('pages/home.html')
+        else:
+            flash(f'An error occurred. Venue {form.name.data} could not be listed.')
+    else:
+        message = [f'{field} ' + '|'.join(err) for field, err in form.errors.items()]
+        flash(f'Errors {message}')
+    return render_template('forms/new_venue.html', form=form)
+
+
+@venues.route('/<int:venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+    venue = Venue.active().filter_by(id=venue_id).first()
+    if venue is None:
+        abort(404)
+    error = False
+    try:
+        # soft deleted: the shows are purged in the background
+        venue.deleted_at = datetime.utcnow()
+        db.session.commit()
+    except Exception:
+        error = True
+        db.session.rollback()
+    finally:
+        db.session.close()
+    if error:
+        abort(500)
+    else:
+        enqueue('venue.deleted', key=f'venue.deleted:{venue_id}',
+                venue_id=venue_id)
+        invalidate('venues', f'venue:{venue_id}', 'shows')
+        return jsonify({'success': True})
+
+#  Update
+#  ----------------------------------------------------------------
+
+
+@venues.route('/<int:venue_id>/edit', methods=['GET'])
+@no_store
+def edit_venue(venue_id):
+    from forms import VenueForm
+
+    venue = Venue.active().filter_by(id=venue_id).first()
+    if not venue:
+        abort(404)
+    form = VenueForm(obj=venue)
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+
+@venues.route('/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    from forms import VenueForm
+
+    venue = Venue.active().filter_by(id=venue_id).first()
+    if not venue:
+        abort(404)
+    form = VenueForm(request.form)
+    error = False
+    if form.validate():
+        try:
+            form.populate_obj(venue)
+            db.session.commit()
+        except Exception as e:
+            error = True
+            db.session.rollback()
+            print(sys.exc_info())
+        finally:
+            db.session.close()
+        if not error:
+            invalidate('venues', f'venue:{venue_id}', 'shows')
+            enqueue('venue.updated', venue_id=venue_id)
+            flash('venue ' + request.form['name'] + ' was successfully updated!')
+            return redirect(url_for('venues.show_venue', venue_id=venue_id))
+        else:
+            flash(f'An error occurred. Venue {form.name.data} could not be updated.')
+    else:
+        flash('An error occurred. Form is not  valid', 'error')
+    return render_template('forms/edit_venue.html', form=form, venue=venue)